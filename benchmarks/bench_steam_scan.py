@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: Christian Moser
+# License: GPL
+# File: benchmarks/bench_steam_scan.py
+#
+# Benchmark of scanning a synthetic Steam library with sgbackup.steam.Steam.
+# Half of the apps are registered as games and every tenth app is ignored.
+# The scan runs against a stand-in application, so no configuration, gameconf
+# or cache files of the user are touched.
+#
+# Usage: python benchmarks/bench_steam_scan.py [N_APPS]
+
+import os
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sgbackup.steam import Steam,SteamLib
+
+MANIFEST_TEMPLATE = """"AppState"
+{{
+\t"appid"\t\t"{appid}"
+\t"Universe"\t\t"1"
+\t"name"\t\t"Generated Game {appid}"
+\t"StateFlags"\t\t"4"
+\t"installdir"\t\t"Generated Game {appid}"
+\t"SizeOnDisk"\t\t"{size}"
+\t"buildid"\t\t"{buildid}"
+\t"UserConfig"
+\t{{
+\t\t"language"\t\t"english"
+\t}}
+}}
+"""
+
+class BenchConfig(object):
+    def __init__(self,directory):
+        self.user_data_dir = os.path.join(directory,'data')
+        self.user_config_dir = os.path.join(directory,'config')
+        self.process_max = os.cpu_count() or 1
+        os.makedirs(self.user_config_dir)
+
+    def has_option(self,section,key):
+        return False
+
+    def get_boolean(self,section,key,default=None):
+        return False
+
+    def get_string(self,section,key,default=None):
+        return default
+
+    def connect(self,signal,callback):
+        return 0
+
+class BenchGames(object):
+    def __init__(self,appids):
+        self.__steam_index = dict((appid,"game{}".format(appid)) for appid in appids)
+
+    @property
+    def steam_index(self):
+        return types.MappingProxyType(self.__steam_index)
+
+    @property
+    def steam_ids(self):
+        return self.__steam_index.keys()
+
+    def get(self,game_id):
+        return game_id
+
+def generate_library(directory,appids):
+    steamapps = os.path.join(directory,'steamapps')
+    os.makedirs(steamapps)
+    for appid in appids:
+        with open(os.path.join(steamapps,"appmanifest_{}.acf".format(appid)),'w',encoding='utf-8') as ofile:
+            ofile.write(MANIFEST_TEMPLATE.format(appid=appid,size=appid * 1024,buildid=appid % 9973))
+
+def new_steam(directory,library,appids):
+    app = types.SimpleNamespace(config=BenchConfig(directory),
+                                games=BenchGames(appids[::2]))
+    steam = Steam()
+    app.steam = steam
+    steam._real_initialize(app)
+    for appid in appids[::10]:
+        steam.appid_ignore.add(appid)
+    steam.add_library(SteamLib(app,library))
+    return steam
+
+def bench(name,func):
+    t0 = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - t0
+    print("{name:<28} {elapsed:10.2f} ms".format(name=name,elapsed=elapsed * 1000))
+    return result
+
+def main(argv):
+    n_apps = int(argv[1]) if len(argv) > 1 else 10000
+    appids = [10 + i * 10 for i in range(n_apps)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        library = os.path.join(directory,'library')
+        generate_library(library,appids)
+
+        print("{} apps, {} registered, {} ignored".format(n_apps,len(appids[::2]),len(appids[::10])))
+        steam = new_steam(os.path.join(directory,'run1'),library,appids)
+        apps = bench('scan (cold cache)',steam.scan_apps)
+        bench('scan (warm cache)',steam.scan_apps)
+
+        steam = new_steam(os.path.join(directory,'run2'),library,appids)
+        os.makedirs(os.path.dirname(steam.acf_cache.filename),exist_ok=True)
+        os.replace(os.path.join(directory,'run1','data','steam-acf-cache.json'),steam.acf_cache.filename)
+        bench('scan (cache from disk)',steam.scan_apps)
+
+        unregistered = bench('Steam.unregistered_apps',lambda: steam.unregistered_apps)
+        bench('Steam.apps',lambda: steam.apps)
+
+        steam_ids = list(steam.application.games.steam_ids)
+        ignore_appids = sorted(steam.ignore_appids)
+        legacy = bench('filter (list membership)',
+                       lambda: [i for i in apps if i not in steam_ids and i not in ignore_appids])
+        indexed = bench('filter (indexed views)',
+                        lambda: [i for i in apps if i not in steam.application.games.steam_ids
+                                 and i not in steam.ignore_appids])
+        if legacy != indexed or legacy != list(unregistered.keys()):
+            print("Filter results differ!",file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: Christian Moser
+# License: GPL
+# File: benchmarks/bench_vdf.py
+#
+# Micro-benchmark of the single pass VDF tokenizer (sgbackup.vdf) against the
+# line based appmanifest parser it replaced.
+#
+# Usage: python benchmarks/bench_vdf.py [N_MANIFESTS] [N_ROUNDS]
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sgbackup import vdf
+
+MANIFEST_TEMPLATE = """"AppState"
+{{
+\t"appid"\t\t"{appid}"
+\t"Universe"\t\t"1"
+\t"name"\t\t"Generated Game {appid}"
+\t"StateFlags"\t\t"4"
+\t"installdir"\t\t"Generated Game {appid}"
+\t"LastUpdated"\t\t"1700000000"
+\t"SizeOnDisk"\t\t"{size}"
+\t"StagingSize"\t\t"0"
+\t"buildid"\t\t"{buildid}"
+\t"LastOwner"\t\t"76561197960287930"
+\t"UpdateResult"\t\t"0"
+\t"BytesToDownload"\t\t"0"
+\t"BytesDownloaded"\t\t"0"
+\t"AutoUpdateBehavior"\t\t"0"
+\t"AllowOtherDownloadsWhileRunning"\t\t"0"
+\t"ScheduledAutoUpdate"\t\t"0"
+\t"InstalledDepots"
+\t{{
+{depots}\t}}
+\t"UserConfig"
+\t{{
+\t\t"language"\t\t"english"
+\t}}
+\t"MountedConfig"
+\t{{
+\t\t"language"\t\t"english"
+\t}}
+}}
+"""
+
+DEPOT_TEMPLATE = """\t\t"{depot}"
+\t\t{{
+\t\t\t"manifest"\t\t"{manifest}"
+\t\t\t"size"\t\t"{size}"
+\t\t}}
+"""
+
+def legacy_parse_acf(filename):
+    # The line based parser of sgbackup.steam.steam_parse_acf before it was
+    # replaced by sgbackup.vdf.
+    if not os.path.isfile(filename) or not filename.endswith('.acf'):
+        return None
+
+    acf = {}
+    acf['LibraryPath'] = os.path.dirname(os.path.dirname(filename))
+
+    with open(filename,'r') as ifile:
+        line = ""
+        while not line:
+            line = str(ifile.readline()).strip()
+
+        if not line.startswith("\"AppState\""):
+            return None
+        if '{' not in line:
+            while '{' not in line:
+                line = ifile.readline().strip()
+                if line and not '{' in line:
+                    return None
+
+        sections=[acf]
+
+        last_key = "AppState"
+
+        for line in (str(i).strip() for i in ifile.readlines()):
+            if not line:
+                continue
+
+            if line == "{":
+                sections[-1][last_key] = {}
+                sections.append(sections[-1][last_key])
+            elif line == "}":
+                del sections[-1]
+                if len(sections) == 0:
+                    break
+            else:
+                parse = line.split("\"")
+                if len(parse) == 3:
+                    last_key = parse[1]
+                    if '{' in line:
+                        sections[-1][last_key] = {}
+                        sections.append(sections[-1][last_key])
+                elif len(parse) == 5:
+                    key = parse[1]
+                    value = parse[3]
+                    sections[-1][key] = value
+
+    return acf
+
+def vdf_parse_acf(filename):
+    appstate = vdf.load_file(filename).get('AppState')
+    if not isinstance(appstate,dict):
+        return None
+    acf = {}
+    acf['LibraryPath'] = os.path.dirname(os.path.dirname(filename))
+    acf.update(appstate)
+    return acf
+
+def generate_corpus(directory,n_manifests):
+    steamapps = os.path.join(directory,'steamapps')
+    os.makedirs(steamapps)
+    filenames = []
+    for i in range(n_manifests):
+        appid = 10000 + i * 10
+        depots = "".join(DEPOT_TEMPLATE.format(depot=appid + d,
+                                               manifest=(appid * 7919 + d) % (10 ** 18),
+                                               size=(appid * 131 + d) % (10 ** 10))
+                         for d in range(1,1 + (i % 4) + 1))
+        filename = os.path.join(steamapps,"appmanifest_{}.acf".format(appid))
+        with open(filename,'w',encoding='utf-8') as ofile:
+            ofile.write(MANIFEST_TEMPLATE.format(appid=appid,
+                                                 size=appid * 1024,
+                                                 buildid=appid % 9973,
+                                                 depots=depots))
+        filenames.append(filename)
+    return filenames
+
+def bench(name,parse,filenames,n_rounds):
+    best = None
+    for _ in range(n_rounds):
+        t0 = time.perf_counter()
+        for filename in filenames:
+            parse(filename)
+        elapsed = time.perf_counter() - t0
+        if best is None or elapsed < best:
+            best = elapsed
+    print("{name:<8} {total:8.2f} ms  {per:8.2f} us/manifest".format(
+        name=name,
+        total=best * 1000,
+        per=best * 1000000 / len(filenames)))
+    return best
+
+def main(argv):
+    n_manifests = int(argv[1]) if len(argv) > 1 else 2000
+    n_rounds = int(argv[2]) if len(argv) > 2 else 5
+
+    with tempfile.TemporaryDirectory() as directory:
+        filenames = generate_corpus(directory,n_manifests)
+
+        for filename in filenames:
+            if legacy_parse_acf(filename) != vdf_parse_acf(filename):
+                print("Parsers disagree on {}!".format(filename),file=sys.stderr)
+                return 1
+
+        print("{} manifests, best of {} rounds".format(n_manifests,n_rounds))
+        legacy = bench('legacy',legacy_parse_acf,filenames,n_rounds)
+        tokenizer = bench('vdf',vdf_parse_acf,filenames,n_rounds)
+        print("speedup  {:8.2f}x".format(legacy / tokenizer))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
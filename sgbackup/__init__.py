@@ -39,7 +39,10 @@ def main():
     and exits afterwards.
     """
     app = Application()
-    return app.run(sys.argv[1:])
+    try:
+        return app.run(sys.argv[1:])
+    finally:
+        app.destroy()
 
 sgbackup_main = main
 
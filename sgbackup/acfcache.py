@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# Author: Christian Moser
+# License: GPL
+# File: sgbackup/acfcache.py
+# Module: sgbackup.acfcache
+
+import glob
+import json
+import os
+import sys
+import threading
+
+CACHE_VERSION = 3
+
+class AcfCache(object):
+    """
+    A persistent cache of parsed Steam appmanifest and VDF files.
+
+    For every file the cache stores the modification time and size of the
+    file together with the parsed content. A file is only parsed again if its
+    modification time or size changed. Files that could not be parsed are not
+    cached.
+
+    The cache is used by :class:`sgbackup.steam.SteamLib`. You should not need
+    to use it yourself.
+
+    :param filename: The file the cache is stored in.
+    :type filename: `str`
+    """
+    def __init__(self,filename):
+        self.__filename = filename
+        self.__entries = None
+        self.__is_changed = False
+        self.__lock = threading.Lock()
+
+    @property
+    def filename(self):
+        """
+        The file the cache is stored in.
+
+        :type: `str`
+        """
+        return self.__filename
+
+    def __load(self):
+        if self.__entries is not None:
+            return
+        self.__entries = {}
+        if not os.path.isfile(self.filename):
+            return
+        try:
+            with open(self.filename,'r',encoding='utf-8') as ifile:
+                data = json.load(ifile)
+        except (OSError,ValueError):
+            return
+        if (not isinstance(data,dict)
+                or data.get('version') != CACHE_VERSION
+                or not isinstance(data.get('entries'),dict)):
+            return
+        self.__entries = data['entries']
+
+    def __lookup(self,filename,st):
+        entry = self.__entries.get(filename)
+        if (entry is not None
+                and entry.get('mtime_ns') == st.st_mtime_ns
+                and entry.get('size') == st.st_size):
+            return entry['data']
+        return None
+
+    def __parse(self,filename,parse):
+        try:
+            return parse(filename)
+        except Exception as err:
+            print("Unable to parse \"{filename}\"! ({message})".format(
+                    filename=filename,
+                    message=str(err)),
+                file=sys.stderr)
+        return None
+
+    def __store(self,filename,st,data):
+        if data is None:
+            if filename in self.__entries:
+                del self.__entries[filename]
+                self.__is_changed = True
+            return
+
+        self.__entries[filename] = {
+            'mtime_ns': st.st_mtime_ns,
+            'size': st.st_size,
+            'data': data,
+        }
+        self.__is_changed = True
+
+    def read_file(self,filename,parse):
+        """
+        Get the parsed content of a file. If the file changed, it is parsed
+        with *parse*.
+
+        :param filename: The file to read.
+        :type filename: `str`
+        :param parse: The function to parse the file with.
+        :type parse: `callable(filename)`
+        :returns: The parsed content or `None` if the file does not exist or
+            could not be parsed.
+        """
+        try:
+            st = os.stat(filename)
+        except OSError:
+            st = None
+
+        with self.__lock:
+            self.__load()
+            if st is None:
+                self.__store(filename,None,None)
+                return None
+            data = self.__lookup(filename,st)
+            if data is not None:
+                return data
+
+        data = self.__parse(filename,parse)
+        with self.__lock:
+            self.__store(filename,st,data)
+        return data
+
+    def read_dir(self,directory,parse,executor=None):
+        """
+        Get the parsed appmanifest files of a *steamapps* directory. Changed
+        manifests are parsed with *parse*, cache entries of manifests that do
+        not exist anymore are removed.
+
+        This method may be called from several threads at once.
+
+        :param directory: The *steamapps* directory.
+        :type directory: `str`
+        :param parse: The function to parse a manifest with.
+        :type parse: `callable(filename)`
+        :param executor: If given, changed manifests are parsed in this
+            :class:`concurrent.futures.Executor`.
+        :returns: (`dict`) - A mapping of the manifest filenames to the parsed
+            manifests. Manifests that could not be parsed are omitted.
+        """
+        files = []
+        for filename in glob.glob(os.path.join(directory,"appmanifest_*.acf")):
+            try:
+                files.append((filename,os.stat(filename)))
+            except OSError:
+                continue
+
+        manifests = {}
+        changed = []
+        with self.__lock:
+            self.__load()
+            for filename,st in files:
+                acf = self.__lookup(filename,st)
+                if acf is not None:
+                    manifests[filename] = acf
+                else:
+                    changed.append((filename,st))
+
+            seen = set(filename for filename,st in files)
+            for filename in [i for i in self.__entries.keys()
+                             if os.path.dirname(i) == directory
+                                and os.path.basename(i).startswith('appmanifest_')
+                                and i not in seen]:
+                del self.__entries[filename]
+                self.__is_changed = True
+
+        if executor is not None and len(changed) > 1:
+            parsed = list(executor.map(lambda i: self.__parse(i[0],parse),changed))
+        else:
+            parsed = [self.__parse(filename,parse) for filename,st in changed]
+
+        with self.__lock:
+            for (filename,st),acf in zip(changed,parsed):
+                self.__store(filename,st,acf)
+                if acf is not None:
+                    manifests[filename] = acf
+
+        return manifests
+
+    def save(self):
+        """
+        Write the cache to disk if it was changed.
+        """
+        with self.__lock:
+            if not self.__is_changed:
+                return
+            self.__save()
+
+    def __save(self):
+        try:
+            os.makedirs(os.path.dirname(self.filename),exist_ok=True)
+            tmp_file = self.filename + '.tmp'
+            with open(tmp_file,'w',encoding='utf-8') as ofile:
+                json.dump({
+                    'version': CACHE_VERSION,
+                    'entries': self.__entries
+                },ofile,separators=(',',':'))
+            os.replace(tmp_file,self.filename)
+            self.__is_changed = False
+        except OSError as err:
+            print("Unable to write appmanifest cache \"{filename}\"! ({message})".format(
+                    filename=self.filename,
+                    message=str(err)),
+                file=sys.stderr)
@@ -204,10 +204,12 @@ class Application(GObject.GObject):
         else:
             for c,o in command_list:
                 try:
-                    c.execute(o)
+                    ret = c.execute(o)
                 except Exception as err:
                     print(err,file=sys.stderr)    
                     return 1
+                if ret:
+                    return ret
             
         return 0
 
@@ -16,6 +16,7 @@ from .tarfilearchiver import (
     TarfileGzArchiver
 )
 from .commandarchiver import CommandArchiver
+from .chunkarchiver import ChunkArchiver
 
 
 __all__ = [
@@ -27,5 +28,6 @@ __all__ = [
     'TarfileBzip2Archiver',
     'TarfileXzArchiver',
     'TarfileGzArchiver',
-    'CommandArchiver'
+    'CommandArchiver',
+    'ChunkArchiver'
 ]
@@ -6,7 +6,10 @@
 
 from gi.repository import GObject
 from ..game import Game
+from .. import error
+from ._hashing import HashingWriter
 
+import contextlib
 import os
 
 class ArchiverBase(GObject.GObject):
@@ -149,30 +152,79 @@ class ArchiverBase(GObject.GObject):
 
     def backup(self,game,filename):
         """
-        Create a game backup. This function emits the `backup` signal.
+        Create a game backup. The archive is written by :func:`ArchiverBase.create_backup`
+        and the `backup` signal is emitted when the archive was created successfully.
+
+        If creating the archive fails, a partially written backup file is removed and
+        the `backup` signal is not emitted.
 
         :param game: The game to create the backup for.
         :type game: :class:`sgbackup.game.Game`
         :param filename: The filename of the backup to create.
         :type filename: `str`
+        :returns: (`bool`) - `True` if the backup was created, `False` if there are
+            no SaveGames to backup.
+        :raises Exception: If creating the backup failed.
         """
         if not os.path.exists(os.path.join(game.savegame_root,game.savegame_dir)):
             if self.application.config.verbose:
                 print("!!! No savegames for \"{game}\"! SKIPPING!".format(game=game.game_name))
-            return
+            return False
+
+        os.makedirs(os.path.dirname(filename),exist_ok=True)
+
+        try:
+            self.create_backup(game,filename)
+            if not os.path.isfile(filename):
+                raise error.BackupError("No backup file was created!")
+        except:
+            if os.path.isfile(filename):
+                os.unlink(filename)
+            raise
 
-        if not os.path.exists(os.path.dirname(filename)):
-            os.makedirs(os.path.dirname(filename))
-            
         self.emit('backup',game,filename)
+        return True
 
-    def do_backup(self,game,filename):
+    @contextlib.contextmanager
+    def open_backup_file(self,filename):
+        """
+        Open a backup file for writing. Archivers should write their archives through
+        this context manager.
+
+        If digest algorithms are registered with the archiver manager
+        (see :func:`sgbackup.archiver._archivermanager.ArchiverManager.add_digest_algorithm`),
+        a non-seekable :class:`sgbackup.archiver._hashing.HashingWriter` is returned and the
+        digests are stored with the manager when the file is closed. Otherwise the plain
+        file object is returned.
+
+        :param filename: The filename of the backup to create.
+        :type filename: `str`
+        """
+        archivers = self.application.archivers
+        algorithms = archivers.digest_algorithms
+        with open(filename,'wb') as ofile:
+            if not algorithms:
+                yield ofile
+                return
+            writer = HashingWriter(ofile,algorithms)
+            yield writer
+        archivers.set_backup_digests(filename,writer.hexdigests())
+
+    def create_backup(self,game,filename):
         """
         Create a savegame backup. If not overloaded this class raises a `NotImplementedError`!
+        Errors should be raised, so :func:`ArchiverBase.backup` can report them.
 
         **This method should be overloaded by the archiver class.**
         """
-        raise NotImplementedError("Backup for archiver \"{}\" is not implemented!")
+        raise NotImplementedError("Backup for archiver \"{}\" is not implemented!".format(self.id))
+
+    def do_backup(self,game,filename):
+        """
+        `backup` signal callback. This signal is emitted after the backup was
+        created successfully.
+        """
+        pass
     
     def restore(self,game,filename):
         """
@@ -7,11 +7,14 @@
 from gi.repository import GObject
 from ..game import Game
 from ._archiver import ArchiverBase
-import fnmatch
+from ._fingerprint import FingerprintStore
+from ._catalog import BackupCatalog,STATE_ACTIVE,STATE_FINISHED
+from ._retention import RetentionPolicy
 import os
 import sys
 
 import datetime
+import hashlib
 #import sgbackup
 from .zipfilearchiver import ZipfileArchiver
 from .tarfilearchiver import (
@@ -20,7 +23,10 @@ from .tarfilearchiver import (
     TarfileGzArchiver,
     TarfileXzArchiver
 )
+from .chunkarchiver import ChunkArchiver
 from . import commandarchiver
+from concurrent.futures import ThreadPoolExecutor
+import threading
 
 class ArchiverManager(GObject.GObject):
     """
@@ -31,6 +37,7 @@ class ArchiverManager(GObject.GObject):
     * *add-archiver*
     * *backup*
     * *backup-file*
+    * *backups-deleted*
     * *delete-backup*
     * *destroy*
     * *remove-archiver*
@@ -45,15 +52,24 @@ class ArchiverManager(GObject.GObject):
         'remove-archiver': (GObject.SIGNAL_RUN_FIRST,None,(ArchiverBase,)),
         'destroy': (GObject.SIGNAL_RUN_LAST,None,()),
         'delete-backup': (GObject.SIGNAL_RUN_FIRST,None,(Game,str)),
+        'backups-deleted': (GObject.SIGNAL_RUN_FIRST,None,(Game,)),
     }
 
     def __init__(self):
         GObject.GObject.__init__(self)
         self.__app = None
         self.__archivers = {}
+        self.__signal_lock = threading.RLock()
+        self.__fingerprints = FingerprintStore()
+        self.__catalog = BackupCatalog()
+        self.__digest_algorithms = []
+        self.__digests = {}
+        self.__digests_lock = threading.Lock()
 
     def _real_initialize(self,app):
         self.__app = app
+        self.__fingerprints._real_initialize(app)
+        self.__catalog._real_initialize(app)
 
         app.config.connect('load-config',self.on_load_config)
         archivers = [
@@ -62,6 +78,7 @@ class ArchiverManager(GObject.GObject):
             TarfileBz2Archiver(app),
             TarfileXzArchiver(app),
             TarfileGzArchiver(app),
+            ChunkArchiver(app),
         ]
         
         cmd_archivers = commandarchiver.get_archivers(self.application)
@@ -94,6 +111,28 @@ class ArchiverManager(GObject.GObject):
         """
         return (self.__app is not None)
 
+    @GObject.Property
+    def fingerprints(self):
+        """
+        *(read only)*
+
+        The store of SaveGame fingerprints used to skip backups of unchanged games.
+
+        :type: :class:`sgbackup.archiver._fingerprint.FingerprintStore`
+        """
+        return self.__fingerprints
+
+    @GObject.Property
+    def catalog(self):
+        """
+        *(read only)*
+
+        The backup catalog used for looking up the backups of games.
+
+        :type: :class:`sgbackup.archiver._catalog.BackupCatalog`
+        """
+        return self.__catalog
+
     @GObject.Property
     def standard_archiver(self):
         """
@@ -324,14 +363,21 @@ class ArchiverManager(GObject.GObject):
                     return a
         return None
         
-    def backup(self,game,archiver=None):
+    def backup(self,game,archiver=None,force=False):
         """
         Backup a game.
 
+        If the *sgbackup.skipUnchanged* configuration option is set and the SaveGames
+        did not change since the last backup, no backup is created.
+
         :param game: The game to backup.
         :type game: :class:`sgbackup.game.Game`
         :param archiver: The archiver to use. If `archiver` is `None` the standard archiver is used.
         :type archiver: :class:`sgbackup.archiver._archiver.ArchiverBase` or `None`
+        :param force: Create a backup even if the SaveGames did not change.
+        :type force: `bool`
+        :returns: (`bool`) - `True` if a backup was created, `False` if it was skipped.
+        :raises Exception: If creating the backup failed.
         """
         if archiver is None:
             archiver = self.standard_archiver
@@ -339,43 +385,178 @@ class ArchiverManager(GObject.GObject):
             archiver = self.get_archiver(archiver)
         elif not isinstance(archiver,ArchiverBase):
             raise TypeError("\"archiver\" has to be \"None\", an Archiver-ID or an \"ArchiverBase\" instance!")
+
+        fingerprint = None
+        if self.application.config.skip_unchanged:
+            fingerprint = self.fingerprints.compute(game,archiver)
+            unchanged_backup = self.fingerprints.get_unchanged_backup(game,fingerprint)
+            if unchanged_backup and not force:
+                print("[{game_id}] SaveGames unchanged since backup \"{backup}\"! SKIPPING!".format(
+                    game_id=game.game_id,backup=os.path.basename(unchanged_backup)))
+                return False
         
         backup_name = self.create_backup_name(game,archiver)
-        if not os.path.isdir(os.path.dirname(backup_name)):
-            os.makedirs(os.path.dirname(backup_name))
-        archiver.backup(game,backup_name)
+        os.makedirs(os.path.dirname(backup_name),exist_ok=True)
+        if not archiver.backup(game,backup_name):
+            return False
+
+        if fingerprint is not None:
+            self.fingerprints.set(game,fingerprint,backup_name)
+        return True
+
+    def backup_games(self,games,archiver=None,jobs=None,force=False):
+        """
+        Backup a list of games. The archives are created concurrently in a
+        thread pool with up to `jobs` workers.
+
+        The *backup*, *backup-file* and *delete-backup* signals are serialized,
+        so backup rotation and plugin callbacks never run concurrently. The
+        fingerprints are saved once after all backups were created.
+
+        :param games: The games to backup.
+        :type games: `list`(:class:`sgbackup.game.Game`)
+        :param archiver: The archiver to use. If `archiver` is `None` the standard archiver is used.
+        :type archiver: :class:`sgbackup.archiver._archiver.ArchiverBase`, `str` or `None`
+        :param jobs: The number of concurrent backups. If `jobs` is `None`,
+            :attr:`sgbackup.config.config.Config.process_max` is used.
+        :type jobs: `int` or `None`
+        :param force: Create backups even if the SaveGames did not change.
+        :type force: `bool`
+        :returns: (`list`(:class:`sgbackup.game.Game`)) - The games for which the backup failed.
+        """
+        def backup_game(game):
+            if self.application.config.verbose:
+                print("Backing up {game_id}: \"{game_name}\"".format(game_id=game.game_id,game_name=game.game_name))
+            try:
+                self.backup(game,archiver,force)
+            except Exception as err:
+                print("Backing up game \"{game}\" failed! ({message})".format(game=game.game_name,message=err),
+                      file=sys.stderr)
+                return False
+            return True
+
+        games = list(games)
+        if jobs is None:
+            jobs = self.application.config.process_max
+        jobs = max(1,min(jobs,len(games)))
+
+        with self.fingerprints.batch():
+            if jobs == 1:
+                return [game for game in games if not backup_game(game)]
+
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(backup_game,games))
+        return [game for game,success in zip(games,results) if not success]
 
     def __on_archiver_backup(self,archiver,game,filename):
         """
             Archivers `backup` signal callback. This method is called by registerd archivers.
             **DO NOT CALL THIS METHOD YOURSELF!**
         """
-        self.emit('backup',archiver,game,filename)
+        try:
+            with self.__signal_lock:
+                self.emit('backup',archiver,game,filename)
+        finally:
+            with self.__digests_lock:
+                self.__digests.pop(filename,None)
+
+    @GObject.Property
+    def digest_algorithms(self):
+        """
+        *(read only)*
+
+        The :mod:`hashlib` algorithms archivers compute while writing a backup.
+
+        :type: `list(str)`
+        """
+        return list(self.__digest_algorithms)
+
+    def add_digest_algorithm(self,name:str):
+        """
+        Let archivers compute a digest while writing backups. The digests can
+        be looked up with :func:`ArchiverManager.get_backup_digests` in *backup*
+        signal handlers.
+
+        :param name: The :mod:`hashlib` algorithm name.
+        :type name: `str`
+        """
+        if name in self.__digest_algorithms:
+            return
+        if name not in hashlib.algorithms_available:
+            raise ValueError("\"{name}\" is not a hashlib algorithm!".format(name=name))
+        self.__digest_algorithms.append(name)
+
+    def remove_digest_algorithm(self,name:str):
+        """
+        Stop computing a digest while writing backups.
+
+        :param name: The :mod:`hashlib` algorithm name.
+        :type name: `str`
+        """
+        if name in self.__digest_algorithms:
+            self.__digest_algorithms.remove(name)
+
+    def set_backup_digests(self,filename:str,digests:dict):
+        """
+        Store the digests computed while writing a backup. This is called by
+        :func:`sgbackup.archiver._archiver.ArchiverBase.open_backup_file`.
+        The digests are dropped after the *backup* signal was emitted.
+
+        :param filename: The filename of the backup.
+        :type filename: `str`
+        :param digests: A mapping of the :mod:`hashlib` algorithm names to hex digests.
+        :type digests: `dict`
+        """
+        with self.__digests_lock:
+            self.__digests[filename] = dict(digests)
+
+    def get_backup_digests(self,filename:str):
+        """
+        Get the digests computed while writing a backup.
+
+        :param filename: The filename of the backup.
+        :type filename: `str`
+        :returns: (`dict`) - A mapping of the :mod:`hashlib` algorithm names to hex
+            digests. The mapping is empty if no digests were computed.
+        """
+        with self.__digests_lock:
+            return dict(self.__digests.get(filename,{}))
 
     def do_backup(self,archiver,game,filename):
         """
         `backup` signal callback. This signal is emitted when an archiver
-        backups a game.
+        created a backup successfully.
+
+        The backup is added to the backup catalog and old backups are rotated.
         """
-        max_backups = self.application.config.backup_versions
-        if max_backups <= 0:
-            return
-        backups=[]
-
-        for fname in sorted(game.active_backups,reverse=True):
-            stat = os.stat(fname)
-            inserted = False
-            for i in range(len(backups)):
-                if stat.st_ctime > backups[i][0]:
-                    backups.insert(i,(stat.st_ctime,fname))
-                    inserted = True
-                    break
-            if not inserted:
-                backups.append((stat.st_ctime,fname))
-        
-        if len(backups) > max_backups:
-            for i in range(max_backups,len(backups)):
-                self.delete_backup(game,backups[i][1])
+        if os.path.isfile(filename):
+            self.catalog.add(game,filename,archiver)
+
+        self.prune_backups(game)
+
+    def prune_backups(self,game,policy=None,dry_run=False):
+        """
+        Delete the active backups of a game which are not selected by a
+        retention policy.
+
+        :param game: The game to prune the backups for.
+        :type game: :class:`sgbackup.game.Game`
+        :param policy: The retention policy to apply. If `None`, the policy
+            is created from the configuration.
+        :type policy: :class:`sgbackup.archiver._retention.RetentionPolicy` or `None`
+        :param dry_run: Only return the backups that would be deleted.
+        :type dry_run: `bool`
+        :returns: (`list(str)`) - The pruned backups.
+        """
+        if policy is None:
+            policy = RetentionPolicy.from_config(self.application.config)
+        if policy.keeps_all:
+            return []
+
+        keep,prune = policy.select(game.savegame_name,self.catalog.get_backups(game,STATE_ACTIVE))
+        if prune and not dry_run:
+            self.delete_backups(game,prune)
+        return prune
 
     def delete_backup(self,game:Game,filename:str):
         """
@@ -387,16 +568,38 @@ class ArchiverManager(GObject.GObject):
             This should be an absolute path.
         :type filename: `str`
         """
-        if not os.path.isabs(filename):
-            filename=os.path.join(game.backup_dir,filename)
+        self.delete_backups(game,[filename])
 
-        if not os.path.isfile(filename):
-            return
-        
-        if self.application.config.is_win32:
-            filename = filename.replace('/','\\')
+    def delete_backups(self,game:Game,filenames):
+        """
+        Delete savegame backups in one batch.
+
+        The *delete-backup* signal is emitted for every backup and the
+        *backups-deleted* signal is emitted once when all backups are deleted.
 
-        self.emit('delete-backup',game,filename)
+        :param game: The game the backups belong to.
+        :type game: :class:`sgbackup.game.Game`
+        :param filenames: The backup files to delete.
+            These should be absolute paths.
+        :type filenames: `list(str)`
+        """
+        deleted = False
+        with self.__signal_lock, self.catalog.batch():
+            for filename in filenames:
+                if not os.path.isabs(filename):
+                    filename=os.path.join(game.backup_dir,filename)
+
+                if not os.path.isfile(filename):
+                    continue
+
+                if self.application.config.is_win32:
+                    filename = filename.replace('/','\\')
+
+                self.emit('delete-backup',game,filename)
+                deleted = True
+
+            if deleted:
+                self.emit('backups-deleted',game)
 
     def do_delete_backup(self,game,filename):
         """
@@ -414,6 +617,17 @@ class ArchiverManager(GObject.GObject):
         if self.application.config.verbose:
             print("[delete backup] {}".format(os.path.basename(filename)))
         os.unlink(filename)
+        self.catalog.remove(filename)
+
+    def do_backups_deleted(self,game):
+        """
+        `backups-deleted` signal callback. This signal is emitted once after
+        :func:`ArchiverManager.delete_backups` deleted its backups.
+
+        :param game: The game the backups belonged to.
+        :type game: :class:`sgbackup.game.Game`
+        """
+        pass
 
     def restore(self,game,backup):
         """
@@ -475,10 +689,13 @@ class ArchiverManager(GObject.GObject):
         except:
             pass
         self.__archivers={}            
+        self.__fingerprints.destroy()
+        self.__catalog.destroy()
 
     def get_game_backups(self,game):
         """
-        Get savegame all backups for given game.
+        Get savegame all backups for given game. The backups are looked up
+        in the backup catalog.
 
         :param game: The game to get the backups for.
         :type game: :class:`sgbackup.game.Game`
@@ -486,27 +703,7 @@ class ArchiverManager(GObject.GObject):
             The backup-string is an absolute path of the backup archive.
             If not backup is found, an empty list is returned.
         """
-        ret = []
-        if not os.path.isdir(game.backup_dir):
-            return ret
-        
-        for i in os.listdir(game.backup_dir,'active'):
-            fname = os.path.join(game.backup_dir,'active',i)
-            if (os.path.isfile(fname) 
-                and self.file_is_archive(fname)
-                and fnmatch.fnmatch(i,'{}.????????-??????.*'.format(game.savegame_name))):
-                if self.application.config.platform_win32:
-                    fname = fname.replace('/','\\')
-                ret.append(fname)
-        for i in os.listdir(game.backup_dir,'finished'):
-            fname = os.path.join(game.backup_dir,'finished',i)
-            if (os.path.isfile(fname) 
-                and self.file_is_archive(fname)
-                and fnmatch.fnmatch(i,"{}.????????-??????.*".format(game.savegame_name))):
-                if self.application.config.platform_win32:
-                    fname = fname.replace("/","\\")
-                ret.append(fname)
-        return ret
+        return self.catalog.get_backups(game)
     
     def get_active_game_backups(self,game):
         """
@@ -518,21 +715,7 @@ class ArchiverManager(GObject.GObject):
             The backup-string is an absolute path of the backup archive.
             If no active backup is found an empty list is returned.
         """
-        ret = []
-
-        backup_dir = os.path.join(game.backup_dir,'active')
-        if not os.path.isdir(backup_dir):
-            return ret
-        
-        for i in os.listdir(backup_dir):
-            fname = os.path.join(backup_dir,i)
-            if (os.path.isfile(fname) 
-                and self.file_is_archive(fname) 
-                and fnmatch.fnmatch(i,"{}.????????-??????.*".format(game.savegame_name))):
-                if self.application.config.platform_win32:
-                    fname = fname.replace('/','\\')
-                ret.append(fname)
-        return ret
+        return self.catalog.get_backups(game,STATE_ACTIVE)
     
     def get_finished_game_backups(self,game):
         """
@@ -544,21 +727,7 @@ class ArchiverManager(GObject.GObject):
             The backup-string is an absolute path of the backup archive.
             If no finished backup is found an empty list is returned.
         """
-        ret = []
-
-        backup_dir = os.path.join(game.backup_dir,'finished')
-        if not os.path.isdir(backup_dir):
-            return ret
-        
-        for i in os.listdir(backup_dir):
-            fname = os.path.join(backup_dir,i)
-            if (os.path.isfile(fname)
-                and self.file_is_archive(fname)
-                and fnmatch.fnmatch(i,"{}.finished.????????-??????.*".format(game.savegame_name))):
-                if self.application.config.platform_win32:
-                    fname = fname.replace('/','\\')
-                ret.append(fname)
-        return ret
+        return self.catalog.get_backups(game,STATE_FINISHED)
     
     def get_latest_finished_game_backup(self,game):
         """
@@ -569,9 +738,7 @@ class ArchiverManager(GObject.GObject):
         :returns: (`str`) - The latest finished backup as an absolute path to the archive file.
             If no finished backup is found `None` is returned.
         """
-        for i in sorted(self.get_finished_game_backups(game),reverse=True):
-            return i
-        return None
+        return self.catalog.get_latest_backup(game,STATE_FINISHED)
     
     def get_latest_active_game_backup(self,game):
         """
@@ -582,9 +749,7 @@ class ArchiverManager(GObject.GObject):
         :returns: (`str`) - The latest active backup as an absolute path to the archive file.
             If no active backup is found `None` is returned.
         """
-        for i in sorted(self.get_active_game_backups(game),reverse=True):
-            return i
-        return None
+        return self.catalog.get_latest_backup(game,STATE_ACTIVE)
         
     def get_latest_game_backup(self,game):
         """
@@ -595,27 +760,7 @@ class ArchiverManager(GObject.GObject):
         :returns: The latest savegame backup made for the given game 
             or `None` if no backup was found.
         """
-        latest_backup=None
-        latest_backup_datetime=None
-        def get_datetime_from_backup(backup):
-            fn = os.path.basename(backup)
-            try:
-                dt_string = fn[len(game.savegame_name)+1:len(game.savegame_name)+16]
-                return datetime.datetime.strptime(dt_string,"%Y%m%d-%h%m%s")
-            except:
-                pass
-            return None
-        
-        for i in self.get_game_backups(game):
-            backup_datetime = get_datetime_from_backup(i)
-            if backup_datetime is None:
-                continue
-
-            if latest_backup_datetime is None or (backup_datetime > latest_backup_datetime):
-                latest_backup = i
-                latest_backup_datetime = backup_datetime
-
-        return latest_backup
+        return self.catalog.get_latest_backup(game)
     
     def on_load_config(self,config,cfgparser):
         pass
@@ -632,7 +777,8 @@ class ArchiverManager(GObject.GObject):
             absolute path.
         :type file: `str`
         """
-        self.emit('backup-file',game,file)
+        with self.__signal_lock:
+            self.emit('backup-file',game,file)
 
     def on_backup_file(self,game,file):
         """
@@ -0,0 +1,360 @@
+# -*- coding:utf-8 -*-
+# author: Christian Moser
+# file: sgbackup/archiver/_catalog.py
+# module: sgbackup.archiver._catalog
+# license: GPL
+
+from gi.repository import GObject
+import contextlib
+import datetime
+import os
+import re
+import sqlite3
+import threading
+
+(
+    STATE_ACTIVE,
+    STATE_FINISHED
+) = ('active','finished')
+
+TIMESTAMP_FORMAT = "%Y%m%d-%H%M%S"
+
+# The part of a backup name following "SAVEGAME_NAME."
+_BACKUP_NAME_RE = re.compile(r'(?:finished\.)?(\d{8}-\d{6})\..*',re.DOTALL)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    filename TEXT PRIMARY KEY,
+    game_id TEXT NOT NULL,
+    archiver TEXT,
+    timestamp TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    state TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS backups_game ON backups (game_id,state,timestamp);
+CREATE TABLE IF NOT EXISTS games (
+    game_id TEXT PRIMARY KEY,
+    backup_dir TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS backup_dirs (
+    directory TEXT PRIMARY KEY,
+    game_id TEXT NOT NULL,
+    mtime INTEGER NOT NULL
+);
+"""
+
+def parse_backup_timestamp(savegame_name,filename):
+    """
+    Get the timestamp of a backup from its filename.
+
+    Backups are named "SAVEGAME_NAME.YYYYmmdd-HHMMSS.EXTENSION". Finished
+    backups may also be named "SAVEGAME_NAME.finished.YYYYmmdd-HHMMSS.EXTENSION".
+
+    :param savegame_name: The savegame name of the game.
+    :type savegame_name: `str`
+    :param filename: The filename of the backup.
+    :type filename: `str`
+    :returns: (`str`) - The timestamp in the format *YYYYmmdd-HHMMSS* or `None` if
+        the filename is not a backup name of the game.
+    """
+    fn = os.path.basename(filename)
+    if not fn.startswith(savegame_name + '.'):
+        return None
+    match = _BACKUP_NAME_RE.fullmatch(fn,len(savegame_name) + 1)
+    if match is None:
+        return None
+
+    timestamp = match.group(1)
+    try:
+        datetime.datetime.strptime(timestamp,TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+    return timestamp
+
+def _get_dir_mtime(directory):
+    try:
+        return os.stat(directory).st_mtime_ns
+    except OSError:
+        return -1
+
+class BackupCatalog(GObject.GObject):
+    """
+    A persistent index of all backups in the backup directory. The catalog is
+    stored in a SQLite database and records the game, archiver, timestamp, size
+    and state of every backup.
+
+    The catalog is kept up to date by the *backup* and *delete-backup* signals of
+    :class:`sgbackup.archiver._archivermanager.ArchiverManager`. Games that are
+    not in the catalog yet are indexed the first time their backups are looked up.
+    The modification times of the backup directories are recorded, so backups
+    that were added or removed by hand are picked up on the next lookup.
+    :func:`BackupCatalog.rebuild` (the *rebuild-index* command) rebuilds the
+    whole catalog.
+
+    You should not create this class yourself, use the instance provided by
+    :attr:`sgbackup.archiver._archivermanager.ArchiverManager.catalog` instead.
+
+    Signals
+    _______
+    * *destroy*
+    """
+    __name__ = "sgbackup.archiver._catalog.BackupCatalog"
+    __gsignals__ = {
+        'destroy': (GObject.SIGNAL_RUN_LAST,None,()),
+    }
+
+    def __init__(self):
+        GObject.GObject.__init__(self)
+        self.__app = None
+        self.__db = None
+        self.__lock = threading.RLock()
+        self.__batch = 0
+
+    def _real_initialize(self,app):
+        self.__app = app
+
+    @GObject.Property
+    def application(self):
+        """
+        *(read only)*
+
+        The application this class is registered with.
+
+        :type: :class:`sgbackup.application.Application`
+        """
+        return self.__app
+
+    @GObject.Property
+    def filename(self):
+        """
+        *(read only)*
+
+        The SQLite database the catalog is stored in.
+
+        :type: `str`
+        """
+        return os.path.join(self.application.config.user_data_dir,'catalog.sqlite')
+
+    @property
+    def _db(self):
+        if self.__db is None:
+            os.makedirs(os.path.dirname(self.filename),exist_ok=True)
+            self.__db = sqlite3.connect(self.filename,check_same_thread=False)
+            self.__db.executescript(_SCHEMA)
+            self.__db.commit()
+        return self.__db
+
+    def __commit(self):
+        if self.__batch == 0:
+            self._db.commit()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        A context manager that commits all changes made inside the *with* block
+        in a single transaction.
+        """
+        with self.__lock:
+            self.__batch += 1
+            try:
+                yield self
+            except:
+                self.__batch -= 1
+                if self.__batch == 0:
+                    self._db.rollback()
+                raise
+            self.__batch -= 1
+            if self.__batch == 0:
+                self._db.commit()
+
+    def add(self,game,filename,archiver=None):
+        """
+        Add a backup to the catalog.
+
+        :param game: The game the backup belongs to.
+        :type game: :class:`sgbackup.game.Game`
+        :param filename: The absolute filename of the backup.
+        :type filename: `str`
+        :param archiver: The archiver that created the backup. If `None`, the archiver
+            is looked up from the filename extension.
+        :type archiver: :class:`sgbackup.archiver._archiver.ArchiverBase` or `None`
+        :returns: `True` if the backup was added, `False` if the file is not a backup
+            of the game.
+        """
+        timestamp = parse_backup_timestamp(game.savegame_name,filename)
+        if timestamp is None:
+            return False
+        try:
+            size = os.stat(filename).st_size
+        except OSError:
+            return False
+
+        if archiver is None:
+            archiver = self.application.archivers.get_archiver_for_file(filename)
+
+        if os.path.basename(os.path.dirname(filename)) == STATE_FINISHED:
+            state = STATE_FINISHED
+        else:
+            state = STATE_ACTIVE
+
+        with self.__lock:
+            self._db.execute("INSERT OR REPLACE INTO backups (filename,game_id,archiver,timestamp,size,state) VALUES (?,?,?,?,?,?)",
+                             (filename,game.game_id,archiver.id if archiver else None,timestamp,size,state))
+            self.__commit()
+        return True
+
+    def remove(self,filename):
+        """
+        Remove a backup from the catalog.
+
+        :param filename: The absolute filename of the backup.
+        :type filename: `str`
+        """
+        with self.__lock:
+            self._db.execute("DELETE FROM backups WHERE filename=?",(filename,))
+            self.__commit()
+
+    def scan_game(self,game):
+        """
+        Scan the backup directory of a game and replace its catalog entries.
+
+        :param game: The game to scan.
+        :type game: :class:`sgbackup.game.Game`
+        :returns: (`int`) - The number of backups found.
+        """
+        archivers = self.application.archivers
+        count = 0
+        with self.batch():
+            self._db.execute("DELETE FROM backups WHERE game_id=?",(game.game_id,))
+            self._db.execute("DELETE FROM backup_dirs WHERE game_id=?",(game.game_id,))
+            for state in (STATE_ACTIVE,STATE_FINISHED):
+                backup_dir = os.path.join(game.backup_dir,state)
+                # the mtime is read before the directory is listed, so changes made
+                # while scanning are detected by the next lookup.
+                self._db.execute("INSERT OR REPLACE INTO backup_dirs (directory,game_id,mtime) VALUES (?,?,?)",
+                                 (backup_dir,game.game_id,_get_dir_mtime(backup_dir)))
+                if not os.path.isdir(backup_dir):
+                    continue
+                for i in os.listdir(backup_dir):
+                    fname = os.path.join(backup_dir,i)
+                    if parse_backup_timestamp(game.savegame_name,i) is None or not os.path.isfile(fname):
+                        continue
+                    if not archivers.file_is_archive(fname):
+                        continue
+                    if self.application.config.platform_win32:
+                        fname = fname.replace('/','\\')
+                    if self.add(game,fname):
+                        count += 1
+            self._db.execute("INSERT OR REPLACE INTO games (game_id,backup_dir) VALUES (?,?)",
+                             (game.game_id,game.backup_dir))
+        return count
+
+    def rebuild(self,games=None):
+        """
+        Rebuild the catalog by scanning the backup directories.
+
+        :param games: The games to rebuild the catalog for. If `None`, the catalog
+            is rebuilt for all games.
+        :type games: `list`(:class:`sgbackup.game.Game`) or `None`
+        :returns: (`int`) - The number of backups found.
+        """
+        count = 0
+        with self.batch():
+            if games is None:
+                games = self.application.games.games
+                self._db.execute("DELETE FROM backups")
+                self._db.execute("DELETE FROM games")
+                self._db.execute("DELETE FROM backup_dirs")
+            for game in games:
+                count += self.scan_game(game)
+        return count
+
+    def __backup_dir_changed(self,game,state,backup_dir):
+        # The directory changed since it was scanned. Our own backups change it
+        # too, so the catalog only needs a rescan if the backup names differ.
+        try:
+            names = os.listdir(backup_dir)
+        except OSError:
+            names = []
+        on_disk = set(i for i in names if parse_backup_timestamp(game.savegame_name,i) is not None)
+        indexed = set(os.path.basename(row[0]) for row in self._db.execute(
+            "SELECT filename FROM backups WHERE game_id=? AND state=?",(game.game_id,state)))
+        return on_disk != indexed
+
+    def __ensure_indexed(self,game):
+        row = self._db.execute("SELECT backup_dir FROM games WHERE game_id=?",(game.game_id,)).fetchone()
+        if row is None or row[0] != game.backup_dir:
+            self.scan_game(game)
+            return
+
+        for state in (STATE_ACTIVE,STATE_FINISHED):
+            backup_dir = os.path.join(game.backup_dir,state)
+            mtime = _get_dir_mtime(backup_dir)
+            row = self._db.execute("SELECT mtime FROM backup_dirs WHERE directory=?",(backup_dir,)).fetchone()
+            if row is not None and row[0] == mtime:
+                continue
+            if row is None or self.__backup_dir_changed(game,state,backup_dir):
+                self.scan_game(game)
+                return
+            self._db.execute("UPDATE backup_dirs SET mtime=? WHERE directory=?",(mtime,backup_dir))
+            self.__commit()
+
+    def get_backups(self,game,state=None):
+        """
+        Get the backups of a game, oldest first.
+
+        If a backup directory of the game changed since it was scanned and the
+        backups in it differ from the catalog, or if a listed backup does not
+        exist anymore, the backup directory of the game is scanned again.
+
+        :param game: The game to look up.
+        :type game: :class:`sgbackup.game.Game`
+        :param state: *"active"*, *"finished"* or `None` for all backups.
+        :type state: `str` or `None`
+        :returns: (`list(str)`) - The absolute filenames of the backups.
+        """
+        query = "SELECT filename FROM backups WHERE game_id=?"
+        args = [game.game_id]
+        if state is not None:
+            query += " AND state=?"
+            args.append(state)
+        query += " ORDER BY timestamp,filename"
+
+        with self.__lock:
+            self.__ensure_indexed(game)
+            backups = [row[0] for row in self._db.execute(query,args)]
+            if not all(os.path.isfile(i) for i in backups):
+                self.scan_game(game)
+                backups = [row[0] for row in self._db.execute(query,args)]
+        return backups
+
+    def get_latest_backup(self,game,state=None):
+        """
+        Get the latest backup of a game.
+
+        :param game: The game to look up.
+        :type game: :class:`sgbackup.game.Game`
+        :param state: *"active"*, *"finished"* or `None` for all backups.
+        :type state: `str` or `None`
+        :returns: (`str`) - The absolute filename of the latest backup or `None`
+            if the game has no backups.
+        """
+        backups = self.get_backups(game,state)
+        if backups:
+            return backups[-1]
+        return None
+
+    def destroy(self):
+        self.emit('destroy')
+
+    def do_destroy(self):
+        """
+        **destroy** signal callback.
+
+        **Do not call this method yourself!**
+        """
+        with self.__lock:
+            if self.__db is not None:
+                self.__db.close()
+                self.__db = None
+        self.__app = None
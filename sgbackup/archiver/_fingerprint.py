@@ -0,0 +1,233 @@
+# -*- coding:utf-8 -*-
+# author: Christian Moser
+# file: sgbackup/archiver/_fingerprint.py
+# module: sgbackup.archiver._fingerprint
+# license: GPL
+
+from gi.repository import GObject,GLib
+import contextlib
+import hashlib
+import os
+import sys
+import threading
+
+class FingerprintStore(GObject.GObject):
+    """
+    This class stores a fingerprint of the SaveGame tree of every game at the time
+    its last backup was created. The fingerprint is built from the paths, sizes and
+    modification times of the SaveGame files and optionally from their contents.
+
+    It is used by :class:`sgbackup.archiver._archivermanager.ArchiverManager` to skip
+    backups of games whose SaveGames did not change since the last backup.
+
+    You should not create this class yourself, use the instance provided by
+    :attr:`sgbackup.archiver._archivermanager.ArchiverManager.fingerprints` instead.
+
+    Signals
+    _______
+    * *destroy*
+    """
+    __name__ = "sgbackup.archiver._fingerprint.FingerprintStore"
+    __gsignals__ = {
+        'destroy': (GObject.SIGNAL_RUN_LAST,None,()),
+    }
+
+    def __init__(self):
+        GObject.GObject.__init__(self)
+        self.__app = None
+        self.__keyfile = GLib.KeyFile.new()
+        self.__lock = threading.Lock()
+        self.__batch = 0
+        self.__dirty = False
+
+    def _real_initialize(self,app):
+        self.__app = app
+        if os.path.isfile(self.filename):
+            try:
+                self.__keyfile.load_from_file(self.filename,0)
+            except Exception as err:
+                print("Unable to load fingerprints \"{filename}\"! ({message})".format(
+                        filename=self.filename,message=err),
+                      file=sys.stderr)
+
+    @GObject.Property
+    def application(self):
+        """
+        *(read only)*
+
+        The application this class is registered with.
+
+        :type: :class:`sgbackup.application.Application`
+        """
+        return self.__app
+
+    @GObject.Property
+    def filename(self):
+        """
+        *(read only)*
+
+        The file the fingerprints are stored in.
+
+        :type: `str`
+        """
+        return os.path.join(self.application.config.user_data_dir,'fingerprints.conf')
+
+    def compute(self,game,archiver=None,hash_content=None):
+        """
+        Compute the fingerprint of the SaveGames of a game.
+
+        :param game: The game to compute the fingerprint for.
+        :type game: :class:`sgbackup.game.Game`
+        :param archiver: The archiver used for the backup. The archiver ID is
+            part of the fingerprint, so changing the archiver forces a new backup.
+        :type archiver: :class:`sgbackup.archiver._archiver.ArchiverBase` or `None`
+        :param hash_content: Include the file contents in the fingerprint. If `None`
+            the *sgbackup.fingerprintContent* configuration option is used.
+        :type hash_content: `bool` or `None`
+        :returns: (`str`) - The fingerprint as a hex string or `None` if the
+            SaveGame directory does not exist.
+        """
+        if hash_content is None:
+            hash_content = self.application.config.fingerprint_content
+
+        sgpath = os.path.join(game.savegame_root,game.savegame_dir)
+        if not os.path.exists(sgpath):
+            return None
+
+        fingerprint = hashlib.sha256()
+        if archiver is not None:
+            fingerprint.update(archiver.id.encode('utf-8') + b'\0')
+        fingerprint.update(b'finished\0' if game.is_finished else b'active\0')
+
+        def add_file(path,relpath):
+            stat = os.stat(path)
+            fingerprint.update("{path}\0{size}\0{mtime}\0".format(
+                path=relpath.replace('\\','/'),size=stat.st_size,mtime=stat.st_mtime_ns).encode('utf-8'))
+            if hash_content:
+                content = hashlib.sha256()
+                with open(path,'rb') as ifile:
+                    for data in iter(lambda: ifile.read(1024 * 1024),b''):
+                        content.update(data)
+                fingerprint.update(content.digest())
+
+        if os.path.isfile(sgpath):
+            add_file(sgpath,os.path.basename(sgpath))
+        else:
+            for dirpath,dirnames,filenames in os.walk(sgpath):
+                dirnames.sort()
+                reldir = os.path.relpath(dirpath,sgpath)
+                fingerprint.update("{dir}/\0".format(dir=reldir.replace('\\','/')).encode('utf-8'))
+                for fn in sorted(filenames):
+                    add_file(os.path.join(dirpath,fn),os.path.join(reldir,fn))
+
+        return fingerprint.hexdigest()
+
+    def get(self,game):
+        """
+        Get the stored fingerprint of a game.
+
+        :param game: The game to look up.
+        :type game: :class:`sgbackup.game.Game`
+        :returns: A (`fingerprint`,`backup`) tuple. If no fingerprint is stored
+            for the game, `(None,None)` is returned.
+        """
+        with self.__lock:
+            try:
+                return (self.__keyfile.get_string(game.game_id,'fingerprint'),
+                        self.__keyfile.get_string(game.game_id,'backup'))
+            except GLib.Error:
+                return (None,None)
+
+    def get_unchanged_backup(self,game,fingerprint):
+        """
+        Get the backup of a game which was created from the same SaveGames.
+
+        :param game: The game to look up.
+        :type game: :class:`sgbackup.game.Game`
+        :param fingerprint: The current fingerprint of the game as returned by
+            :func:`FingerprintStore.compute`.
+        :type fingerprint: `str`
+        :returns: (`str`) - The filename of the backup if the fingerprint did not change
+            and the backup still exists, `None` otherwise.
+        """
+        if fingerprint is None:
+            return None
+
+        stored,backup = self.get(game)
+        if stored == fingerprint and backup and os.path.isfile(backup):
+            return backup
+        return None
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        A context manager that defers saving the fingerprints to disk until
+        the *with* block is left, so a batch of backups writes the file once.
+        """
+        with self.__lock:
+            self.__batch += 1
+        try:
+            yield self
+        finally:
+            with self.__lock:
+                self.__batch -= 1
+                if self.__batch == 0 and self.__dirty:
+                    self.__save()
+
+    def set(self,game,fingerprint,backup):
+        """
+        Store the fingerprint of a game and save the fingerprints to disk.
+        Inside a :func:`FingerprintStore.batch` block the fingerprints are saved
+        when the block is left.
+
+        :param game: The game the fingerprint belongs to.
+        :type game: :class:`sgbackup.game.Game`
+        :param fingerprint: The fingerprint as returned by :func:`FingerprintStore.compute`.
+        :type fingerprint: `str`
+        :param backup: The backup created from the SaveGames.
+        :type backup: `str`
+        """
+        if fingerprint is None:
+            return
+
+        with self.__lock:
+            self.__keyfile.set_string(game.game_id,'fingerprint',fingerprint)
+            self.__keyfile.set_string(game.game_id,'backup',backup)
+            self.__save()
+
+    def remove(self,game):
+        """
+        Remove the stored fingerprint of a game.
+
+        :param game: The game to remove the fingerprint for.
+        :type game: :class:`sgbackup.game.Game`
+        """
+        with self.__lock:
+            if self.__keyfile.has_group(game.game_id):
+                self.__keyfile.remove_group(game.game_id)
+                self.__save()
+
+    def __save(self):
+        if self.__batch > 0:
+            self.__dirty = True
+            return
+
+        # write a temporary file and rename it, so readers never see a partially
+        # written file.
+        os.makedirs(os.path.dirname(self.filename),exist_ok=True)
+        tmpfile = self.filename + '.tmp'
+        with open(tmpfile,'w',encoding='utf-8') as ofile:
+            ofile.write(self.__keyfile.to_data()[0])
+        os.replace(tmpfile,self.filename)
+        self.__dirty = False
+
+    def destroy(self):
+        self.emit('destroy')
+
+    def do_destroy(self):
+        """
+        **destroy** signal callback.
+
+        **Do not call this method yourself!**
+        """
+        self.__app = None
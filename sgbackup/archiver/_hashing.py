@@ -0,0 +1,57 @@
+# -*- coding:utf-8 -*-
+# author: Christian Moser
+# file: sgbackup/archiver/_hashing.py
+# module: sgbackup.archiver._hashing
+# license: GPL
+
+import hashlib
+import io
+
+class HashingWriter(io.RawIOBase):
+    """
+    A write only file wrapper that computes digests of all data written through it.
+
+    The wrapper is not seekable, so archivers using it have to write their archives
+    in a single sequential pass. :mod:`zipfile` writes data descriptors in this case
+    and :mod:`tarfile` needs to be opened in stream mode (*w|*).
+
+    :param fileobj: The file to write to.
+    :param algorithms: The :mod:`hashlib` algorithms to compute.
+    :type algorithms: `list(str)`
+    """
+    def __init__(self,fileobj,algorithms):
+        io.RawIOBase.__init__(self)
+        self.__fileobj = fileobj
+        self.__position = 0
+        self.__hashes = dict((name,hashlib.new(name)) for name in algorithms)
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def tell(self):
+        return self.__position
+
+    def write(self,data):
+        n = self.__fileobj.write(data)
+        if n is None:
+            n = len(data)
+        if n:
+            view = memoryview(data).cast('B')[:n]
+            for h in self.__hashes.values():
+                h.update(view)
+            self.__position += n
+        return n
+
+    def flush(self):
+        self.__fileobj.flush()
+
+    def hexdigests(self):
+        """
+        Get the digests of the data written so far.
+
+        :returns: (`dict`) - A mapping of the algorithm names to hex digests.
+        """
+        return dict((name,h.hexdigest()) for name,h in self.__hashes.items())
@@ -0,0 +1,143 @@
+# -*- coding:utf-8 -*-
+# author: Christian Moser
+# file: sgbackup/archiver/_retention.py
+# module: sgbackup.archiver._retention
+# license: GPL
+
+from ._catalog import parse_backup_timestamp,TIMESTAMP_FORMAT
+import datetime
+
+def _hourly_key(dt):
+    return (dt.year,dt.month,dt.day,dt.hour)
+
+def _daily_key(dt):
+    return (dt.year,dt.month,dt.day)
+
+def _weekly_key(dt):
+    iso = dt.isocalendar()
+    return (iso[0],iso[1])
+
+def _monthly_key(dt):
+    return (dt.year,dt.month)
+
+class RetentionPolicy(object):
+    """
+    A backup retention policy.
+
+    The policy keeps the `keep_last` latest backups. Additionally it keeps the
+    latest backup of each of the last `keep_hourly` hours, `keep_daily` days,
+    `keep_weekly` weeks and `keep_monthly` months that have a backup
+    (grandfather-father-son rotation). A backup is kept if any rule selects it.
+
+    If all values are `0`, the policy keeps all backups.
+
+    :param keep_last: The number of latest backups to keep.
+    :type keep_last: `int`
+    :param keep_hourly: The number of hourly backups to keep.
+    :type keep_hourly: `int`
+    :param keep_daily: The number of daily backups to keep.
+    :type keep_daily: `int`
+    :param keep_weekly: The number of weekly backups to keep.
+    :type keep_weekly: `int`
+    :param keep_monthly: The number of monthly backups to keep.
+    :type keep_monthly: `int`
+    """
+    def __init__(self,keep_last=0,keep_hourly=0,keep_daily=0,keep_weekly=0,keep_monthly=0):
+        for name,value in (('keep_last',keep_last),
+                           ('keep_hourly',keep_hourly),
+                           ('keep_daily',keep_daily),
+                           ('keep_weekly',keep_weekly),
+                           ('keep_monthly',keep_monthly)):
+            if value < 0:
+                raise ValueError("\"{name}\" needs to be a positive integer or 0!".format(name=name))
+
+        self.keep_last = keep_last
+        self.keep_hourly = keep_hourly
+        self.keep_daily = keep_daily
+        self.keep_weekly = keep_weekly
+        self.keep_monthly = keep_monthly
+
+    @staticmethod
+    def from_config(config):
+        """
+        Create a policy from the *sgbackup.backupVersions*, *sgbackup.keepHourly*,
+        *sgbackup.keepDaily*, *sgbackup.keepWeekly* and *sgbackup.keepMonthly*
+        configuration options.
+
+        :param config: The configuration to use.
+        :type config: :class:`sgbackup.config.config.Config`
+        :returns: (:class:`RetentionPolicy`) - The configured policy.
+        """
+        return RetentionPolicy(config.backup_versions,
+                               config.keep_hourly,
+                               config.keep_daily,
+                               config.keep_weekly,
+                               config.keep_monthly)
+
+    @property
+    def keeps_all(self):
+        """
+        `True` if this policy does not prune any backups.
+
+        :type: `bool`
+        """
+        return not (self.keep_last
+                    or self.keep_hourly
+                    or self.keep_daily
+                    or self.keep_weekly
+                    or self.keep_monthly)
+
+    def select(self,savegame_name,backups):
+        """
+        Select the backups to prune.
+
+        The backups are sorted once by the timestamp in their filenames. Backups
+        without a valid timestamp are never pruned.
+
+        :param savegame_name: The savegame name of the game the backups belong to.
+        :type savegame_name: `str`
+        :param backups: The filenames of the backups.
+        :type backups: `list(str)`
+        :returns: A (`keep`,`prune`) tuple of filename lists, latest backups first.
+        """
+        dated = []
+        undated = []
+        for backup in backups:
+            timestamp = parse_backup_timestamp(savegame_name,backup)
+            if timestamp is None:
+                undated.append(backup)
+            else:
+                dated.append((timestamp,backup))
+        dated.sort(reverse=True)
+
+        if self.keeps_all:
+            return ([i[1] for i in dated] + undated,[])
+
+        selected = set(range(min(self.keep_last,len(dated))))
+        dates = [datetime.datetime.strptime(i[0],TIMESTAMP_FORMAT) for i in dated]
+
+        for count,key_func in ((self.keep_hourly,_hourly_key),
+                               (self.keep_daily,_daily_key),
+                               (self.keep_weekly,_weekly_key),
+                               (self.keep_monthly,_monthly_key)):
+            if count <= 0:
+                continue
+            last_key = None
+            for i,dt in enumerate(dates):
+                key = key_func(dt)
+                if key == last_key:
+                    continue
+                last_key = key
+                selected.add(i)
+                count -= 1
+                if count == 0:
+                    break
+
+        keep = []
+        prune = []
+        for i,(timestamp,backup) in enumerate(dated):
+            if i in selected:
+                keep.append(backup)
+            else:
+                prune.append(backup)
+        return (keep + undated,prune)
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+# author: Christian Moser
+# file sgbackup/archiver/chunkarchiver.py
+# module sgbackup.archiver.chunkarchiver
+# license: GPL
+
+from gi.repository import GObject
+from ._archiver import ArchiverBase
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import zlib
+
+CHUNK_MIN_SIZE = 2 * 1024
+CHUNK_MAX_SIZE = 64 * 1024
+# 13 bits result in an average chunk size of 8 KiB. The high bits of the gear hash
+# depend on the last 32 bytes, so the mask is placed on the high bits.
+CHUNK_MASK = ((1 << 13) - 1) << 19
+
+READ_SIZE = 1024 * 1024
+
+MANIFEST_FORMAT = "sgbackup-chunkstore"
+MANIFEST_VERSION = 1
+
+_GEAR = tuple(int.from_bytes(hashlib.sha256(bytes((i,))).digest()[:4],'little') for i in range(256))
+
+def find_chunk_boundary(data,start,end):
+    """
+    Find the end of the chunk starting at `start` using a gear rolling hash.
+
+    :param data: The data to search.
+    :type data: `bytes`
+    :param start: The offset the chunk starts at.
+    :type start: `int`
+    :param end: The end of the valid data in `data`.
+    :type end: `int`
+    :returns: (`int`) - The offset of the first byte after the chunk.
+    """
+    limit = min(end,start + CHUNK_MAX_SIZE)
+    i = start + CHUNK_MIN_SIZE
+    if i >= limit:
+        return limit
+
+    gear = _GEAR
+    mask = CHUNK_MASK
+    h = 0
+    for byte in data[i:limit]:
+        h = ((h << 1) + gear[byte]) & 0xFFFFFFFF
+        i += 1
+        if not (h & mask):
+            return i
+    return limit
+
+def iter_chunks(fileobj):
+    """
+    Split a file into content defined chunks.
+
+    :param fileobj: A file opened for binary reading.
+    :returns: An iterator over the chunks as `bytes`.
+    """
+    buffer = b''
+    eof = False
+    while True:
+        if not eof and len(buffer) < CHUNK_MAX_SIZE:
+            data = fileobj.read(READ_SIZE)
+            if data:
+                buffer += data
+                continue
+            eof = True
+
+        if not buffer:
+            return
+
+        pos = 0
+        while (len(buffer) - pos) >= CHUNK_MAX_SIZE or (eof and pos < len(buffer)):
+            cut = find_chunk_boundary(buffer,pos,len(buffer))
+            yield buffer[pos:cut]
+            pos = cut
+        buffer = buffer[pos:]
+
+class _SharedLock(object):
+    # A readers/writer lock. Any number of threads can hold the lock shared,
+    # one thread can hold it exclusive. Waiting writers block new readers, so
+    # a writer is not starved by a stream of readers.
+    def __init__(self):
+        self.__cond = threading.Condition()
+        self.__readers = 0
+        self.__writer = False
+        self.__writers_waiting = 0
+
+    @contextlib.contextmanager
+    def shared(self):
+        with self.__cond:
+            while self.__writer or self.__writers_waiting:
+                self.__cond.wait()
+            self.__readers += 1
+        try:
+            yield
+        finally:
+            with self.__cond:
+                self.__readers -= 1
+                if self.__readers == 0:
+                    self.__cond.notify_all()
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        with self.__cond:
+            self.__writers_waiting += 1
+            try:
+                while self.__writer or self.__readers:
+                    self.__cond.wait()
+            finally:
+                self.__writers_waiting -= 1
+            self.__writer = True
+        try:
+            yield
+        finally:
+            with self.__cond:
+                self.__writer = False
+                self.__cond.notify_all()
+
+class ChunkArchiver(ArchiverBase):
+    """
+    An archiver storing the SaveGame files as content defined chunks in a shared
+    repository in the backup directory. Chunks are addressed by their SHA-256 hash,
+    so data that did not change between two backups is only stored once, even across
+    games.
+
+    A backup created by this archiver is a small JSON manifest listing the chunks
+    of every file. Chunks which are not referenced by any manifest anymore are
+    removed after backups were deleted. Backups and restores hold the repository
+    lock shared and the garbage collection holds it exclusive, so chunks which
+    a running backup reuses are never removed before its manifest is written.
+    """
+    __name__ = "sgbackup.archiver.chunkarchiver.ChunkArchiver"
+
+    def __init__(self,app):
+        ArchiverBase.__init__(self,app,"chunkstore","chunks",["chunks"])
+
+        archivers = self.application.archivers
+        self.__repository_lock = _SharedLock()
+        self.__gc_pending = False
+        self.__delete_backup_slot = archivers.connect('delete-backup',self._on_delete_backup)
+        self.__backups_deleted_slot = archivers.connect('backups-deleted',self._on_backups_deleted)
+
+    @GObject.Property
+    def repository_dir(self):
+        """
+        *(read only)*
+
+        The directory the chunks are stored in.
+
+        :type: `str`
+        """
+        return os.path.join(self.application.config.backup_dir,'.chunkstore')
+
+    def get_chunk_filename(self,chunk_id:str):
+        """
+        Get the filename of a chunk in the repository.
+
+        :param chunk_id: The SHA-256 hex digest of the chunk.
+        :type chunk_id: `str`
+        :returns: (`str`) - The filename of the chunk.
+        """
+        return os.path.join(self.repository_dir,chunk_id[:2],chunk_id)
+
+    def _store_chunk(self,chunk:bytes):
+        chunk_id = hashlib.sha256(chunk).hexdigest()
+        chunk_file = self.get_chunk_filename(chunk_id)
+        if os.path.isfile(chunk_file):
+            return (chunk_id,False)
+
+        os.makedirs(os.path.dirname(chunk_file),exist_ok=True)
+        fd,tmpfile = tempfile.mkstemp(dir=os.path.dirname(chunk_file),prefix='.tmp-')
+        try:
+            with os.fdopen(fd,'wb') as ofile:
+                ofile.write(zlib.compress(chunk,6))
+            os.replace(tmpfile,chunk_file)
+        except:
+            if os.path.exists(tmpfile):
+                os.unlink(tmpfile)
+            raise
+        return (chunk_id,True)
+
+    def _load_chunk(self,chunk_id:str):
+        with open(self.get_chunk_filename(chunk_id),'rb') as ifile:
+            chunk = zlib.decompress(ifile.read())
+        if hashlib.sha256(chunk).hexdigest() != chunk_id:
+            raise ValueError("Chunk \"{chunk}\" is corrupted!".format(chunk=chunk_id))
+        return chunk
+
+    def read_manifest(self,filename:str):
+        """
+        Read a backup manifest.
+
+        :param filename: The filename of the backup.
+        :type filename: `str`
+        :returns: (`dict`) - The manifest.
+        """
+        with open(filename,'r',encoding='utf-8') as ifile:
+            manifest = json.load(ifile)
+        if manifest.get('format') != MANIFEST_FORMAT:
+            raise ValueError("\"{file}\" is not a chunkstore manifest!".format(file=filename))
+        return manifest
+
+    def create_backup(self,game,filename):
+        sgpath = os.path.join(game.savegame_root,game.savegame_dir)
+        if not os.path.exists(sgpath):
+            if self.application.config.verbose:
+                print("[{game_id}] No SaveGame dir does not exist! SKIPPING!!!".format(game_id=game.game_id))
+            return
+
+        with self.__repository_lock.shared():
+            self.__create_backup(game,filename,sgpath)
+
+    def __create_backup(self,game,filename,sgpath):
+        arcroot = game.savegame_dir.replace('\\','/')
+        entries = []
+        n_chunks = 0
+        n_new = 0
+        new_bytes = 0
+
+        def add_file(path,arcname):
+            nonlocal n_chunks,n_new,new_bytes
+            stat = os.stat(path)
+            chunks = []
+            with open(path,'rb') as ifile:
+                for chunk in iter_chunks(ifile):
+                    chunk_id,is_new = self._store_chunk(chunk)
+                    chunks.append(chunk_id)
+                    n_chunks += 1
+                    if is_new:
+                        n_new += 1
+                        new_bytes += len(chunk)
+            entries.append({
+                'path': arcname,
+                'type': 'file',
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'chunks': chunks,
+            })
+
+        if os.path.isfile(sgpath):
+            add_file(sgpath,arcroot)
+        else:
+            for dirpath,dirnames,filenames in os.walk(sgpath):
+                dirnames.sort()
+                rel = os.path.relpath(dirpath,sgpath)
+                if rel == '.':
+                    arcdir = arcroot
+                else:
+                    arcdir = '/'.join((arcroot,rel.replace('\\','/')))
+                entries.append({'path':arcdir,'type':'dir'})
+                for fn in sorted(filenames):
+                    add_file(os.path.join(dirpath,fn),'/'.join((arcdir,fn)))
+
+        manifest = {
+            'format': MANIFEST_FORMAT,
+            'version': MANIFEST_VERSION,
+            'game': game.game_id,
+            'entries': entries,
+        }
+
+        fd,tmpfile = tempfile.mkstemp(dir=os.path.dirname(filename),prefix='.tmp-')
+        try:
+            with os.fdopen(fd,'w',encoding='utf-8') as ofile:
+                json.dump(manifest,ofile)
+            os.replace(tmpfile,filename)
+        except:
+            if os.path.exists(tmpfile):
+                os.unlink(tmpfile)
+            raise
+
+        if self.application.config.verbose:
+            print("[{game_id}] {chunks} chunks, {new} new ({size} bytes)".format(
+                game_id=game.game_id,chunks=n_chunks,new=n_new,size=new_bytes))
+
+    def do_restore(self,game,filename):
+        manifest = self.read_manifest(filename)
+        root = os.path.abspath(game.savegame_root)
+        os.makedirs(root,exist_ok=True)
+
+        with self.__repository_lock.shared():
+            for entry in manifest['entries']:
+                target = os.path.abspath(os.path.join(root,*entry['path'].split('/')))
+                if os.path.commonpath((root,target)) != root:
+                    print("!!! Skipping \"{path}\"! (Path is outside of the SaveGame root directory!)".format(
+                            path=entry['path']),
+                          file=sys.stderr)
+                    continue
+
+                if entry['type'] == 'dir':
+                    os.makedirs(target,exist_ok=True)
+                    continue
+
+                os.makedirs(os.path.dirname(target),exist_ok=True)
+                with open(target,'wb') as ofile:
+                    for chunk_id in entry['chunks']:
+                        ofile.write(self._load_chunk(chunk_id))
+                os.utime(target,(entry['mtime'],entry['mtime']))
+
+    def collect_garbage(self):
+        """
+        Remove all chunks from the repository, which are not referenced by any backup.
+
+        :returns: (`int`) - The number of removed chunks.
+        """
+        backup_dir = self.application.config.backup_dir
+        repository = self.repository_dir
+        if not os.path.isdir(repository):
+            return 0
+
+        # backups reuse chunks before their manifest is written, so the chunks are
+        # only collected while no backup is running.
+        with self.__repository_lock.exclusive():
+            referenced = set()
+            for dirpath,dirnames,filenames in os.walk(backup_dir):
+                if os.path.abspath(dirpath) == os.path.abspath(backup_dir) and '.chunkstore' in dirnames:
+                    dirnames.remove('.chunkstore')
+                for fn in filenames:
+                    if not fn.endswith('.' + self.extension):
+                        continue
+                    try:
+                        manifest = self.read_manifest(os.path.join(dirpath,fn))
+                    except Exception as err:
+                        # never delete chunks if a manifest can not be read
+                        print("Unable to read manifest \"{file}\"! ({message})".format(
+                                file=os.path.join(dirpath,fn),message=err),
+                              file=sys.stderr)
+                        return 0
+                    for entry in manifest['entries']:
+                        if entry['type'] == 'file':
+                            referenced.update(entry['chunks'])
+
+            removed = 0
+            for dirpath,dirnames,filenames in os.walk(repository):
+                for fn in filenames:
+                    if fn not in referenced:
+                        os.unlink(os.path.join(dirpath,fn))
+                        removed += 1
+
+        if removed and self.application.config.verbose:
+            print("[chunkstore] {n} unreferenced chunks removed".format(n=removed))
+        return removed
+
+    def _on_delete_backup(self,archivers,game,filename):
+        if filename.endswith('.' + self.extension):
+            self.__gc_pending = True
+
+    def _on_backups_deleted(self,archivers,game):
+        if self.__gc_pending:
+            self.__gc_pending = False
+            self.collect_garbage()
+
+    def do_destroy(self):
+        archivers = self.application.archivers
+        if self.__delete_backup_slot is not None:
+            archivers.disconnect(self.__delete_backup_slot)
+            self.__delete_backup_slot = None
+        if self.__backups_deleted_slot is not None:
+            archivers.disconnect(self.__backups_deleted_slot)
+            self.__backups_deleted_slot = None
+        ArchiverBase.do_destroy(self)
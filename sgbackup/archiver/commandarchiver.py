@@ -5,6 +5,7 @@
 
 from gi.repository import GObject,GLib
 from ._archiver import ArchiverBase
+from .. import error
 import os
 import sys
 import shlex
@@ -13,7 +14,8 @@ import subprocess
 
 class CommandArchiver(ArchiverBase):
     def __init__(self,app,name,default_extension,extensions,exe,backup_args,restore_args,
-                 verbose="",change_directory=True,variables=None,cygpath=None,multiprocessing=False):
+                 verbose="",change_directory=True,variables=None,cygpath=None,multiprocessing=False,
+                 backup_to_stdout=False):
         ArchiverBase.__init__(self,app,name,default_extension,extensions,multiprocessing)
 
         self.__exe = exe
@@ -23,6 +25,7 @@ class CommandArchiver(ArchiverBase):
         self.__variables = variables
         self.__verbose = verbose
         self.__cygpath = cygpath
+        self.__backup_to_stdout = backup_to_stdout
 
     @staticmethod
     def new_from_file(app,filename:str):
@@ -83,6 +86,11 @@ class CommandArchiver(ArchiverBase):
             except:
                 multiprocessing = False
 
+            try:
+                backup_to_stdout = kf.get_boolean(section,'backupToStdout')
+            except:
+                backup_to_stdout = False
+
             variables = {}
             if kf.has_group('variables'):
                 keys,length = kf.get_keys('variables')
@@ -105,7 +113,8 @@ class CommandArchiver(ArchiverBase):
                 change_directory,
                 variables,
                 cygpath,
-                multiprocessing)
+                multiprocessing,
+                backup_to_stdout)
         except:
             return None
 
@@ -141,6 +150,18 @@ class CommandArchiver(ArchiverBase):
     @GObject.Property
     def cygpath(self):
         return self.__cygpath
+
+    @GObject.Property
+    def backup_to_stdout(self):
+        """
+        *(read only)*
+
+        `True` if the backup command writes the archive to stdout. The archive
+        is then written to the backup file by this archiver.
+
+        :type: `bool`
+        """
+        return self.__backup_to_stdout
     
     def get_variables(self,game,filename):
         def sanitize_path(path):
@@ -185,30 +206,35 @@ class CommandArchiver(ArchiverBase):
             Template(self.__restore_args).safe_substitute(
                 self.get_variables(game,filename)))
     
-    def do_backup(self, game, filename):
+    def create_backup(self, game, filename):
         if not self.can_backup:
-            return
+            raise error.BackupError("Archiver \"{archiver}\" can not create backups!".format(archiver=self.id))
         
         if not os.path.isdir(game.savegame_root):
-            print("!!! Savegame root directory does not exist! (Unable to extract files!)",file=sys.stderr)
-            return
+            raise error.BackupError("Savegame root directory does not exist!")
         
         if self.application.config.verbose:
             print("Backing up \"{game}\".".format(game=game.game_name))
 
         if self.change_directory:
-            cwd = os.getcwd()
-            os.chdir(game.savegame_root)
+            cwd = game.savegame_root
+        else:
+            cwd = None
 
         cmd = [self.executable] + self.get_backup_args(game,filename)
         try:
-            subprocess.run(cmd)
-        except:
-            if self.change_directory:
-                os.chdir(cwd)
-
-        if self.change_directory:
-            os.chdir(cwd)
+            if self.backup_to_stdout:
+                with self.open_backup_file(filename) as ofile:
+                    proc = subprocess.Popen(cmd,cwd=cwd,stdout=subprocess.PIPE)
+                    for data in iter(lambda: proc.stdout.read(1024 * 1024),b''):
+                        ofile.write(data)
+                    proc.stdout.close()
+                    if proc.wait() != 0:
+                        raise RuntimeError("exit status {}".format(proc.returncode))
+            else:
+                subprocess.run(cmd,cwd=cwd,check=True)
+        except Exception as err:
+            raise error.BackupError("Running \"{exe}\" failed! ({message})".format(exe=self.executable,message=err))
 
     def do_restore(self, game, filename):
         if not self.can_restore:
@@ -221,19 +247,15 @@ class CommandArchiver(ArchiverBase):
             print("!!! Unable to restore SaveGame backup! (SaveGame root directory does not exist!)",file=sys.stderr)
 
         if self.change_directory:
-            cwd = os.getcwd()
-            os.chdir(game.savegame_root)
+            cwd = game.savegame_root
+        else:
+            cwd = None
 
         cmd = [self.executable] + self.get_restore_args(game,filename)
         try:
-            subprocess.run(cmd)
-        except:
-            if self.change_directory:
-                os.chdir(cwd)
-            return
-        
-        if self.change_directory:
-            os.chdir(cwd)
+            subprocess.run(cmd,cwd=cwd)
+        except Exception as err:
+            print("!!! Running \"{exe}\" failed! ({message})".format(exe=self.executable,message=err),file=sys.stderr)
 
 
 def get_archivers(app):
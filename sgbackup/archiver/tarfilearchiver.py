@@ -17,7 +17,7 @@ class TarfileArchiverBase(ArchiverBase):
     def file_is_archive(self,filename):
         return  (tarfile.is_tarfile(filename) and ArchiverBase.file_is_archive(self,filename))
 
-    def do_backup(self, game, filename):
+    def create_backup(self, game, filename):
         if not os.path.exists(os.path.join(game.savegame_root,game.savegame_dir)):
             if self.application.config.verbose:
                 print("[{game_id}] No SaveGame dir does not exist! SKIPPING!!!".format(game_id=game.game_id))
@@ -26,12 +26,10 @@ class TarfileArchiverBase(ArchiverBase):
         if not os.path.exists(os.path.dirname(filename)):
             os.makedirs(os.path.dirname(filename))
 
-        if self.__compression:
-            open_mode = 'w:' + self.__compression
-        else:
-            open_mode = 'w'
+        # stream mode, so the archive can be written through a HashingWriter
+        open_mode = 'w|' + self.__compression
 
-        with tarfile.open(filename,open_mode) as backup:
+        with self.open_backup_file(filename) as ofile, tarfile.open(fileobj=ofile,mode=open_mode) as backup:
             backup.add(os.path.join(game.savegame_root,game.savegame_dir),arcname=game.savegame_dir)
         
     def do_restore(self,game,filename):
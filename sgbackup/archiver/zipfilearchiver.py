@@ -6,11 +6,37 @@
 
 from gi.repository import GObject
 from ._archiver import ArchiverBase
+from concurrent.futures import ThreadPoolExecutor
+import collections
 import zipfile
+import zlib
 import os
+import shutil
 import sys
+import tempfile
 
 import sgbackup
+
+# Compressed members smaller than this are kept in memory by the worker threads.
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+READ_SIZE = 1024 * 1024
+
+# The parallel writer appends precompressed members through private zipfile
+# internals. It was verified against CPython 3.11, 3.12 and 3.13, other versions
+# fall back to ZipFile.write().
+PARALLEL_VERSIONS = ((3,11),(3,13))
+
+def _parallel_supported():
+    if sys.implementation.name != 'cpython':
+        return False
+    if not (PARALLEL_VERSIONS[0] <= sys.version_info[:2] <= PARALLEL_VERSIONS[1]):
+        return False
+    return (hasattr(zipfile,'_get_compressor')
+            and hasattr(zipfile.ZipFile,'_writecheck')
+            and hasattr(zipfile.ZipInfo,'FileHeader'))
+
+PARALLEL_SUPPORTED = _parallel_supported()
+
 class ZipfileArchiver(ArchiverBase):
     CONFIG_SECTION="zipfileArchiver"
 
@@ -53,7 +79,7 @@ class ZipfileArchiver(ArchiverBase):
 
     @GObject.Property(int)
     def compresslevel(self):
-        cl = self.application.config.get(self.CONFIG_SECTION,'compresslevel',9)
+        cl = self.application.config.get_integer(self.CONFIG_SECTION,'compressLevel',9)
         if self.compression == zipfile.ZIP_DEFLATED:
             if cl < 0:
                 cl = 0
@@ -80,7 +106,31 @@ class ZipfileArchiver(ArchiverBase):
             elif cl > 9:
                 cl = 9
         
-        self.application.config.set(self.CONFIG_SECTION,'compresslevel',cl)
+        self.application.config.set_integer(self.CONFIG_SECTION,'compressLevel',cl)
+
+    @GObject.Property(int)
+    def threads(self):
+        """
+        The number of threads used for compressing the files of a backup.
+        If set to *0*, *sgbackup.processMax* threads are used.
+
+        Compressing in parallel relies on internals of the :mod:`zipfile` module
+        and is only done on the CPython versions listed in `PARALLEL_VERSIONS`
+        (verified with CPython 3.11, 3.12 and 3.13). On other versions the files
+        are compressed one after another.
+
+        :type: `int`
+        """
+        threads = self.application.config.get_integer(self.CONFIG_SECTION,'threads',1)
+        if threads <= 0:
+            threads = self.application.config.process_max
+        return max(threads,1)
+
+    @threads.setter
+    def threads(self,n):
+        if n < 0:
+            raise ValueError("\"threads\" needs to be a positive integer or 0!")
+        self.application.config.set_integer(self.CONFIG_SECTION,'threads',n)
 
 
     def _list_files_to_backup(self,game):
@@ -117,7 +167,7 @@ class ZipfileArchiver(ArchiverBase):
             return parse_dir_tree(game.savegame_root,game.savegame_dir)
         
         
-    def do_backup(self, game, filename):
+    def create_backup(self, game, filename):
         if not os.path.exists(os.path.join(game.savegame_root,game.savegame_dir)):
             if self.application.config.verbose:
                 print("[{game_id}] No SaveGame dir does not exist! SKIPPING!!!".format(game_id=game.game_id))
@@ -127,13 +177,18 @@ class ZipfileArchiver(ArchiverBase):
             os.makedirs(game.backup_dir)
 
         backup_files = self._list_files_to_backup(game)
-        if not backup_files:
+        if backup_files is None:
             print("No files to backup found for game \"{}\"! Skipping!".format(game.game_name),file=sys.stderr)
             return
 
-        with zipfile.ZipFile(filename,mode="w",compression=self.compression,compresslevel=self.compresslevel) as zip:
+        compression = self.compression
+        compresslevel = self.compresslevel
+        threads = self.threads
+        with self.open_backup_file(filename) as ofile, zipfile.ZipFile(ofile,mode="w",compression=compression,compresslevel=compresslevel) as zip:
             if len(backup_files) == 0:
                 zip.write(os.path.join(game.savegame_root,game.savegame_dir),arcname=game.savegame_dir.replace("\\","/"))
+            elif threads > 1 and compression != zipfile.ZIP_STORED and self._can_write_parallel(zip):
+                self._write_parallel(zip,game,backup_files,compression,compresslevel,threads)
             else:
                 for i,isdir in backup_files:
                     if (isdir):
@@ -142,6 +197,106 @@ class ZipfileArchiver(ArchiverBase):
                         zip.write(os.path.join(game.savegame_root,game.savegame_dir,i),
                                   arcname=os.path.join(game.savegame_dir,i).replace('\\','/'))
 
+    def _can_write_parallel(self,zip):
+        return (PARALLEL_SUPPORTED
+                and all(hasattr(zip,attr) for attr in ('fp','start_dir','_didModify','_seekable')))
+
+    def _compress_file(self,path,arcname,compression,compresslevel):
+        zinfo = zipfile.ZipInfo.from_file(path,arcname)
+        zinfo.compress_type = compression
+        if compression == zipfile.ZIP_LZMA:
+            # the LZMA stream has an end-of-stream marker, ZipFile.write() sets
+            # this flag too.
+            zinfo.flag_bits |= 0x02
+        compressor = zipfile._get_compressor(compression,compresslevel)
+
+        data = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        try:
+            crc = 0
+            file_size = 0
+            with open(path,'rb') as ifile:
+                for chunk in iter(lambda: ifile.read(READ_SIZE),b''):
+                    crc = zlib.crc32(chunk,crc)
+                    file_size += len(chunk)
+                    if compressor is not None:
+                        chunk = compressor.compress(chunk)
+                    data.write(chunk)
+            if compressor is not None:
+                data.write(compressor.flush())
+        except:
+            data.close()
+            raise
+
+        zinfo.CRC = crc
+        zinfo.file_size = file_size
+        zinfo.compress_size = data.tell()
+        data.seek(0)
+        return (zinfo,data)
+
+    def _write_compressed(self,zip,zinfo,data):
+        # Append an already compressed member. This does the same as ZipFile.write()
+        # without compressing the data again.
+        zip64 = (zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT)
+        zip._writecheck(zinfo)
+        zip._didModify = True
+        if zip._seekable:
+            zip.fp.seek(zip.start_dir)
+        zinfo.header_offset = zip.fp.tell()
+        zip.fp.write(zinfo.FileHeader(zip64))
+        shutil.copyfileobj(data,zip.fp,READ_SIZE)
+        zip.filelist.append(zinfo)
+        zip.NameToInfo[zinfo.filename] = zinfo
+        zip.start_dir = zip.fp.tell()
+
+    def _write_parallel(self,zip,game,backup_files,compression,compresslevel,threads):
+        arcroot = game.savegame_dir.replace('\\','/')
+        # At most 2 * threads members are compressed ahead of the writer, so the
+        # spooled members do not pile up when the workers are faster than the writer.
+        max_pending = 2 * threads
+        members = iter(backup_files)
+        jobs = collections.deque()
+        n_pending = 0
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            # members are written in order, so the archive layout does not depend
+            # on the order the workers finish in.
+            try:
+                while True:
+                    while n_pending < max_pending:
+                        member = next(members,None)
+                        if member is None:
+                            break
+                        i,isdir = member
+                        arcname = '/'.join((arcroot,i.replace('\\','/')))
+                        if isdir:
+                            jobs.append((arcname,None))
+                        else:
+                            jobs.append((arcname,executor.submit(self._compress_file,
+                                                                 os.path.join(game.savegame_root,game.savegame_dir,i),
+                                                                 arcname,
+                                                                 compression,
+                                                                 compresslevel)))
+                            n_pending += 1
+
+                    if not jobs:
+                        break
+                    arcname,future = jobs.popleft()
+                    if future is None:
+                        zip.mkdir(arcname)
+                        continue
+                    n_pending -= 1
+                    zinfo,data = future.result()
+                    with data:
+                        self._write_compressed(zip,zinfo,data)
+            except:
+                for arcname,future in jobs:
+                    if future is not None and not future.cancel():
+                        # release the spooled data of members already compressed
+                        try:
+                            future.result()[1].close()
+                        except Exception:
+                            pass
+                raise
+
     def do_restore(self, game, filename):
         if not game.is_valid():
             raise ValueError("\"game\" is not a valid \"sgbackup.game.Game\" instance!")
@@ -2,6 +2,7 @@ from ..command import Command,CommandOptions
 from ..game import Game
 from .. import error
 from ..help import get_builtin_help
+from ..archiver._retention import RetentionPolicy
 import os
 import sys
 import getopt
@@ -12,10 +13,28 @@ class BackupGameOptions(CommandOptions):
         CommandOptions.__init__(self,app,'backup-game',cmd)
 
         self.__games = []
+        self.__jobs = None
+        self.__force = False
 
     @property
     def games(self):
         return self.__games
+
+    @property
+    def jobs(self):
+        return self.__jobs
+    @jobs.setter
+    def jobs(self,jobs:int):
+        if jobs < 1:
+            raise ValueError("\"jobs\" needs to be a positive integer!")
+        self.__jobs = jobs
+
+    @property
+    def force(self):
+        return self.__force
+    @force.setter
+    def force(self,b:bool):
+        self.__force = b
     
     def add_game(self,game:Game):
         if game not in self.__games:
@@ -57,7 +76,7 @@ class BackupGame(Command):
         if command is None:
             command = self.id
 
-        return """sgbackup {command} [-aAf] [--active] [--all] [--finished] [GameID] ...""".format(command=command)
+        return """sgbackup {command} [-aAfF] [--active] [--all] [--finished] [--force] [-j|--jobs JOBS] [GameID] ...""".format(command=command)
     
     def get_help(self,command=None):
         if command is None:
@@ -68,7 +87,7 @@ class BackupGame(Command):
     
     def do_parse(self, cmd, argv):
         try:
-            opts,args = getopt.getopt(argv,'aAf',['all','active','finished'])
+            opts,args = getopt.getopt(argv,'aAfFj:',['all','active','finished','force','jobs='])
         except getopt.GetoptError as err:
             raise error.OptionError("Parsing options failed! ({error})".format(error=err.msg))
         
@@ -80,6 +99,13 @@ class BackupGame(Command):
                 options.add_all_games()
             elif (o in ['-f','--finished']):
                 options.add_finished_games()
+            elif (o in ['-F','--force']):
+                options.force = True
+            elif (o in ['-j','--jobs']):
+                try:
+                    options.jobs = int(a)
+                except Exception as err:
+                    raise error.OptionError("Illegal value for JOBS! ({message})".format(message=err))
         
         for gid in args:
             if not gid in self.application.games.game_ids:
@@ -89,10 +115,10 @@ class BackupGame(Command):
         return options
     
     def do_execute(self, options):
-        for game in options.games:
-            if self.application.config.verbose:
-                print("Backing up {game_id}: \"{game_name}\"".format(game_id=game.game_id,game_name=game.game_name))
-            game.backup()
+        failed = self.application.archivers.backup_games(options.games,jobs=options.jobs,force=options.force)
+        if failed:
+            return 1
+        return 0
 
 
 class RestoreGameOptions(CommandOptions):
@@ -376,7 +402,191 @@ sgbackup {command} GAME_ID BACKUP_FILE""".format(command=command)
             return 1
 
 
+class RebuildIndexOptions(CommandOptions):
+    def __init__(self,app,cmd):
+        CommandOptions.__init__(self,app,'rebuild-index',cmd)
+
+        self.__games = []
+
+    @property
+    def games(self):
+        return self.__games
+
+    def add_game(self,game:Game):
+        if game not in self.__games:
+            self.__games.append(game)
+
+class RebuildIndex(Command):
+    def __init__(self,app):
+        Command.__init__(self,app,'rebuild-index','Rebuild the backup catalog.')
+
+    def get_synopsis(self,command=None):
+        if command is None:
+            command = self.id
+        return "sgbackup {command} [GameID] ...".format(command=command)
+
+    def get_help(self,command=None):
+        if command is None:
+            command = self.id
+        return get_builtin_help(self.id,command,self.get_help_synopsis(command),None,None)
+
+    def do_parse(self,cmd,argv):
+        options = RebuildIndexOptions(self.application,cmd)
+        for gid in argv:
+            if not gid in self.application.games.game_ids:
+                raise error.OptionError("\"{game_id}\" is not a valid GameID!".format(game_id=gid))
+            options.add_game(self.application.games.get(gid))
+        return options
+
+    def do_execute(self,options:RebuildIndexOptions):
+        catalog = self.application.archivers.catalog
+        try:
+            if options.games:
+                count = catalog.rebuild(options.games)
+            else:
+                count = catalog.rebuild()
+        except Exception as err:
+            print("Rebuilding the backup catalog failed! ({message})".format(message=err),file=sys.stderr)
+            return 1
+
+        if self.application.config.verbose:
+            print("{count} backups indexed.".format(count=count))
+        return 0
+
+
+class PruneBackupsOptions(CommandOptions):
+    def __init__(self,app,cmd):
+        CommandOptions.__init__(self,app,'prune-backups',cmd)
+
+        self.__games = []
+        self.__dry_run = False
+        self.__keep = {}
+
+    @property
+    def games(self):
+        return self.__games
+
+    @property
+    def dry_run(self):
+        return self.__dry_run
+    @dry_run.setter
+    def dry_run(self,b:bool):
+        self.__dry_run = b
+
+    def set_keep(self,rule:str,n:int):
+        if rule not in ('last','hourly','daily','weekly','monthly'):
+            raise ValueError("\"{rule}\" is not a retention rule!".format(rule=rule))
+        if n < 0:
+            raise ValueError("\"keep_{rule}\" needs to be a positive integer or 0!".format(rule=rule))
+        self.__keep[rule] = n
+
+    @property
+    def policy(self):
+        """
+        The retention policy to apply. Rules not given by commandline are
+        taken from the configuration.
+        """
+        config = self.application.config
+        return RetentionPolicy(self.__keep.get('last',config.backup_versions),
+                               self.__keep.get('hourly',config.keep_hourly),
+                               self.__keep.get('daily',config.keep_daily),
+                               self.__keep.get('weekly',config.keep_weekly),
+                               self.__keep.get('monthly',config.keep_monthly))
+
+    def add_game(self,game:Game):
+        if game not in self.__games:
+            self.__games.append(game)
+
+    def add_finished_games(self):
+        for game in self.application.games.finished_games:
+            self.add_game(game)
+
+    def add_active_games(self):
+        for game in self.application.games.active_games:
+            self.add_game(game)
+
+    def add_all_games(self):
+        for game in self.application.games.games:
+            self.add_game(game)
+
+class PruneBackups(Command):
+    def __init__(self,app):
+        Command.__init__(self,app,'prune-backups','Delete backups by the retention policy.')
+
+    def get_synopsis(self,command=None):
+        if command is None:
+            command = self.id
+        return """sgbackup {command} [-aAfn] [--active] [--all] [--finished] [--dry-run] [-k|--keep N]
+    [--keep-hourly N] [--keep-daily N] [--keep-weekly N] [--keep-monthly N] [GameID] ...""".format(command=command)
+
+    def get_help(self,command=None):
+        if command is None:
+            command = self.id
+        return get_builtin_help(self.id,command,self.get_help_synopsis(command),None,None)
+
+    def do_parse(self,cmd,argv):
+        try:
+            opts,args = getopt.getopt(argv,'aAfnk:',['all','active','finished','dry-run','keep=',
+                                                    'keep-hourly=','keep-daily=','keep-weekly=','keep-monthly='])
+        except getopt.GetoptError as err:
+            raise error.OptionError("Parsing options failed! ({error})".format(error=err.msg))
+
+        options = PruneBackupsOptions(self.application,cmd)
+        for o,a in opts:
+            if (o in ['-a','--active']):
+                options.add_active_games()
+            elif (o in ['-A','--all']):
+                options.add_all_games()
+            elif (o in ['-f','--finished']):
+                options.add_finished_games()
+            elif (o in ['-n','--dry-run']):
+                options.dry_run = True
+            elif (o in ['-k','--keep','--keep-hourly','--keep-daily','--keep-weekly','--keep-monthly']):
+                if o in ['-k','--keep']:
+                    rule = 'last'
+                else:
+                    rule = o[len('--keep-'):]
+                try:
+                    options.set_keep(rule,int(a))
+                except Exception as err:
+                    raise error.OptionError("Illegal value for \"{option}\"! ({message})".format(option=o,message=err))
+
+        for gid in args:
+            if not gid in self.application.games.game_ids:
+                raise error.OptionError("\"{game_id}\" is not a valid GameID!".format(game_id=gid))
+            options.add_game(self.application.games.get(gid))
+
+        if not options.games:
+            options.add_all_games()
+
+        return options
+
+    def do_execute(self,options:PruneBackupsOptions):
+        archivers = self.application.archivers
+        ret = 0
+        total = 0
+        for game in options.games:
+            try:
+                pruned = archivers.prune_backups(game,options.policy,dry_run=options.dry_run)
+            except Exception as err:
+                print("Pruning backups of game \"{game}\" failed! ({message})".format(game=game.game_name,message=err),
+                      file=sys.stderr)
+                ret = 1
+                continue
+
+            total += len(pruned)
+            if options.dry_run:
+                for backup in pruned:
+                    print("[{game_id}] {backup}".format(game_id=game.game_id,backup=os.path.basename(backup)))
+
+        if options.dry_run or self.application.config.verbose:
+            print("{count} backups {action}.".format(count=total,action=("would be deleted" if options.dry_run else "deleted")))
+        return ret
+
+
 COMMANDS=[
     (BackupGame,('backup',)),
     (RestoreGame,('restore',)),
+    (RebuildIndex,None),
+    (PruneBackups,None),
 ]
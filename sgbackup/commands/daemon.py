@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+# Author: Christian Moser
+# License: GPL
+# File: sgbackup/commands/daemon.py
+# Module: sgbackup.commands.daemon
+
+from ..command import Command,CommandOptions
+from ..game import Game
+from .. import error
+from ..help import get_builtin_help
+from ..watcher import create_watcher
+import os
+import sys
+import getopt
+import signal
+import time
+
+# Failed backups are retried after RETRY_DELAY seconds, doubling the delay on
+# every failure up to RETRY_MAX_DELAY seconds.
+RETRY_DELAY = 30.0
+RETRY_MAX_DELAY = 3600.0
+
+class DaemonOptions(CommandOptions):
+    def __init__(self,app,cmd):
+        CommandOptions.__init__(self,app,'daemon',cmd)
+
+        self.__games = []
+        self.__debounce = 10.0
+        self.__max_delay = 300.0
+        self.__interval = 60.0
+        self.__polling = False
+
+    @property
+    def games(self):
+        return self.__games
+
+    @property
+    def debounce(self):
+        return self.__debounce
+    @debounce.setter
+    def debounce(self,seconds:float):
+        if seconds < 0:
+            raise ValueError("\"debounce\" must not be negative!")
+        self.__debounce = seconds
+
+    @property
+    def max_delay(self):
+        return self.__max_delay
+    @max_delay.setter
+    def max_delay(self,seconds:float):
+        if seconds < 0:
+            raise ValueError("\"max_delay\" must not be negative!")
+        self.__max_delay = seconds
+
+    @property
+    def interval(self):
+        return self.__interval
+    @interval.setter
+    def interval(self,seconds:float):
+        if seconds <= 0:
+            raise ValueError("\"interval\" needs to be a positive number!")
+        self.__interval = seconds
+
+    @property
+    def polling(self):
+        return self.__polling
+    @polling.setter
+    def polling(self,b:bool):
+        self.__polling = b
+
+    def add_game(self,game:Game):
+        if game not in self.__games:
+            self.__games.append(game)
+
+    def add_finished_games(self):
+        for game in self.application.games.finished_games:
+            self.add_game(game)
+
+    def add_active_games(self):
+        for game in self.application.games.active_games:
+            self.add_game(game)
+
+    def add_all_games(self):
+        for game in self.application.games.games:
+            self.add_game(game)
+
+class Daemon(Command):
+    def __init__(self,app):
+        Command.__init__(self,app,'daemon','Backup games when their SaveGames change.')
+
+    def get_synopsis(self,command=None):
+        if command is None:
+            command = self.id
+
+        return """sgbackup {command} [-aAfp] [--active] [--all] [--finished] [--poll] [-d|--debounce SECONDS]
+    [-m|--max-delay SECONDS] [-i|--interval SECONDS] [GameID] ...""".format(command=command)
+
+    def get_help(self,command=None):
+        if command is None:
+            command = self.id
+
+        return get_builtin_help(self.id,command,self.get_help_synopsis(command),None,None)
+
+    def do_parse(self,cmd,argv):
+        try:
+            opts,args = getopt.getopt(argv,'aAfpd:m:i:',['active','all','finished','poll','debounce=','max-delay=','interval='])
+        except getopt.GetoptError as err:
+            raise error.OptionError("Parsing options failed! ({error})".format(error=err.msg))
+
+        options = DaemonOptions(self.application,cmd)
+        selected = bool(args)
+        for o,a in opts:
+            if (o in ['-a','--active']):
+                options.add_active_games()
+                selected = True
+            elif (o in ['-A','--all']):
+                options.add_all_games()
+                selected = True
+            elif (o in ['-f','--finished']):
+                options.add_finished_games()
+                selected = True
+            elif (o in ['-p','--poll']):
+                options.polling = True
+            elif (o in ['-d','--debounce']):
+                try:
+                    options.debounce = float(a)
+                except Exception as err:
+                    raise error.OptionError("Illegal value for DEBOUNCE! ({message})".format(message=err))
+            elif (o in ['-m','--max-delay']):
+                try:
+                    options.max_delay = float(a)
+                except Exception as err:
+                    raise error.OptionError("Illegal value for MAX_DELAY! ({message})".format(message=err))
+            elif (o in ['-i','--interval']):
+                try:
+                    options.interval = float(a)
+                except Exception as err:
+                    raise error.OptionError("Illegal value for INTERVAL! ({message})".format(message=err))
+
+        for gid in args:
+            if not self.application.games.has_game(gid):
+                raise error.OptionError("\"{game_id}\" is not a valid GameID!".format(game_id=gid))
+            options.add_game(self.application.games.get(gid))
+
+        if not selected:
+            options.add_active_games()
+
+        return options
+
+    def __on_sigterm(self,signum,frame):
+        raise KeyboardInterrupt()
+
+    def do_execute(self,options):
+        if not options.games:
+            print("No games to watch!",file=sys.stderr)
+            return 1
+
+        verbose = self.application.config.verbose
+        watcher = create_watcher(options.interval,options.polling)
+        games = {}
+        for game in options.games:
+            games[game.game_id] = game
+            watcher.add(game.game_id,os.path.join(game.savegame_root,game.savegame_dir))
+        print("[daemon] Watching {n} games ({watcher}).".format(n=len(games),watcher=type(watcher).__name__))
+
+        # game_id -> (time of the first change,time of the last change)
+        pending = {}
+        # game_id -> (number of failed backups,time of the next attempt)
+        retries = {}
+
+        def due_time(game_id):
+            first,last = pending[game_id]
+            due = min(last + options.debounce,first + options.max_delay)
+            if game_id in retries:
+                due = max(due,retries[game_id][1])
+            return due
+
+        old_sigterm = signal.signal(signal.SIGTERM,self.__on_sigterm)
+        try:
+            while True:
+                timeout = None
+                if pending:
+                    timeout = max(min(due_time(game_id) for game_id in pending) - time.monotonic(),0)
+
+                changed = watcher.read_changes(timeout)
+
+                now = time.monotonic()
+                for game_id in changed:
+                    if game_id in pending:
+                        pending[game_id] = (pending[game_id][0],now)
+                    else:
+                        pending[game_id] = (now,now)
+                        if verbose:
+                            print("[daemon] [{game_id}] SaveGames changed.".format(game_id=game_id))
+
+                ready = sorted(game_id for game_id in pending if due_time(game_id) <= now)
+                if not ready:
+                    continue
+                for game_id in ready:
+                    del pending[game_id]
+
+                failed = set(game.game_id for game in
+                             self.application.archivers.backup_games([games[game_id] for game_id in ready]))
+                now = time.monotonic()
+                for game_id in ready:
+                    if game_id not in failed:
+                        retries.pop(game_id,None)
+                        continue
+
+                    # keep the game pending, so the backup is retried even if the
+                    # SaveGames do not change again.
+                    attempts = retries.get(game_id,(0,0))[0] + 1
+                    delay = min(RETRY_DELAY * 2 ** (attempts - 1),RETRY_MAX_DELAY)
+                    retries[game_id] = (attempts,now + delay)
+                    if game_id not in pending:
+                        pending[game_id] = (now,now)
+                    print("[daemon] [{game_id}] Backup failed! Retrying in {delay:.0f} seconds.".format(
+                            game_id=game_id,delay=delay),
+                          file=sys.stderr)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            signal.signal(signal.SIGTERM,old_sigterm)
+            watcher.close()
+
+        ret = 0
+        if pending:
+            print("[daemon] Backing up {n} games with pending changes.".format(n=len(pending)))
+            failed = self.application.archivers.backup_games([games[game_id] for game_id in sorted(pending)])
+            for game in failed:
+                print("[daemon] [{game_id}] Backup failed! Changes are not backed up.".format(game_id=game.game_id),
+                      file=sys.stderr)
+            if failed:
+                ret = 1
+        print("[daemon] Stopped.")
+        return ret
+
+COMMANDS=[
+    (Daemon,None),
+]
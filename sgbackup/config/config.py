@@ -37,6 +37,8 @@ class Config(GObject.GObject):
         self.__app = None
         self.__keyfile = GLib.KeyFile.new()
         self.__configuration = {}
+        self.__variables = None
+        self.__variables_serial = 0
 
     def _real_initialize(self,app):
         def validate_pager(pager):
@@ -74,11 +76,39 @@ class Config(GObject.GObject):
                     'default': 0,
                     'validate': lambda x: (int(x) >= 0)
                 },
+                'keepHourly': {
+                    'type': 'integer',
+                    'default': 0,
+                    'validate': lambda x: (int(x) >= 0)
+                },
+                'keepDaily': {
+                    'type': 'integer',
+                    'default': 0,
+                    'validate': lambda x: (int(x) >= 0)
+                },
+                'keepWeekly': {
+                    'type': 'integer',
+                    'default': 0,
+                    'validate': lambda x: (int(x) >= 0)
+                },
+                'keepMonthly': {
+                    'type': 'integer',
+                    'default': 0,
+                    'validate': lambda x: (int(x) >= 0)
+                },
                 'backupDirectory': {
                     'type': 'string',
                     'default': os.path.join(self.user_home_dir,"SaveGameBackups"),
                     'validate': lambda x: os.path.isabs(x)
                 },
+                'skipUnchanged': {
+                    'type': 'boolean',
+                    'default': True
+                },
+                'fingerprintContent': {
+                    'type': 'boolean',
+                    'default': False
+                },
                 'processMax': {
                     'type': 'integer',
                     'default': os.cpu_count(),
@@ -109,8 +139,24 @@ class Config(GObject.GObject):
                     'type': 'integer',
                     'default': 9,
                     'validate': lambda x: ((x >= 0) and (x <= 9))
+                },
+                'threads': {
+                    'type': 'integer',
+                    'default': 1,
+                    'validate': lambda x: (x >= 0)
                 }
             },
+            'steam': {
+                'steamRoot': {
+                    'type': 'string',
+                    'default': '',
+                    'validate': lambda x: (not x or os.path.isabs(x))
+                },
+                'discoverLibraries': {
+                    'type': 'boolean',
+                    'default': True
+                },
+            },
             'commandGame': {
                 'addGameInteractive': {
                     'type': 'boolean',
@@ -486,8 +532,9 @@ class Config(GObject.GObject):
         (`int`)
 
         The total number of backups to keep. This should be a positive integer or `0`.
-        If this value is set to `0`, no backup versioning is done and all SvaeGameBackups
-        are being kept, which may result in using a lot of disk-space!
+        If this value and the *keep_hourly*, *keep_daily*, *keep_weekly* and
+        *keep_monthly* options are set to `0`, no backup versioning is done and all
+        SvaeGameBackups are being kept, which may result in using a lot of disk-space!
 
         *read write*
         """
@@ -496,6 +543,78 @@ class Config(GObject.GObject):
     def backup_versions(self,n):
         self.set_integer('sgbackup','backupVersions',n)
 
+    @GObject.Property(int)
+    def keep_hourly(self):
+        """
+        (`int`)
+
+        Keep the latest backup of each of the last *keep_hourly* hours that have a backup.
+        If this value is `0`, no hours are kept by this rule.
+        See also `Config.backup_versions`.
+
+        *read write*
+        """
+        return self.get_integer('sgbackup','keepHourly',self.configuration['sgbackup']['keepHourly']['default'])
+    @keep_hourly.setter
+    def keep_hourly(self,n):
+        if n < 0:
+            raise ValueError("\"keep_hourly\" needs to be a positive integer or 0!")
+        self.set_integer('sgbackup','keepHourly',n)
+
+    @GObject.Property(int)
+    def keep_daily(self):
+        """
+        (`int`)
+
+        Keep the latest backup of each of the last *keep_daily* days that have a backup.
+        If this value is `0`, no days are kept by this rule.
+        See also `Config.backup_versions`.
+
+        *read write*
+        """
+        return self.get_integer('sgbackup','keepDaily',self.configuration['sgbackup']['keepDaily']['default'])
+    @keep_daily.setter
+    def keep_daily(self,n):
+        if n < 0:
+            raise ValueError("\"keep_daily\" needs to be a positive integer or 0!")
+        self.set_integer('sgbackup','keepDaily',n)
+
+    @GObject.Property(int)
+    def keep_weekly(self):
+        """
+        (`int`)
+
+        Keep the latest backup of each of the last *keep_weekly* weeks that have a backup.
+        If this value is `0`, no weeks are kept by this rule.
+        See also `Config.backup_versions`.
+
+        *read write*
+        """
+        return self.get_integer('sgbackup','keepWeekly',self.configuration['sgbackup']['keepWeekly']['default'])
+    @keep_weekly.setter
+    def keep_weekly(self,n):
+        if n < 0:
+            raise ValueError("\"keep_weekly\" needs to be a positive integer or 0!")
+        self.set_integer('sgbackup','keepWeekly',n)
+
+    @GObject.Property(int)
+    def keep_monthly(self):
+        """
+        (`int`)
+
+        Keep the latest backup of each of the last *keep_monthly* months that have a backup.
+        If this value is `0`, no months are kept by this rule.
+        See also `Config.backup_versions`.
+
+        *read write*
+        """
+        return self.get_integer('sgbackup','keepMonthly',self.configuration['sgbackup']['keepMonthly']['default'])
+    @keep_monthly.setter
+    def keep_monthly(self,n):
+        if n < 0:
+            raise ValueError("\"keep_monthly\" needs to be a positive integer or 0!")
+        self.set_integer('sgbackup','keepMonthly',n)
+
     @GObject.Property
     def verbose(self):
         """
@@ -548,9 +667,8 @@ class Config(GObject.GObject):
 
         The maximum number of processes/threads to use for creating backup-archives.
 
-        Currently only the `WinRar` CommandArchvier makes use of this option.
-
-        * TODO: The functionality for use of this option in other archivers is to be implemented!
+        This is the default number of games backed up concurrently by the
+        *backup-game* command. The `WinRar` CommandArchiver also makes use of this option.
 
         *read write*
         """
@@ -561,6 +679,37 @@ class Config(GObject.GObject):
             raise ValueError('\"process_max\" needs to be a positive integer equal or greater than 0!')
         self.set_integer('sgbackup','processMax',max)
 
+    @GObject.Property(bool)
+    def skip_unchanged(self):
+        """
+        (`bool`)
+
+        Skip the backup of a game if its SaveGames did not change since the
+        last backup.
+
+        *read write*
+        """
+        return self.get_boolean('sgbackup','skipUnchanged',self.__configuration['sgbackup']['skipUnchanged']['default'])
+    @skip_unchanged.setter
+    def skip_unchanged(self,b:bool):
+        self.set_boolean('sgbackup','skipUnchanged',b)
+
+    @GObject.Property(bool)
+    def fingerprint_content(self):
+        """
+        (`bool`)
+
+        Include the contents of the SaveGame files when checking if the SaveGames
+        changed. If this option is not set, only the paths, sizes and modification
+        times of the files are compared.
+
+        *read write*
+        """
+        return self.get_boolean('sgbackup','fingerprintContent',self.__configuration['sgbackup']['fingerprintContent']['default'])
+    @fingerprint_content.setter
+    def fingerprint_content(self,b:bool):
+        self.set_boolean('sgbackup','fingerprintContent',b)
+
     def register_option(self,section:str,option:str,type:str,default=None,validate=None,**kwargs):
         """
         Registers a new option for configuration. A registered option can
@@ -985,6 +1134,7 @@ class Config(GObject.GObject):
         :type value: `str`
         """
         self.keyfile.set_value(section,key,value)
+        self.__section_changed(section)
 
     def set_boolean(self,section,key,value:bool):
         """
@@ -1076,6 +1226,7 @@ class Config(GObject.GObject):
         :type value: `str`
         """
         self.keyfile.set_string(section,key,value)
+        self.__section_changed(section)
 
     def set_string_list(self,section,key,value):
         """
@@ -1131,6 +1282,7 @@ class Config(GObject.GObject):
         """
         if self.has_option(section,key):
             self.keyfile.remove_key(section,key)
+            self.__section_changed(section)
     
     def remove_section(self,section):
         """
@@ -1143,6 +1295,7 @@ class Config(GObject.GObject):
         """
         if self.has_section(section):
             self.keyfile.remove_group(section)
+            self.__section_changed(section)
 
     def remove_group(self,group):
         """
@@ -1155,6 +1308,7 @@ class Config(GObject.GObject):
         """
         if self.has_section(group):
             self.keyfile.remove_group(group)
+            self.__section_changed(group)
 
     @GObject.Property
     def raw_variables(self):
@@ -1182,20 +1336,54 @@ class Config(GObject.GObject):
         * `USER_DOCUMENTS_DIR` - user documents directory.
         * `USER_HOME_DIR` - user home directory.
 
-        :returns: A `dict` containing the variables.
+        The variables are resolved once and cached until a variable or the
+        backup directory is changed. Call :func:`Config.invalidate_variables`
+        if the environment changed.
+
+        :returns: A `dict` containing the variables. The `dict` is a copy and may
+            be modified by the caller.
         """
-        vars = dict(os.environ)
+        if self.__variables is None:
+            vars = dict(os.environ)
 
-        vars.update(self.raw_variables)
+            vars.update(self.raw_variables)
 
-        vars.update({
-            "USER_HOME_DIR":self.user_home_dir,
-            "HOME":self.user_home_dir,
-            "USER_DOCUMENTS_DIR":self.user_documents_dir,
-            "DOCUMENTS": self.user_documents_dir,
-            "BACKUP_DIR": self.backup_dir
-        })
-        return vars
+            vars.update({
+                "USER_HOME_DIR":self.user_home_dir,
+                "HOME":self.user_home_dir,
+                "USER_DOCUMENTS_DIR":self.user_documents_dir,
+                "DOCUMENTS": self.user_documents_dir,
+                "BACKUP_DIR": self.backup_dir
+            })
+            self.__variables = vars
+        return dict(self.__variables)
+
+    @GObject.Property(int)
+    def variables_serial(self):
+        """
+        (`int`)
+
+        A counter that is incremented every time the variables are invalidated.
+        Use it to check if values resolved from :attr:`Config.variables` are
+        still valid.
+
+        *read only*
+        """
+        return self.__variables_serial
+
+    def invalidate_variables(self):
+        """
+        Drop the cached variables.
+
+        This is done automatically when variables or the backup directory are
+        changed through this class.
+        """
+        self.__variables = None
+        self.__variables_serial += 1
+
+    def __section_changed(self,section):
+        if section in ('variables','sgbackup'):
+            self.invalidate_variables()
     
     def get_variable(self,variable,default=None):
         """
@@ -1226,6 +1414,7 @@ class Config(GObject.GObject):
         :type value: `str`
         """
         self.keyfile.set_string('variables',variable,value)
+        self.invalidate_variables()
 
     def remove_variable(self,variable):
         """
@@ -1236,6 +1425,7 @@ class Config(GObject.GObject):
         """
         if self.has_option('variables',variable):
             self.keyfile.remove_key('variables',variable)
+            self.invalidate_variables()
 
     def save(self):
         """
@@ -1252,7 +1442,7 @@ class Config(GObject.GObject):
         **Do not call this method yourself!** Use the method :func:`Config.save` instead!
         """
         for sname,sect in self.configuration.items():
-            if sname not in ('sgbackup','zipfileArchiver','commandGame') and isinstance(sect,dict):
+            if sname not in ('sgbackup','zipfileArchiver','steam','commandGame') and isinstance(sect,dict):
                 for key,spec in sect.items():
                     if not isinstance(spec,dict):
                         continue
@@ -1334,7 +1524,7 @@ class Config(GObject.GObject):
         
         **Do not call thais method yourself!**
         """
-        pass
+        self.invalidate_variables()
 
     def destroy(self):
         """
@@ -66,3 +66,17 @@ def get_default_pager():
                 default_pager = "less"
 
     return default_pager
+
+def get_default_steam_root():
+    if PLATFORM_WIN32:
+        candidates = [os.path.join(os.environ.get('ProgramFiles(x86)','C:\\Program Files (x86)'),'Steam'),
+                      os.path.join(os.environ.get('ProgramFiles','C:\\Program Files'),'Steam')]
+    else:
+        candidates = [os.path.join(USER_HOME_DIR,'.steam','steam'),
+                      os.path.join(USER_HOME_DIR,'.local','share','Steam'),
+                      os.path.join(USER_HOME_DIR,'.var','app','com.valvesoftware.Steam','.local','share','Steam')]
+
+    for i in candidates:
+        if os.path.isdir(os.path.join(i,'steamapps')):
+            return os.path.realpath(i)
+    return None
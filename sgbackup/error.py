@@ -28,3 +28,19 @@ class GameConfError(Exception):
     @property
     def message(self):
         return self.args[0]
+
+class VdfError(Exception):
+    def __init__(self,message,*args):
+        Exception.__init__(self,message,*args)
+
+    @property
+    def message(self):
+        return self.args[0]
+
+class BackupError(Exception):
+    def __init__(self,message,*args):
+        Exception.__init__(self,message,*args)
+
+    @property
+    def message(self):
+        return self.args[0]
@@ -52,6 +52,11 @@ class Game(GObject.GObject):
         self.__variables={}
         if variables:
             self.__variables.update(variables)
+        self.__resolved_variables = None
+        self.__resolved_serial = -1
+        self.__resolved = {}
+        self.__gameconf = None
+        self.__is_dirty = True
 
     @staticmethod
     def new_from_gameconf(app,gameconf:GLib.KeyFile):
@@ -107,7 +112,10 @@ class Game(GObject.GObject):
             for var in gameconf.get_keys(VARIABLES_GROUP)[0]:
                 kwargs['variables'][var] = gameconf.get_string(VARIABLES_GROUP,var)
 
-        return Game(app,game_id,**kwargs)
+        game = Game(app,game_id,**kwargs)
+        game.__gameconf = gameconf
+        game.__is_dirty = False
+        return game
         
     @GObject.Property
     def application(self):
@@ -116,6 +124,13 @@ class Game(GObject.GObject):
     @GObject.Property
     def is_destroyed(self):
         return (self.__app is None)
+
+    @GObject.Property(bool)
+    def is_dirty(self):
+        """
+        `True` if the game was changed since it was loaded or saved.
+        """
+        return self.__is_dirty
     
     @GObject.Property
     def id(self):
@@ -127,6 +142,7 @@ class Game(GObject.GObject):
             raise ValueError("\"id\" must not be an empty string!")
         old_id = self.__id
         self.__id = id
+        self.__is_dirty = True
         self.emit('id-changed',old_id)
         
     @GObject.Property
@@ -138,6 +154,7 @@ class Game(GObject.GObject):
             raise ValueError("\"game_id\" must not be an empty string!")
         old_id = self.__id
         self.__id = id
+        self.__is_dirty = True
         self.emit('id-changed',old_id)
 
     @GObject.Property(str)
@@ -145,14 +162,16 @@ class Game(GObject.GObject):
         return self.__name
     @game_name.setter
     def game_name(self,name:str):
-        self.__name = name
+        if name != self.__name:
+            self.__name = name
+            self.__is_dirty = True
 
     @GObject.Property
     def name(self):
         return self.__name
     @name.setter
     def name(self,name:str):
-        self.__name = name
+        self.game_name = name
         
     @GObject.Property
     def savegame_name(self):
@@ -163,6 +182,7 @@ class Game(GObject.GObject):
             return
         
         old_sgname = self.__savegame_name
+        self.__is_dirty = True
         
         if (os.path.isdir(self.backup_dir)):
             os.rename(self.backup_dir,os.path.join(self.application.config.backup_dir,sgname))
@@ -186,11 +206,13 @@ class Game(GObject.GObject):
         return self.__savegame_root
     @GObject.Property
     def savegame_root(self):
-        return Template(self.__savegame_root).safe_substitute(self.variables)
+        return self.__substitute(self.__savegame_root)
     
     @savegame_root.setter
     def savegame_root(self,sgroot:str):
-        self.__savegame_root = sgroot
+        if sgroot != self.__savegame_root:
+            self.__savegame_root = sgroot
+            self.__is_dirty = True
 
     @GObject.Property
     def savegame_dir_template(self):
@@ -198,10 +220,12 @@ class Game(GObject.GObject):
     
     @GObject.Property
     def savegame_dir(self):
-        return Template(self.__savegame_dir).safe_substitute(self.variables)
+        return self.__substitute(self.__savegame_dir)
     @savegame_dir.setter
     def savegame_dir(self,sgdir:str):
-        self.__savegame_dir = sgdir
+        if sgdir != self.__savegame_dir:
+            self.__savegame_dir = sgdir
+            self.__is_dirty = True
 
     @GObject.Property
     def installdir(self):
@@ -210,13 +234,19 @@ class Game(GObject.GObject):
     def installdir(self,idir:str):
         if idir and not os.path.isabs(idir):
             raise ValueError("\"installdir\" needs to be an empty string or an absolute path!")
+        if idir == self.__installdir:
+            return
         self.__installdir = idir
+        self.__is_dirty = True
+        self.invalidate_variables()
 
     @GObject.Property
     def is_finished(self):
         return self.__is_finished
     @is_finished.setter
     def is_finished(self,b:bool):
+        if bool(b) != bool(self.__is_finished):
+            self.__is_dirty = True
         self.__is_finished = b
 
     @GObject.Property
@@ -241,6 +271,9 @@ class Game(GObject.GObject):
             self.__steam_appid = None
         else:
             self.__steam_appid = int(appid)
+        if self.__steam_appid != old_id:
+            self.__is_dirty = True
+        self.invalidate_variables()
 
         self.emit('steam-appid-changed',old_id)
 
@@ -249,15 +282,10 @@ class Game(GObject.GObject):
         return self.__variables
     @GObject.Property
     def variables(self):
-        vars = self.application.config.variables
-        vars.update(self.__variables)
-        vars['INSTALLDIR'] = self.installdir
-        vars['STEAM_APPID'] = str(self.steam_appid)
-        
-        return vars
+        return dict(self.__get_variables())
     @variables.setter
     def variables(self,variables:dict):
-        vars = self.application.config.variables
+        vars = {}
         for key,value in variables.items():
             if key == 'INSTALLDIR':
                 self.installdir = value
@@ -266,7 +294,40 @@ class Game(GObject.GObject):
             else:
                 raise TypeError("variable names and variable values have to be strings!")
             
+        if vars != self.__variables:
+            self.__is_dirty = True
         self.__variables = vars
+        self.invalidate_variables()
+
+    def __get_variables(self):
+        # The resolved variables are cached until the game variables change or
+        # the configuration variables are invalidated.
+        serial = self.application.config.variables_serial
+        if self.__resolved_variables is None or self.__resolved_serial != serial:
+            vars = self.application.config.variables
+            vars.update(self.__variables)
+            vars['INSTALLDIR'] = self.installdir
+            vars['STEAM_APPID'] = str(self.steam_appid)
+            self.__resolved = {}
+            self.__resolved_variables = vars
+            self.__resolved_serial = serial
+        return self.__resolved_variables
+
+    def __substitute(self,template):
+        vars = self.__get_variables()
+        try:
+            return self.__resolved[template]
+        except KeyError:
+            value = Template(template).safe_substitute(vars)
+            self.__resolved[template] = value
+            return value
+
+    def invalidate_variables(self):
+        """
+        Drop the cached variables and the resolved savegame directories.
+        """
+        self.__resolved_variables = None
+        self.__resolved = {}
 
     @GObject.Property
     def gameconf_filename(self):
@@ -313,29 +374,36 @@ class Game(GObject.GObject):
         return False
 
     def get_variable(self,name:str):
-        variables = self.application.config.variables
-        variables.update(self.__variables)
-        variables.update('INSTALLDIR',self.installdir)
+        variables = self.__get_variables()
         if name in variables:
             return variables[name]
         return ""
     
     def set_variable(self,name:str,value=None):
         if value is None:
-            self.__variables[name] = ""
-        elif isinstance(value,str):
+            value = ""
+        elif not isinstance(value,str):
+            value = str(value)
+        if self.__variables.get(name) != value:
             self.__variables[name] = value
-        else:
-            self.__variables[name] = str(value)
+            self.__is_dirty = True
+        self.invalidate_variables()
 
     def remove_variable(self,name:str):
         if name in self.__variables:
             del self.__variables[name]
+            self.__is_dirty = True
+            self.invalidate_variables()
 
     def export_gameconf(self):
-        gameconf = GLib.KeyFile.new()
-        if os.path.isfile(self.gameconf_filename):
-            gameconf.load_from_file(self.gameconf_filename,0)
+        # The gameconf the game was loaded from is reused, so the file does
+        # not need to be read again.
+        if self.__gameconf is not None:
+            gameconf = self.__gameconf
+        else:
+            gameconf = GLib.KeyFile.new()
+            if os.path.isfile(self.gameconf_filename):
+                gameconf.load_from_file(self.gameconf_filename,0)
         self.emit('export-gameconf',gameconf)
         return gameconf
         
@@ -351,10 +419,18 @@ class Game(GObject.GObject):
         gc.set_string(gsect,'savegameBackupDirectory',self.savegame_dir_template)
         if (self.installdir):
             gc.set_string(gsect,'installdir',self.installdir)
+        elif 'installdir' in gc.get_keys(gsect)[0]:
+            gc.remove_key(gsect,'installdir')
         if (self.steam_appid):
             gc.set_int64(gsect,'steamAppID',self.steam_appid)
+        elif 'steamAppID' in gc.get_keys(gsect)[0]:
+            gc.remove_key(gsect,'steamAppID')
         gc.set_boolean(gsect,'isFinished',self.is_finished)
 
+        if gc.has_group(vsect):
+            for var in gc.get_keys(vsect)[0]:
+                if var not in self.raw_variables:
+                    gc.remove_key(vsect,var)
         for var,value in self.raw_variables.items():
             gc.set_string(vsect,var,value)
 
@@ -377,8 +453,8 @@ class Game(GObject.GObject):
         })
         d.update(self.__kwds)
 
-    def backup(self):
-        self.application.archivers.backup(self)
+    def backup(self,force=False):
+        return self.application.archivers.backup(self,force=force)
 
     def restore(self,backupfile):
         self.application.archivers.restore(self,backupfile)
@@ -392,7 +468,14 @@ class Game(GObject.GObject):
     # Game.save()
 
     def do_save(self,gc:GLib.KeyFile):
-        gc.save_to_file(self.gameconf_filename)
+        filename = self.gameconf_filename
+        tmp_file = filename + '.tmp'
+        data = gc.to_data()[0]
+        with open(tmp_file,'w',encoding='utf-8') as ofile:
+            ofile.write(data)
+        os.replace(tmp_file,filename)
+        self.__gameconf = gc
+        self.__is_dirty = False
     # Game.do_save()
 
     def destroy(self):
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# Author: Christian Moser
+# License: GPL
+# File: sgbackup/gameindex.py
+# Module: sgbackup.gameindex
+
+import json
+import os
+import sys
+
+INDEX_VERSION = 1
+
+class GameconfIndex(object):
+    """
+    A compact index of the gameconf files.
+
+    For every gameconf file the index stores the modification time and size of
+    the file together with the *game_id*, *steam_appid*, *is_finished* and
+    *savegame_name* of the game. Files are only parsed again if their
+    modification time or size changed. Files that could not be loaded are not
+    indexed, so they are parsed (and reported) again on every start.
+
+    The index is used by :class:`sgbackup.gamemanager.GameManager`. You should
+    not need to use it yourself.
+
+    :param filename: The file the index is stored in.
+    :type filename: `str`
+    """
+    def __init__(self,filename):
+        self.__filename = filename
+        self.__gameconf_dir = None
+        self.__entries = {}
+        self.__is_changed = False
+
+    @property
+    def filename(self):
+        """
+        The file the index is stored in.
+
+        :type: `str`
+        """
+        return self.__filename
+
+    @property
+    def entries(self):
+        """
+        The index entries as a `dict` mapping the gameconf filenames to
+        entry dicts.
+
+        :type: `dict`
+        """
+        return self.__entries
+
+    def load(self,gameconf_dir):
+        """
+        Load the index from disk. If the index does not exist, can not be read
+        or was created for another gameconf directory, the index is empty.
+
+        :param gameconf_dir: The gameconf directory.
+        :type gameconf_dir: `str`
+        """
+        self.__gameconf_dir = gameconf_dir
+        self.__entries = {}
+        self.__is_changed = True
+        if not os.path.isfile(self.filename):
+            return
+        try:
+            with open(self.filename,'r',encoding='utf-8') as ifile:
+                data = json.load(ifile)
+        except (OSError,ValueError):
+            return
+        if (not isinstance(data,dict)
+                or data.get('version') != INDEX_VERSION
+                or data.get('gameconf_dir') != gameconf_dir
+                or not isinstance(data.get('entries'),dict)):
+            return
+        self.__entries = data['entries']
+        self.__is_changed = False
+
+    def scan(self):
+        """
+        Compare the index with the gameconf directory. Entries of files that
+        do not exist anymore are removed.
+
+        :returns: (`list`) - A list of (`filename`,`stat`) tuples of the gameconf
+            files that are new or changed since they were indexed.
+        """
+        try:
+            filenames = sorted(i for i in os.listdir(self.__gameconf_dir) if i.endswith('.game'))
+        except OSError:
+            filenames = []
+
+        changed = []
+        seen = set()
+        for i in filenames:
+            filename = os.path.join(self.__gameconf_dir,i)
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+            seen.add(filename)
+            entry = self.__entries.get(filename)
+            if (entry is None
+                    or entry.get('mtime_ns') != st.st_mtime_ns
+                    or entry.get('size') != st.st_size):
+                changed.append((filename,st))
+
+        for filename in [i for i in self.__entries.keys() if i not in seen]:
+            del self.__entries[filename]
+            self.__is_changed = True
+        return changed
+
+    def update(self,filename,st,game):
+        """
+        Set the index entry of a gameconf file.
+
+        :param filename: The gameconf file.
+        :type filename: `str`
+        :param st: The :func:`os.stat` result of the file when it was loaded.
+        :param game: The game loaded from the file.
+        :type game: :class:`sgbackup.game.Game`
+        """
+        self.__entries[filename] = {
+            'mtime_ns': st.st_mtime_ns,
+            'size': st.st_size,
+            'game_id': game.game_id,
+            'steam_appid': game.steam_appid or 0,
+            'is_finished': bool(game.is_finished),
+            'savegame_name': game.savegame_name,
+            'is_valid': bool(game.is_valid),
+        }
+        self.__is_changed = True
+
+    def remove(self,filename):
+        """
+        Remove the index entry of a gameconf file.
+
+        :param filename: The gameconf file.
+        :type filename: `str`
+        """
+        if filename in self.__entries:
+            del self.__entries[filename]
+            self.__is_changed = True
+
+    def save(self):
+        """
+        Write the index to disk if it was changed.
+        """
+        if not self.__is_changed:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.filename),exist_ok=True)
+            tmp_file = self.filename + '.tmp'
+            with open(tmp_file,'w',encoding='utf-8') as ofile:
+                json.dump({
+                    'version': INDEX_VERSION,
+                    'gameconf_dir': self.__gameconf_dir,
+                    'entries': self.__entries
+                },ofile,separators=(',',':'))
+            os.replace(tmp_file,self.filename)
+            self.__is_changed = False
+        except OSError as err:
+            print("Unable to write gameconf index \"{filename}\"! ({message})".format(
+                    filename=self.filename,
+                    message=str(err)),
+                file=sys.stderr)
@@ -7,9 +7,21 @@
 from gi.repository import GObject,GLib
 import sys
 import os
+import types
+from concurrent.futures import ThreadPoolExecutor
 from .game import Game
+from .gameindex import GameconfIndex
 
 class GameManager(GObject.GObject):
+    """
+    The GameManager holds the games of the application.
+
+    The gameconf files are indexed in *gameconf-index.json* in the user data
+    directory (see :class:`sgbackup.gameindex.GameconfIndex`). The game ids,
+    steam appids and the finished state are served from the index, a
+    :class:`sgbackup.game.Game` instance is only created when the game is
+    requested.
+    """
     __name__ = "sgbackup.game.GameManager"
     __gsignals__ = {
         'add': (GObject.SIGNAL_RUN_FIRST,None,(Game,)),
@@ -21,7 +33,8 @@ class GameManager(GObject.GObject):
         GObject.GObject.__init__(self)
 
         self.__games={}
-        self.__steam_games={}
+        self.__index={}
+        self.__steam_index={}
         self.__app = None
 
     def _real_initialize(self,app):
@@ -36,82 +49,233 @@ class GameManager(GObject.GObject):
     def is_initialized(self):
         return (self.__app is not None)
     
+    @staticmethod
+    def __parse_gameconf(filename):
+        gc = GLib.KeyFile.new()
+        gc.load_from_file(filename,0)
+        return gc
+
+    @staticmethod
+    def __try_parse_gameconf(filename):
+        try:
+            return GameManager.__parse_gameconf(filename)
+        except Exception as err:
+            return err
+
+    def __read_gameconf(self,filename):
+        return Game.new_from_gameconf(self.application,self.__parse_gameconf(filename))
+
+    def __parse_gameconfs(self,filenames):
+        """
+        Read and parse the gameconf files in a thread pool.
+
+        Only the :class:`GLib.KeyFile` instances are created in the worker
+        threads, the :class:`sgbackup.game.Game` instances are created by the
+        caller in the main thread.
+
+        :param filenames: The gameconf files to parse.
+        :type filenames: `list(str)`
+        :returns: (`list`) - The parsed `GLib.KeyFile` or the raised exception
+            for each file in the order of *filenames*.
+        """
+        if len(filenames) < 2:
+            return [self.__try_parse_gameconf(i) for i in filenames]
+
+        max_workers = min(len(filenames),max(self.application.config.process_max,1) * 4)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self.__try_parse_gameconf,filenames))
+
     def __load_games(self):
-        for i in os.listdir(self.application.config.gameconf_dir):
-            if i.endswith('.game'):
-                try:
-                    gc = GLib.KeyFile.new()
-                    gc.load_from_file(os.path.join(self.application.config.gameconf_dir,i,),0)
-                    game = Game.new_from_gameconf(self.application,gc)
-                    if game.is_valid:
-                        self.__games[game.game_id] = game
-                        game._gamemanager_id_changed = game.connect('id-changed',self._on_game_id_changed)
-                        if game.steam_appid:
-                            self.__steam_games[game.steam_appid] = game
-                            game._gamemanager_steam_appid_changed = game.connect('steam-appid-changed',self._on_steam_appid_changed)
-                except Exception as err:
-                    print("Unable to load gameconf \"{filename}\"! ({message})".format(
-                            filename=os.path.join(self.application.config.gameconf_dir,i),
-                            message=str(err)
-                        ),
-                        file=sys.stderr)
+        config = self.application.config
+        index = GameconfIndex(os.path.join(config.user_data_dir,'gameconf-index.json'))
+        index.load(config.gameconf_dir)
+
+        loaded = {}
+        changed = index.scan()
+        keyfiles = self.__parse_gameconfs([filename for filename,st in changed])
+        for (filename,st),gc in zip(changed,keyfiles):
+            try:
+                if isinstance(gc,Exception):
+                    raise gc
+                game = Game.new_from_gameconf(self.application,gc)
+                index.update(filename,st,game)
+                loaded[filename] = game
+            except Exception as err:
+                index.remove(filename)
+                print("Unable to load gameconf \"{filename}\"! ({message})".format(
+                        filename=filename,
+                        message=str(err)
+                    ),
+                    file=sys.stderr)
+        index.save()
+
+        for filename,entry in sorted(index.entries.items()):
+            if not entry.get('is_valid') or 'game_id' not in entry:
+                continue
+
+            game_id = entry['game_id']
+            self.__index[game_id] = {
+                'filename': filename,
+                'steam_appid': entry['steam_appid'],
+                'is_finished': entry['is_finished'],
+                'savegame_name': entry['savegame_name'],
+            }
+            if filename in loaded:
+                self.__games[game_id] = loaded[filename]
+                self.__connect_game(loaded[filename])
+            if entry['steam_appid']:
+                self.__steam_index[entry['steam_appid']] = game_id
     # GameManager.__load_games()
+
+    def __connect_game(self,game):
+        if not hasattr(game,'_gamemanager_id_changed'):
+            game._gamemanager_id_changed = game.connect('id-changed',self._on_game_id_changed)
+        if not hasattr(game,'_gamemanager_steam_appid_changed'):
+            game._gamemanager_steam_appid_changed = game.connect('steam-appid-changed',self._on_steam_appid_changed)
+
+    def __index_game(self,game):
+        self.__index[game.game_id] = {
+            'filename': game.gameconf_filename,
+            'steam_appid': game.steam_appid or 0,
+            'is_finished': game.is_finished,
+            'savegame_name': game.savegame_name,
+        }
+
+    def __is_finished(self,game_id):
+        if game_id in self.__games:
+            return self.__games[game_id].is_finished
+        return self.__index[game_id]['is_finished']
+
+    def __get_games(self,game_ids):
+        games = []
+        for game_id in game_ids:
+            try:
+                games.append(self.get(game_id))
+            except LookupError as err:
+                print(err,file=sys.stderr)
+        return games
         
     @GObject.Property
     def game_ids(self):
-        gids=[]
-
-        for i in self.__games.keys():
-            gids.append(i)
-
+        gids = list(self.__index.keys())
         gids.sort()
         return gids
     
     @GObject.Property
     def games(self):
-        return self.__games.values()
+        return self.__get_games(self.game_ids)
     
     @GObject.Property
     def steam_games(self):
-        return self.__steam_games.values()
+        return self.__get_games(list(self.__steam_index.values()))
     
     @GObject.Property
     def steam_ids(self):
-        return self.__steam_games.keys()
+        return self.__steam_index.keys()
+
+    @GObject.Property
+    def steam_index(self):
+        """
+        A read-only mapping of the Steam appids to the game ids of the
+        registered Steam games.
+        (`types.MappingProxyType`)
+        """
+        return types.MappingProxyType(self.__steam_index)
+
+    def get_steam_game(self,appid:int):
+        """
+        Get the game registered for a Steam appid.
+
+        :param appid: The Steam appid.
+        :type appid: `int`
+        :returns: (:class:`sgbackup.game.Game`) - The game.
+        :raises LookupError: If no game is registered for *appid* or the game
+            can not be loaded.
+        """
+        try:
+            game_id = self.__steam_index[appid]
+        except KeyError:
+            raise LookupError("No game registered for Steam appid {}!".format(appid))
+        return self.get(game_id)
     
     @GObject.Property
     def steam_items(self):
-        return dict(self.__steam_games).items()
+        return dict((game.steam_appid,game) for game in self.steam_games).items()
     
     @GObject.Property
     def finished_game_ids(self):
-        gids =  [gid for gid,game in self.__games.items() if game.is_finished]
+        gids =  [gid for gid in self.__index.keys() if self.__is_finished(gid)]
         gids.sort()
         return gids
     
     @GObject.Property
     def finished_games(self):
-        return [game for game in self.__games.values() if game.is_finished]
+        return self.__get_games(self.finished_game_ids)
     
     @GObject.Property
     def active_game_ids(self):
-        gids = [gid for gid,game in self.__games.items() if game.is_active]
+        gids = [gid for gid in self.__index.keys() if not self.__is_finished(gid)]
         gids.sort()
         return gids
     
     @GObject.Property
     def active_games(self):
-        return [game for game in self.__games.values() if game.is_active]
+        return self.__get_games(self.active_game_ids)
     
     def has_game(self,game_id:str):
-        return (game_id in self.__games)
+        return (game_id in self.__index)
     
     def get(self,game_id:str):
         try:
             return self.__games[game_id]
-        except:
+        except KeyError:
+            pass
+
+        try:
+            entry = self.__index[game_id]
+        except KeyError:
             raise LookupError("Unable to lookup game with id \"{}\"!".format(game_id))
+
+        try:
+            game = self.__read_gameconf(entry['filename'])
+        except Exception as err:
+            raise LookupError("Unable to load gameconf \"{filename}\"! ({message})".format(
+                filename=entry['filename'],
+                message=str(err)))
+
+        self.__games[game_id] = game
+        self.__connect_game(game)
+        return game
         
+    def save_games(self,games=None):
+        """
+        Write the gameconf files of the changed games in one batch. Games that
+        were not changed since they were loaded or saved are skipped. Every
+        file is written to a temporary file first, which is then renamed.
+
+        :param games: The games to save. If `None`, all loaded games are
+            saved.
+        :type games: `list(sgbackup.game.Game)`
+        :returns: (`list`) - The games that were written.
+        """
+        if games is None:
+            games = list(self.__games.values())
+
+        saved = []
+        for game in games:
+            if not game.is_dirty:
+                continue
+            try:
+                game.save()
+                saved.append(game)
+            except Exception as err:
+                print("Unable to save gameconf \"{filename}\"! ({message})".format(
+                        filename=game.gameconf_filename,
+                        message=str(err)
+                    ),
+                    file=sys.stderr)
+        return saved
+
     def add(self,game:Game):
         if not game.is_valid:
             raise ValueError("Game instance is not valid!")
@@ -119,36 +283,35 @@ class GameManager(GObject.GObject):
 
     def do_add(self,game):
         self.__games[game.id] = game
-        if not hasattr(game,'_gamemanager_id_changed'):
-            game._gamemanager_id_changed = self.game.connect('id-changed',self._on_game_id_changed)
-
-        if not hasattr(game,'_gamemanager_steam_appid_changed'):
-            game._gamemanager_steam_appid_changed = self.game.connect('steam-appid-changed',self._on_steam_appid_changed)
+        self.__index_game(game)
+        self.__connect_game(game)
 
         if game.steam_appid:
-            self.__steam_games[game.steam_appid] = game
+            self.__steam_index[game.steam_appid] = game.game_id
             
 
     def remove(self,game):
         if isinstance(game,Game):
-            if game.id in self.__games:
+            if game.id in self.__index:
                 self.emit('remove',game)
         elif isinstance(game,str):
-            if game in self.__games:
-                self.emit('remove',self.__games[game])
+            if game in self.__index:
+                self.emit('remove',self.get(game))
     
     def do_remove(self,game):
         if game.id in self.__games:
             del self.__games[game.id]
-        if hasattr(game,'_gamemanager_game_id_changed'):
+        if game.id in self.__index:
+            del self.__index[game.id]
+        if hasattr(game,'_gamemanager_id_changed'):
             game.disconnect(game._gamemanager_id_changed)
             del game._gamemanager_id_changed
         
 
-        if game.steam_appid and game.steam_appid in self.__steam_games:
-            del self.__steam_games[game.steam_appid]
+        if game.steam_appid and game.steam_appid in self.__steam_index:
+            del self.__steam_index[game.steam_appid]
             
-        if hasattr(game._gamemanager_steam_appid_changed):
+        if hasattr(game,'_gamemanager_steam_appid_changed'):
             game.disconnect(game._gamemanager_steam_appid_changed)
             del game._gamemanager_steam_appid_changed
         game.destroy()
@@ -156,13 +319,17 @@ class GameManager(GObject.GObject):
     def _on_game_id_changed(self,game,old_id):
         if old_id in self.__games:
             del self.__games[old_id]
+        if old_id in self.__index:
+            del self.__index[old_id]
         self.add(game)
 
     def _on_steam_appid_changed(self,game,old_appid):
-        if (old_appid in self.__steam_games):
-            del self.__steam_games[old_appid]
+        if (old_appid in self.__steam_index):
+            del self.__steam_index[old_appid]
         if (game.steam_appid):
-            self.__steam_games[game.steam_appid] = game
+            self.__steam_index[game.steam_appid] = game.game_id
+        if game.game_id in self.__index:
+            self.__index[game.game_id]['steam_appid'] = game.steam_appid or 0
 
     def destroy(self):
         self.emit('destroy')
@@ -172,6 +339,8 @@ class GameManager(GObject.GObject):
             game.destroy()
         
         self.__games = {}
+        self.__index = {}
+        self.__steam_index = {}
         self.__app = None
 
 #GameManager
@@ -1,8 +1,9 @@
 from sgbackup.plugin import Plugin
 
-from .settings import PLUGIN_ID,get_config_options,OPTIONS
+from .settings import PLUGIN_ID,get_config_options,OPTIONS,HASHLIB_ALGORITHMS
 from .commands import COMMANDS
-from .checksum import create_checksums
+from .checksum import create_checksums,get_engine
+from .cache import VerifyCache
 
 import os
 
@@ -13,6 +14,7 @@ class ChecksumPlugin(Plugin):
     def __init__(self,app):
         Plugin.__init__(self,app,PLUGIN_ID,"Checksum Plugin","Creating and checking checksum files.")
         self.__commands=[]
+        self.__digest_algorithms=[]
 
     def __on_archivers_backup(self,manager,archiver,game,filename):
         create_checksums(self.application,game,filename)
@@ -26,6 +28,13 @@ class ChecksumPlugin(Plugin):
                 if config.verbose:
                     print("[DELETE] {file}".format(file=csum_file))
 
+        if config.get_boolean(PLUGIN_ID,'verifyCache'):
+            cache = VerifyCache(self.application)
+            try:
+                cache.remove(filename)
+            finally:
+                cache.close()
+
     def do_enable(self):
         if not self.application.config.has_section(PLUGIN_ID):
             opts = get_config_options()
@@ -48,6 +57,14 @@ class ChecksumPlugin(Plugin):
             setattr(am,self._archivers_backup_slot,am.connect('backup',self.__on_archivers_backup))
             setattr(am,self._archivers_delete_backup_slot,am.connect('delete-backup',self.__on_archivers_delete_backup))
 
+            # let the archivers compute the checksums while writing the backups
+            if get_engine(self.application) == 'hashlib':
+                for csum in self.application.config.get_string_list(PLUGIN_ID,'checksums'):
+                    algorithm = HASHLIB_ALGORITHMS[csum][0]
+                    if algorithm not in am.digest_algorithms:
+                        am.add_digest_algorithm(algorithm)
+                        self.__digest_algorithms.append(algorithm)
+
     def do_disable(self):
         for command in self.__commands:
             self.application.commands.remove(command)
@@ -60,5 +77,8 @@ class ChecksumPlugin(Plugin):
         if hasattr(am,self._archivers_delete_backup_slot):
             am.disconnect(getattr(am,self._archivers_delete_backup_slot))
             delattr(am,self._archivers_delete_backup_slot)
+        for algorithm in self.__digest_algorithms:
+            am.remove_digest_algorithm(algorithm)
+        self.__digest_algorithms = []
 
 PLUGIN = ChecksumPlugin
\ No newline at end of file
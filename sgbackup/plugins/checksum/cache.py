@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import threading
+import time
+from .settings import PLUGIN_ID
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS verified (
+    path TEXT NOT NULL,
+    algorithm TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    verified REAL NOT NULL,
+    PRIMARY KEY (path,algorithm)
+);
+"""
+
+class VerifyCache(object):
+    """! @brief Cache of successful checksum verifications.
+        A backup is identified by its path, size, modification time and inode.
+        A cached verification is valid as long as the backup and the expected
+        digest did not change and it is not older than "checksum.reverifyDays".
+        @arg app Application instance.
+    """
+    def __init__(self,app):
+        self.__app = app
+        self.__lock = threading.Lock()
+        self.__db = None
+        days = app.config.get_integer(PLUGIN_ID,'reverifyDays')
+        if days and days > 0:
+            self.__max_age = days * 86400
+        else:
+            self.__max_age = None
+
+    @property
+    def filename(self):
+        return os.path.join(self.__app.config.user_data_dir,'checksum-verify.sqlite')
+
+    def __get_db(self):
+        if self.__db is None:
+            os.makedirs(os.path.dirname(self.filename),exist_ok=True)
+            self.__db = sqlite3.connect(self.filename,check_same_thread=False)
+            self.__db.executescript(_SCHEMA)
+            self.__db.commit()
+        return self.__db
+
+    def is_verified(self,path,stat,algorithm,digest):
+        """! @brief Check if a backup was verified before.
+            @arg path The backup file.
+            @arg stat The os.stat() result of the backup file.
+            @arg algorithm The checksum name.
+            @arg digest The expected digest.
+            @return True if the cached verification is still valid.
+        """
+        with self.__lock:
+            row = self.__get_db().execute(
+                "SELECT size,mtime_ns,inode,digest,verified FROM verified WHERE path=? AND algorithm=?",
+                (path,algorithm)).fetchone()
+        if row is None:
+            return False
+        size,mtime_ns,inode,cached_digest,verified = row
+        if (size != stat.st_size
+                or mtime_ns != stat.st_mtime_ns
+                or inode != stat.st_ino
+                or cached_digest != digest):
+            return False
+        if self.__max_age is not None and (time.time() - verified) > self.__max_age:
+            return False
+        return True
+
+    def set_verified(self,path,stat,algorithm,digest):
+        """! @brief Record a successful verification.
+            @arg path The backup file.
+            @arg stat The os.stat() result of the backup file.
+            @arg algorithm The checksum name.
+            @arg digest The verified digest.
+        """
+        with self.__lock:
+            db = self.__get_db()
+            db.execute("INSERT OR REPLACE INTO verified (path,algorithm,size,mtime_ns,inode,digest,verified) VALUES (?,?,?,?,?,?,?)",
+                       (path,algorithm,stat.st_size,stat.st_mtime_ns,stat.st_ino,digest,time.time()))
+            db.commit()
+
+    def remove(self,path):
+        """! @brief Remove all cached verifications of a backup.
+            @arg path The backup file.
+        """
+        with self.__lock:
+            db = self.__get_db()
+            db.execute("DELETE FROM verified WHERE path=?",(path,))
+            db.commit()
+
+    def close(self):
+        with self.__lock:
+            if self.__db is not None:
+                self.__db.close()
+                self.__db = None
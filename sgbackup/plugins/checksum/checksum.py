@@ -1,83 +1,353 @@
 import subprocess
+import hashlib
 import os
-from .settings import PLUGIN_ID,CHECKSUMS
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .settings import PLUGIN_ID,CHECKSUMS,HASHLIB_ALGORITHMS
+from .cache import VerifyCache
 import shlex
 
-def create_checksums(app,game,filename):
+_TAG_LINE = re.compile(r'^\\?(?P<tag>[A-Za-z0-9-]+) \((?P<file>.*)\) = (?P<digest>[0-9a-fA-F]+)$')
+_PLAIN_LINE = re.compile(r'^\\?(?P<digest>[0-9a-fA-F]+) [ *](?P<file>.*)$')
+
+def get_engine(app):
+    """! @brief Get the checksum engine.
+        @arg app Application instance.
+        @return "hashlib" or "command"
+    """
+    return app.config.get_string(PLUGIN_ID,'engine')
+
+def _escape_filename(filename):
+    # GNU coreutils escapes backslashes and newlines and marks the line with a
+    # leading backslash.
+    if '\\' in filename or '\n' in filename:
+        return (True,filename.replace('\\','\\\\').replace('\n','\\n'))
+    return (False,filename)
+
+def _unescape_filename(filename):
+    return filename.replace('\\n','\n').replace('\\\\','\\')
+
+def hash_file(app,filename,checksums):
+    """! @brief Compute checksums of a file in a single pass.
+        @arg app Application instance.
+        @arg filename The file to hash.
+        @arg checksums A list of checksum names (see settings.CHECKSUMS).
+        @return A dict mapping the checksum names to hex digests.
+    """
+    hashes = {}
+    for csum in checksums:
+        hashes[csum] = hashlib.new(HASHLIB_ALGORITHMS[csum][0])
+    if not hashes:
+        return {}
+
+    buffer = bytearray(app.config.get_integer(PLUGIN_ID,'readSize'))
+    view = memoryview(buffer)
+    with open(filename,'rb',buffering=0) as ifile:
+        while True:
+            n = ifile.readinto(buffer)
+            if not n:
+                break
+            data = view[:n]
+            for h in hashes.values():
+                h.update(data)
+
+    return dict((csum,h.hexdigest()) for csum,h in hashes.items())
+
+def format_checksum(csum,filename,digest):
+    """! @brief Format a checksum line like "*sum --tag" does.
+        @arg csum The checksum name.
+        @arg filename The filename of the checksummed file.
+        @arg digest The hex digest.
+        @return The checksum line.
+    """
+    escaped,name = _escape_filename(os.path.basename(filename))
+    return "{escape}{tag} ({file}) = {digest}\n".format(
+        escape=('\\' if escaped else ''),
+        tag=HASHLIB_ALGORITHMS[csum][1],
+        file=name,
+        digest=digest)
+
+def read_checksum_file(csum_file):
+    """! @brief Read a checksum file.
+        Files written with and without "--tag" are supported.
+        @arg csum_file The checksum file to read.
+        @return A list of (tag,filename,digest) tuples. tag is None for files
+        written without "--tag".
+    """
+    ret = []
+    with open(csum_file,'r',encoding='utf-8') as ifile:
+        for line in ifile:
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
+            match = _TAG_LINE.match(line)
+            if match:
+                tag = match.group('tag')
+            else:
+                match = _PLAIN_LINE.match(line)
+                tag = None
+            if not match:
+                continue
+
+            filename = match.group('file')
+            if line.startswith('\\'):
+                filename = _unescape_filename(filename)
+            ret.append((tag,filename,match.group('digest').lower()))
+    return ret
+
+def _write_checksums(app,game,filename,digests):
+    for csum,digest in digests.items():
+        csum_file = '.'.join((filename,csum))
+        with open(csum_file,'w',encoding='utf-8',newline='\n') as ofile:
+            ofile.write(format_checksum(csum,filename,digest))
+        if app.config.verbose:
+            print("[{checksum}] {file} created".format(checksum=csum,file=csum_file))
+        app.archivers.backup_file(game,csum_file)
+
+def _create_checksum_command(app,game,filename,csum):
     sect = PLUGIN_ID
-    cwd = os.getcwd()
-    os.chdir(os.path.dirname(filename))
+    csum_cmd = app.config.get_string(sect,csum)
+    if not csum_cmd:
+        return
+    command = [csum_cmd] + shlex.split(app.config.get_string(sect,'checksum_create_flags')) + [os.path.basename(filename)]
+    proc = subprocess.run(command,capture_output=True,cwd=os.path.dirname(filename))
+    if proc.returncode == 0:
+        csum_file = '.'.join((filename,csum))
+        with open(csum_file,'wb') as ofile:
+            ofile.write(proc.stdout)
+        if app.config.verbose:
+            print("[{checksum}] {file} created".format(checksum=csum,file=csum_file))
+        app.archivers.backup_file(game,csum_file)
+    else:
+        print(proc.stdout.decode('utf-8'))
 
-    for csum in app.config.get_string_list(sect,'checksums'):
-        csum_cmd = app.config.get_string(sect,csum)
-        if not csum_cmd:
-            continue
-        command = [csum_cmd] + shlex.split(app.config.get_string(sect,'checksum_create_flags')) + [os.path.basename(filename)]
-        proc = subprocess.run(command,capture_output=True)
-        if proc.returncode == 0:
-            csum_file = '.'.join((filename,csum))
-            with open(os.path.basename(csum_file),'wb') as ofile:
-                ofile.write(proc.stdout)
-            if app.config.verbose:
-                print("[{checksum}] {file} created".format(checksum=csum,file=csum_file))
-            app.archivers.backup_file(game,csum_file)
-
-    os.chdir(cwd)
+def create_checksums(app,game,filename,checksums=None):
+    """! @brief Create the checksum files for a backup.
+        @arg app Application instance.
+        @arg game Game instance.
+        @arg filename The backup file.
+        @arg checksums The checksums to create. Defaults to the configured checksums.
+    """
+    if checksums is None:
+        checksums = app.config.get_string_list(PLUGIN_ID,'checksums')
+    if not checksums:
+        return
+
+    if get_engine(app) == 'hashlib':
+        # use the digests computed while the archive was written if available
+        tee_digests = app.archivers.get_backup_digests(filename)
+        digests = {}
+        missing = []
+        for csum in checksums:
+            algorithm = HASHLIB_ALGORITHMS[csum][0]
+            if algorithm in tee_digests:
+                digests[csum] = tee_digests[algorithm]
+            else:
+                missing.append(csum)
+        if missing:
+            digests.update(hash_file(app,filename,missing))
+        _write_checksums(app,game,filename,digests)
+    else:
+        for csum in checksums:
+            _create_checksum_command(app,game,filename,csum)
 
 def create_missing_checksums(app):
     sect = PLUGIN_ID
-    cwd = os.getcwd()
     for game in app.games.games:
         if not os.path.isdir(game.backup_dir):
             continue
-        os.chdir(game.backup_dir)
         for backup in game.backups:
-            for csum in app.config.get_string_list(sect,'checksums'):
-                csum_file = '.'.join((backup,csum))
-                if os.path.isfile(csum_file):
-                    continue
-                csum_cmd = app.config.get_string(sect,csum)
-                csum_flags = app.config.get(sect,'checksum_create_flags')
-                if not csum_cmd:
-                    continue
-                command = [csum_cmd] + shlex.split(csum_flags) + [os.path.basename(backup)]
-                
-                proc = subprocess.run(command,capture_output=True)
-                
-                if proc.returncode == 0:    
-                    with open(os.path.basename(csum_file),'wb') as ofile:
-                        ofile.write(proc.stdout)
-                    if app.config.verbose:
-                        print("[{checksum}] {file} created".format(checksum=csum,file=csum_file))
-                    app.archivers.backup_file(game,csum_file)
-                else:
-                    print(proc.stdout.decode('utf-8'))
-    os.chdir(cwd)
+            missing = [csum for csum in app.config.get_string_list(sect,'checksums')
+                       if not os.path.isfile('.'.join((backup,csum)))]
+            if missing:
+                create_checksums(app,game,backup,missing)
 
-def check_checksums(app,backup_file):
-    cwd = os.getcwd()
-    os.chdir(os.path.dirname(backup_file))
-    ret = True
+def _check_checksum_hashlib(app,backup_file,csum_files):
+    try:
+        digests = hash_file(app,backup_file,list(csum_files.keys()))
+    except OSError:
+        return dict((csum,False) for csum in csum_files.keys())
+
+    ret = {}
+    for csum,csum_file in csum_files.items():
+        try:
+            entries = read_checksum_file(csum_file)
+        except (OSError,UnicodeDecodeError):
+            entries = []
+
+        ok = bool(entries)
+        for tag,filename,digest in entries:
+            if (tag is not None and tag != HASHLIB_ALGORITHMS[csum][1]) or digest != digests[csum]:
+                ok = False
+        ret[csum] = ok
+    return ret
+
+def _check_checksum_command(app,backup_file,csum,csum_file):
+    csum_cmd =  app.config.get_string(PLUGIN_ID,csum)
+    csum_flags = app.config.get_string(PLUGIN_ID,'checksum_check_flags')
+    if not csum_cmd or not csum_flags:
+        return None
+    command = [csum_cmd] + shlex.split(csum_flags) + [os.path.basename(csum_file)]
+    proc = subprocess.run(command,capture_output=True,cwd=os.path.dirname(backup_file))
+    return (proc.returncode == 0)
+
+def _expected_digest(csum,csum_file):
+    try:
+        entries = read_checksum_file(csum_file)
+    except (OSError,UnicodeDecodeError):
+        return None
+    if len(entries) != 1:
+        return None
+    tag,filename,digest = entries[0]
+    if tag is not None and tag != HASHLIB_ALGORITHMS[csum][1]:
+        return None
+    return digest
+
+def _verify(app,backup_file,cache=None,force=False):
+    csum_files = {}
     for csum in CHECKSUMS:
         csum_file = '.'.join((backup_file,csum))
         if os.path.isfile(csum_file):
-            csum_cmd =  app.config.get_string(PLUGIN_ID,csum)
-            csum_flags = app.config.get_string(PLUGIN_ID,'checksum_check_flags')
-            if not csum_cmd or not csum_flags:
-                continue
-            command = [csum_cmd] + shlex.split(csum_flags) + [os.path.basename(csum_file)]
-            proc = subprocess.run(command,capture_output=True)
-            print ("[{checksum}] {file} ... ".format(checksum=csum,file=os.path.basename(backup_file)),
-                   end="")
-            if proc.returncode == 0:
-                print("OK")
-            else:
-                print("FAILED")
-                ret = False
-    os.chdir(cwd)
+            csum_files[csum] = csum_file
+
+    results = {}
+    expected = {}
+    stat = None
+    if cache is not None:
+        try:
+            stat = os.stat(backup_file)
+        except OSError:
+            stat = None
+        if stat is not None:
+            for csum,csum_file in list(csum_files.items()):
+                expected[csum] = _expected_digest(csum,csum_file)
+                if (not force
+                        and expected[csum] is not None
+                        and cache.is_verified(backup_file,stat,csum,expected[csum])):
+                    results[csum] = True
+                    del csum_files[csum]
+    n_cached = len(results)
+
+    if get_engine(app) == 'hashlib':
+        results.update(_check_checksum_hashlib(app,backup_file,csum_files))
+    else:
+        for csum,csum_file in csum_files.items():
+            result = _check_checksum_command(app,backup_file,csum,csum_file)
+            if result is not None:
+                results[csum] = result
+
+    if stat is not None:
+        for csum in csum_files.keys():
+            if results.get(csum) and expected.get(csum) is not None:
+                cache.set_verified(backup_file,stat,csum,expected[csum])
+
+    return (dict((csum,results[csum]) for csum in CHECKSUMS if csum in results),n_cached)
+
+def verify_checksums(app,backup_file,cache=None,force=False):
+    """! @brief Verify the checksum files of a backup without printing anything.
+        This function is safe to be called from worker threads.
+        @arg app Application instance.
+        @arg backup_file The backup to verify.
+        @arg cache A VerifyCache instance or None. Checksums verified before are
+        not checked again.
+        @arg force Verify all checksums even if they are cached.
+        @return A dict mapping the checksum names to `True` (OK) or `False` (FAILED).
+    """
+    return _verify(app,backup_file,cache,force)[0]
+
+def _print_results(backup_file,results):
+    ret = True
+    for csum,result in results.items():
+        print ("[{checksum}] {file} ... ".format(checksum=csum,file=os.path.basename(backup_file)),
+               end="")
+        if result:
+            print("OK")
+        else:
+            print("FAILED")
+            ret = False
     return ret
 
-def check_checksums_for_game(app,game,success_callback=None,failed_callback=None):
+def check_checksums(app,backup_file):
+    return _print_results(backup_file,verify_checksums(app,backup_file))
+
+def check_backups(app,backups,success_callback=None,failed_callback=None,jobs=1,force=False):
+    """! @brief Check the checksums of backups with a pool of worker threads.
+        The results are printed in the order of `backups` as soon as they are
+        available. The callbacks are called from the calling thread.
+        @arg app Application instance.
+        @arg backups A list of (game,backup_file) tuples.
+        @arg success_callback callback function if checksumming of a file is a success.
+        callback(app,game,file)
+        @arg failed_callback callback function if checksumming of a file failed.
+        callback(app,game,file)
+        @arg jobs The number of backups to check concurrently.
+        @arg force Check all backups even if they were verified before. Otherwise
+        the verification cache is used if "checksum.verifyCache" is set.
+        @return A (checked,failed,bytes) tuple. bytes is the size of the backups
+        that were actually hashed.
+    """
+    if app.config.get_boolean(PLUGIN_ID,'verifyCache'):
+        cache = VerifyCache(app)
+    else:
+        cache = None
+
+    def verify(item):
+        game,backup_file = item
+        results,n_cached = _verify(app,backup_file,cache,force)
+        if n_cached == len(results):
+            return (results,0,True)
+        try:
+            size = os.path.getsize(backup_file)
+        except OSError:
+            size = 0
+        return (results,size,False)
+
+    checked = 0
+    failed = 0
+    cached = 0
+    total_size = 0
+    last_game = None
+    start = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1,jobs)) as executor:
+            for (game,backup_file),(results,size,is_cached) in zip(backups,executor.map(verify,backups)):
+                if game is not last_game:
+                    last_game = game
+                    if app.config.verbose:
+                        print("[CHECKSUM] {game}".format(game=game.game_name))
+
+                checked += 1
+                total_size += size
+                if is_cached and results:
+                    cached += 1
+                if _print_results(backup_file,results):
+                    if callable(success_callback):
+                        success_callback(app,game,backup_file)
+                else:
+                    failed += 1
+                    if callable(failed_callback):
+                        failed_callback(app,game,backup_file)
+    finally:
+        if cache is not None:
+            cache.close()
+
+    elapsed = time.monotonic() - start
+    print("{checked} backups checked ({cached} cached), {failed} failed, {size:.1f} MB in {time:.2f}s ({rate:.1f} MB/s)".format(
+        checked=checked,
+        cached=cached,
+        failed=failed,
+        size=total_size / 1000000,
+        time=elapsed,
+        rate=((total_size / 1000000) / elapsed) if elapsed > 0 else 0.0))
+    return (checked,failed,total_size)
+
+def _get_game_backups(game):
+    if not os.path.isdir(game.backup_dir):
+        return []
+    return [(game,bf) for bf in game.backups]
+
+def check_checksums_for_game(app,game,success_callback=None,failed_callback=None,jobs=1,force=False):
     """! @brief check checksums for game
        @arg app Application instance
        @arg game Game instancse
@@ -85,31 +355,27 @@ def check_checksums_for_game(app,game,success_callback=None,failed_callback=None
        callback(app,game,file)
        @arg failed_callback Callback function if checksumming of a file fails. 
        callback(app,game,file)
+       @arg jobs The number of backups to check concurrently.
+       @arg force Check backups even if they were verified before.
     """
-    if not os.path.isdir(game.backup_dir):
-        return
-    
-    backups = game.backups
+    backups = _get_game_backups(game)
     if not backups:
         return
-    
-    for bf in backups:
-        if check_checksums(app,bf):
-            if callable(success_callback):
-                success_callback(app,game,bf)
-        else:
-            if callable(failed_callback):
-                failed_callback(app,game,bf)
 
-def check_all_checksums(app,success_callback=None,failed_callback=None):
+    check_backups(app,backups,success_callback,failed_callback,jobs,force)
+
+def check_all_checksums(app,success_callback=None,failed_callback=None,jobs=1,force=False):
     """! @brief Check checksums for all backups.
         @arg app Application instance.
         @arg success_callback callback function if checksumming of a file is a success.
         callback(app,game,file)
         @arg failed_callback callback function if checksumming of a file failed.
         callback(app,game,file)
+        @arg jobs The number of backups to check concurrently.
+        @arg force Check backups even if they were verified before.
     """
+    backups = []
     for game in app.games.games:
-        if app.config.verbose:
-            print("[CHECKSUM] {game}".format(game=game.game_name))
-        check_checksums_for_game(app,game,success_callback=success_callback,failed_callback=failed_callback)
+        backups += _get_game_backups(game)
+
+    check_backups(app,backups,success_callback,failed_callback,jobs,force)
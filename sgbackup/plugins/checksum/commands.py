@@ -14,6 +14,8 @@ class ChecksumOptions(CommandOptions):
         self.__subcommand = 'list'
         self.__game = None
         self.__check_delete_failed = False
+        self.__jobs = 1
+        self.__force = False
 
     @property
     def subcommand(self):
@@ -31,6 +33,22 @@ class ChecksumOptions(CommandOptions):
     def check_delete_failed(self,b:bool):
         self.__check_delete_failed = b
 
+    @property
+    def jobs(self):
+        return self.__jobs
+    @jobs.setter
+    def jobs(self,jobs:int):
+        if jobs < 1:
+            raise ValueError("\"jobs\" needs to be a positive integer!")
+        self.__jobs = jobs
+
+    @property
+    def force(self):
+        return self.__force
+    @force.setter
+    def force(self,b:bool):
+        self.__force = b
+
     @property
     def game(self):
         return self.__game
@@ -51,7 +69,7 @@ class Checksum(Command):
         if command is None:
             command = self.id
         return """{command} [list|create-missing]
-{command} check [-d|--delete] [GAME]""".format(command=command)
+{command} check [-d|--delete] [-f|--force] [-j|--jobs JOBS] [GAME]""".format(command=command)
 
     def do_parse(self, cmd, argv):
         options = ChecksumOptions(self.application,cmd)
@@ -65,13 +83,20 @@ class Checksum(Command):
             
             if len(argv) > 1:
                 try:
-                    opts,args = getopt.getopt(argv[1],'d',['delete'])
+                    opts,args = getopt.getopt(argv[1:],'dfj:',['delete','force','jobs='])
                 except getopt.GetoptError as err:
                     raise OptionError(str(err))
 
                 for o,a in opts:
                     if o in ("-d","--delete"):
                         options.check_delete_failed = True
+                    elif o in ("-f","--force"):
+                        options.force = True
+                    elif o in ("-j","--jobs"):
+                        try:
+                            options.jobs = int(a)
+                        except Exception as err:
+                            raise OptionError("Illegal value for JOBS! ({message})".format(message=err))
 
                 if args:
                     try:
@@ -100,9 +125,9 @@ class Checksum(Command):
                 failed_cb = None
 
             if options.game is not None:
-                check_checksums_for_game(self.application,options.game,failed_callback=failed_cb)
+                check_checksums_for_game(self.application,options.game,failed_callback=failed_cb,jobs=options.jobs,force=options.force)
             else:
-                check_all_checksums(self.application,failed_callback=failed_cb)
+                check_all_checksums(self.application,failed_callback=failed_cb,jobs=options.jobs,force=options.force)
             return 0
         return 1
 
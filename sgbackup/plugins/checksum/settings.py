@@ -20,6 +20,22 @@ CHECKSUMS = [
     'sha512sum'
 ]
 
+# hashlib algorithm and GNU coreutils "--tag" name of the checksums
+HASHLIB_ALGORITHMS = {
+    'b2sum': ('blake2b','BLAKE2b'),
+    'md5sum': ('md5','MD5'),
+    'sha1sum': ('sha1','SHA1'),
+    'sha224sum': ('sha224','SHA224'),
+    'sha256sum': ('sha256','SHA256'),
+    'sha384sum': ('sha384','SHA384'),
+    'sha512sum': ('sha512','SHA512'),
+}
+
+ENGINES = [
+    'hashlib',
+    'command'
+]
+
 __file_validate = lambda x: (os.path.isfile(x) or x == "")
 def __checksum_validate(slist):
     for i in slist:
@@ -39,6 +55,10 @@ OPTIONS= {
         'sha384sum':{'type':'string','default':'','validate':__file_validate},
         'sha512sum':{'type':'string','default':'','validate':__file_validate},
         'checksums':{'type':'string-list','default':[],'validate':__checksum_validate},
+        'engine':{'type':'string','default':'hashlib','validate':lambda x: x in ENGINES},
+        'readSize':{'type':'integer','default':1024 * 1024,'validate':lambda x: (x > 0)},
+        'verifyCache':{'type':'boolean','default':True},
+        'reverifyDays':{'type':'integer','default':30,'validate':lambda x: (x >= 0)},
         'checksum_create_flags':{'type':'string','default':'--binary --tag'},
         'checksum_check_flags':{'type':'string','default':'--check --status'},
     },
@@ -84,7 +104,7 @@ def get_config_options():
         for cksum in CHECKSUMS:
             proc = subprocess.run(['which',cksum],capture_output=True)
             if proc.returncode == 0:
-                OPTIONS[sect][cksum]['default'] = proc.stdout.decode('utf-8')
+                OPTIONS[sect][cksum]['default'] = proc.stdout.decode('utf-8').strip()
 
             
 
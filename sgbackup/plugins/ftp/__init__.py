@@ -19,6 +19,10 @@ OPTIONS={
         'useTLS':{'type':'boolean','default':False},
         'autoBackup':{'type':'boolean','default':False},
         'test':{'type':'boolean','default':True},
+        'workers':{'type':'integer','default':4,'validate':lambda x: x > 0},
+        'blocksize':{'type':'integer','default':65536,'validate':lambda x: x > 0},
+        'retries':{'type':'integer','default':3,'validate':lambda x: x >= 0},
+        'queueTimeout':{'type':'integer','default':300},
     },
 }
 
@@ -53,5 +57,9 @@ class FtpPlugin(Plugin):
             self.application.commands.remove(c)
         self.__commands = []
 
+    def do_destroy(self):
+        self.ftp.destroy()
+        Plugin.do_destroy(self)
+
 
 PLUGIN = FtpPlugin
\ No newline at end of file
@@ -3,6 +3,7 @@ from sgbackup.error import OptionError
 import getopt
 import getpass
 from .ftp import FtpClient
+from .error import FtpConnectionError
 import sys
 
 def _print_ftp_list(plugin):
@@ -48,6 +49,9 @@ class FtpConfigOptions(CommandOptions):
         self.__use_tls = None
         self.__auto_backup = None
         self.__timeout = None
+        self.__workers = None
+        self.__blocksize = None
+        self.__retries = None
         self.__test = False
         self.__ftp_client = None
 
@@ -102,6 +106,12 @@ class FtpConfigOptions(CommandOptions):
                     self.auto_backup = self.__ftp_client.auto_backup
                 if self.__timeout is None:
                     self.timeout = self.__ftp_client.timeout
+                if self.__workers is None:
+                    self.workers = self.__ftp_client.workers
+                if self.__blocksize is None:
+                    self.blocksize = self.__ftp_client.blocksize
+                if self.__retries is None:
+                    self.retries = self.__ftp_client.retries
             except:
                 raise ValueError("FTP client with ID \"{id}\" does not exist".format(id=id))
         self.__ftp_id = id
@@ -171,6 +181,33 @@ class FtpConfigOptions(CommandOptions):
     def timeout(self,timeout:int):
         self.__timeout = int(timeout)
 
+    @property
+    def workers(self):
+        return self.__workers
+    @workers.setter
+    def workers(self,n:int):
+        if int(n) < 1:
+            raise ValueError("workers needs to be a positive integer!")
+        self.__workers = int(n)
+
+    @property
+    def blocksize(self):
+        return self.__blocksize
+    @blocksize.setter
+    def blocksize(self,n:int):
+        if int(n) < 1:
+            raise ValueError("blocksize needs to be a positive integer!")
+        self.__blocksize = int(n)
+
+    @property
+    def retries(self):
+        return self.__retries
+    @retries.setter
+    def retries(self,n:int):
+        if int(n) < 0:
+            raise ValueError("retries needs to be a positive integer or 0!")
+        self.__retries = int(n)
+
     def get_ftp_client(self):
         if not self.__ftp_client:
             kwargs={'id':self.ftp_id}
@@ -190,6 +227,12 @@ class FtpConfigOptions(CommandOptions):
                 kwargs['auto_backup'] = self.auto_backup
             if self.__timeout is not None:
                 kwargs['timeout'] = self.timeout
+            if self.__workers is not None:
+                kwargs['workers'] = self.workers
+            if self.__blocksize is not None:
+                kwargs['blocksize'] = self.blocksize
+            if self.__retries is not None:
+                kwargs['retries'] = self.retries
 
             self.__ftp_client = FtpClient(self.application,**kwargs)
         else:
@@ -212,6 +255,12 @@ class FtpConfigOptions(CommandOptions):
                 self.__ftp_client.auto_backup = self.auto_backup
             if self.__timeout is not None:
                 self.__ftp_client.timeout = self.timeout
+            if self.__workers is not None:
+                self.__ftp_client.workers = self.workers
+            if self.__blocksize is not None:
+                self.__ftp_client.blocksize = self.blocksize
+            if self.__retries is not None:
+                self.__ftp_client.retries = self.retries
 
         return self.__ftp_client
 
@@ -228,11 +277,13 @@ class FtpConfig(Command):
 {command} edit [-i|--interactive|-I|--no-iteractive] [-h|--host HOST] 
     [-p|--port PORT] [-U|--user USER] [-P|--password PASSWORD]
     [-T|--tls USE_TLS] [-b|--backupdir BACKUPDIR] [--test] 
-    [-t|--timeout TIMEOUT] FTPID
+    [-t|--timeout TIMEOUT] [-w|--workers WORKERS] [--blocksize BLOCKSIZE]
+    [-r|--retries RETRIES] FTPID
 {command} add [-i|--interactive|-I|--no-interactive] [-h|--host HOST]
     [-p|--port PORT] [-U|--user USER] [-P|--password PASSWORD]
     [-T|--tls USE_TLS] [-b|--backupdir BACKUPDIR] [--test] 
-    [-t|--timeout TIMOUT] [FTPID]""".format(command=command)
+    [-t|--timeout TIMOUT] [-w|--workers WORKERS] [--blocksize BLOCKSIZE]
+    [-r|--retries RETRIES] [FTPID]""".format(command=command)
 
     def ftp_settings_interactive(self,options:FtpConfigOptions):
         settings_ok = False
@@ -328,6 +379,9 @@ class FtpConfig(Command):
             print("User:             {}".format(options.user))
             print("Password:         {}".format("*" * 8))
             print("Timeout:          {}".format(options.timeout))
+            print("Workers:          {}".format(options.workers))
+            print("Blocksize:        {}".format(options.blocksize))
+            print("Retries:          {}".format(options.retries))
             print("Backup Directory: {}".format(options.backup_dir))
             print("Use TLS           {}".format(tls))
             print("Enable automatic Backups: {}".format(autobackup))
@@ -365,7 +419,7 @@ class FtpConfig(Command):
             
             try:
                 opts,args = getopt.getopt(argv[1:],
-                                          "AaiIh:p:U:p:t:b:T",
+                                          "AaiIh:p:U:p:t:b:Tw:r:",
                                           [
                                             "autobackup"
                                             "no-autobackup"
@@ -378,6 +432,9 @@ class FtpConfig(Command):
                                             "backupdir=",
                                             "tls=",
                                             "timeout=",
+                                            "workers=",
+                                            "blocksize=",
+                                            "retries=",
                                             "test",
                                             "no-test"
                                           ])
@@ -409,6 +466,21 @@ class FtpConfig(Command):
                         options.use_tls = False
                 elif o in ('-T','--timeout'):
                     options.timeout = int(a)
+                elif o in ('-w','--workers'):
+                    try:
+                        options.workers = int(a)
+                    except Exception as err:
+                        raise OptionError("workers needs to be a positive integer! ({message})".format(message=err))
+                elif o == '--blocksize':
+                    try:
+                        options.blocksize = int(a)
+                    except Exception as err:
+                        raise OptionError("blocksize needs to be a positive integer! ({message})".format(message=err))
+                elif o in ('-r','--retries'):
+                    try:
+                        options.retries = int(a)
+                    except Exception as err:
+                        raise OptionError("retries needs to be a positive integer or 0! ({message})".format(message=err))
                 elif o in ('-a','--autobackup'):
                     options.auto_backup = True
                 elif o in ('-A','--no-autobackup'):
@@ -470,6 +542,9 @@ class FtpConfig(Command):
             print("User: {}".format(ftp.user))
             print("Password: {}".format("*" * 8))
             print("Timeout: {}".format(ftp.timeout))
+            print("Workers: {}".format(ftp.workers))
+            print("Blocksize: {}".format(ftp.blocksize))
+            print("Retries: {}".format(ftp.retries))
             print("Backup Directory: {}".format(ftp.backup_dir))
             if ftp.use_tls:
                 use_tls = "YES"
@@ -531,6 +606,7 @@ class FtpOptions(CommandOptions):
         self.__subcommand = 'list'
         self.__ftp_id = None
         self.__ftp_client = None
+        self.__full = False
 
     @property
     def subcommand(self):
@@ -557,6 +633,13 @@ class FtpOptions(CommandOptions):
     @property
     def ftp_client(self):
         return self.__ftp_client
+
+    @property
+    def full(self):
+        return self.__full
+    @full.setter
+    def full(self,b:bool):
+        self.__full = bool(b)
     
 class Ftp(Command):
     def __init__(self,app):
@@ -567,7 +650,8 @@ class Ftp(Command):
             command = FtpOptions.COMMAND_ID
 
         return """{command} [list]
-{command} synchronize [FTPID]"""
+{command} synchronize [-f|--full] [FTPID]
+{command} fetch-all [FTPID]""".format(command=command)
 
     def do_parse(self, cmd, argv):
         options = FtpOptions(self.application,cmd)
@@ -575,12 +659,25 @@ class Ftp(Command):
             return options
         elif argv[0] == 'synchronize':
             options.subcommand = argv[0]
-            if len(argv) > 1:
-                options.ftp_id = argv[1]
+            try:
+                opts,args = getopt.getopt(argv[1:],"f",["full"])
+            except getopt.GetoptError as err:
+                raise OptionError("Illegal commandline! ({message})".format(message=err))
+            for o,a in opts:
+                if o in ('-f','--full'):
+                    options.full = True
+            if len(args) > 0:
+                try:
+                    options.ftp_id = args[0]
+                except Exception as err:
+                    raise OptionError(str(err))
         elif argv[0] == 'fetch-all':
             options.subcommand = argv[0]
             if len(argv) > 1:
-                options.ftp_id == argv[1]
+                try:
+                    options.ftp_id = argv[1]
+                except Exception as err:
+                    raise OptionError(str(err))
             else:
                 for i in self.application.plugins.get('ftp').ftp.clients.keys():
                     options.ftp_id = i
@@ -600,13 +697,26 @@ class Ftp(Command):
            return 0
         elif options.subcommand == 'synchronize':
             if options.ftp_client is not None:
-                options.ftp_client.synchronize()
+                ftp_clients = [options.ftp_client]
             else:
-                for ftp_client in self.application.plugins.get('ftp').ftp.clients.values():
-                    ftp_client.synchronize()
-            return 0
+                ftp_clients = self.application.plugins.get('ftp').ftp.clients.values()
+
+            ret = 0
+            for ftp_client in ftp_clients:
+                try:
+                    if not ftp_client.synchronize(options.full):
+                        ret = 1
+                except FtpConnectionError as err:
+                    print(err,file=sys.stderr)
+                    ret = 3
+            return ret
         elif options.subcommand == 'fetch-all':
-            options.ftp_client.fetch_all()
+            if options.ftp_client is None:
+                print("No FTP client configured!",file=sys.stderr)
+                return 2
+            if not options.ftp_client.fetch_all():
+                return 1
+            return 0
         return 1
     
 COMMANDS = [
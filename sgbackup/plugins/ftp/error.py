@@ -3,6 +3,14 @@ class FtpConnectionError(Exception):
     def __init__(self,message="",*args):
         Exception.__init__(self,message,*args)
 
+    @property
+    def message(self):
+        return self.args[0]
+
+class FtpTransferError(Exception):
+    def __init__(self,message="",*args):
+        Exception.__init__(self,message,*args)
+
     @property
     def message(self):
         return self.args[0]
\ No newline at end of file
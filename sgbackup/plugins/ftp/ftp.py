@@ -1,10 +1,115 @@
 import os
 import sys
-from ftplib import FTP,FTP_TLS
+import calendar
+import contextlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ftplib import FTP,FTP_TLS,all_errors,error_perm,error_reply
 
 from gi.repository import GObject
-from .error import FtpConnectionError
+from .error import FtpConnectionError,FtpTransferError
+from .uploadqueue import UploadQueue
 import sgbackup
+
+DEFAULT_WORKERS = 4
+DEFAULT_BLOCKSIZE = 65536
+DEFAULT_RETRIES = 3
+
+def _parse_ftp_time(value):
+    """! @brief Convert a MLSD or MDTM time value to a timestamp.
+        @arg value The time value in the format YYYYMMDDHHMMSS[.sss] (UTC).
+        @return The timestamp in seconds or None if value can not be parsed.
+    """
+    try:
+        return calendar.timegm(time.strptime(value[:14],"%Y%m%d%H%M%S"))
+    except (ValueError,TypeError):
+        return None
+
+def _quit(ftp):
+    try:
+        ftp.quit()
+    except:
+        ftp.close()
+
+class FtpConnectionPool(object):
+    """! @brief A pool of authenticated FTP sessions.
+        Sessions are opened on demand up to `size` sessions and reused after
+        they are released. A session that failed with anything but a permanent
+        FTP error (5xx) or a FtpTransferError is closed instead of being reused.
+        @arg client The FtpClient to open the sessions for.
+        @arg size The maximum number of open sessions.
+    """
+    def __init__(self,client,size):
+        self.__client = client
+        self.__size = max(1,size)
+        self.__cond = threading.Condition()
+        self.__idle = []
+        self.__count = 0
+
+    @property
+    def size(self):
+        return self.__size
+
+    def acquire(self):
+        """! @brief Get a session from the pool.
+            Blocks until a session is available.
+            @return An authenticated FTP or FTP_TLS instance.
+            @exception FtpConnectionError if a new session can not be opened.
+        """
+        with self.__cond:
+            while True:
+                if self.__idle:
+                    return self.__idle.pop()
+                if self.__count < self.__size:
+                    self.__count += 1
+                    break
+                self.__cond.wait()
+        try:
+            return self.__client._new_connection()
+        except:
+            with self.__cond:
+                self.__count -= 1
+                self.__cond.notify()
+            raise
+
+    def release(self,ftp,discard=False):
+        """! @brief Give a session back to the pool.
+            @arg ftp The session returned by acquire().
+            @arg discard Close the session instead of reusing it.
+        """
+        with self.__cond:
+            if discard:
+                self.__count -= 1
+            else:
+                self.__idle.append(ftp)
+            self.__cond.notify()
+        if discard:
+            _quit(ftp)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """! @brief Context manager that acquires and releases a session."""
+        ftp = self.acquire()
+        try:
+            yield ftp
+        except (error_perm,FtpTransferError):
+            self.release(ftp)
+            raise
+        except:
+            self.release(ftp,True)
+            raise
+        self.release(ftp)
+
+    def close(self):
+        """! @brief Close all idle sessions."""
+        with self.__cond:
+            idle = self.__idle
+            self.__idle = []
+            self.__count -= len(idle)
+        for ftp in idle:
+            _quit(ftp)
+
 class FtpClient(GObject.GObject):
     __name__ = "sgbackup-plugin-ftp-Ftp"
     __gsignals__ = {
@@ -20,7 +125,10 @@ class FtpClient(GObject.GObject):
                  use_tls=False,
                  backup_dir="",
                  auto_backup=False,
-                 timeout=600):
+                 timeout=600,
+                 workers=DEFAULT_WORKERS,
+                 blocksize=DEFAULT_BLOCKSIZE,
+                 retries=DEFAULT_RETRIES):
         GObject.GObject.__init__(self)
         self.__app = app
         self.__id = self.sanitize_id(id)
@@ -32,8 +140,13 @@ class FtpClient(GObject.GObject):
         self.__backup_dir = backup_dir
         self.__auto_backup = auto_backup
         self.__timeout = timeout
+        self.__workers = max(1,int(workers))
+        self.__blocksize = max(1,int(blocksize))
+        self.__retries = max(0,int(retries))
 
         self.__ftp = None
+        self.__use_mlsd = True
+        self.__upload_queue = UploadQueue(self)
 
         self.__archivermanager_backup_slot='_plugin_ftp_ftpclient{}_backup_slot'.format(str(self.id))
         self.__archivermanager_backup_file_slot='_plugin_ftp_ftpclient{}_backup_file_slot'.format(str(self.id))
@@ -64,6 +177,12 @@ class FtpClient(GObject.GObject):
             kwargs['auto_backup'] = cfg.get_boolean(group,"autoBackup")
         if cfg.has_key(group,'timeout'):
             kwargs['timeout'] = cfg.get_integer(group,"timeout")
+        if cfg.has_key(group,'workers'):
+            kwargs['workers'] = cfg.get_integer(group,"workers")
+        if cfg.has_key(group,'blocksize'):
+            kwargs['blocksize'] = cfg.get_integer(group,"blocksize")
+        if cfg.has_key(group,'retries'):
+            kwargs['retries'] = cfg.get_integer(group,"retries")
 
         return FtpClient(app,id,**kwargs)
     
@@ -164,6 +283,44 @@ class FtpClient(GObject.GObject):
     def timeout(self,timeout):
         self.__timeout = int(timeout)
 
+    @GObject.Property(int)
+    def workers(self):
+        """! @brief The number of FTP sessions used for transfering files concurrently."""
+        return self.__workers
+    @workers.setter
+    def workers(self,n):
+        n = int(n)
+        if n < 1:
+            raise ValueError("\"workers\" needs to be a positive integer!")
+        self.__workers = n
+
+    @GObject.Property(int)
+    def blocksize(self):
+        """! @brief The blocksize used for file transfers."""
+        return self.__blocksize
+    @blocksize.setter
+    def blocksize(self,n):
+        n = int(n)
+        if n < 1:
+            raise ValueError("\"blocksize\" needs to be a positive integer!")
+        self.__blocksize = n
+
+    @GObject.Property(int)
+    def retries(self):
+        """! @brief How often an interrupted transfer is resumed before it fails."""
+        return self.__retries
+    @retries.setter
+    def retries(self,n):
+        n = int(n)
+        if n < 0:
+            raise ValueError("\"retries\" needs to be a positive integer or 0!")
+        self.__retries = n
+
+    @property
+    def upload_queue(self):
+        """! @brief The UploadQueue used for automatic backups."""
+        return self.__upload_queue
+
     def save(self):
         config = self.application.config
         group = "ftp:{}".format(str(self.id))
@@ -175,210 +332,477 @@ class FtpClient(GObject.GObject):
         config.set_boolean(group,"useTLS",self.use_tls)
         config.set_boolean(group,"autoBackup",self.auto_backup)
         config.set_integer(group,"timeout",self.timeout)
+        config.set_integer(group,"workers",self.workers)
+        config.set_integer(group,"blocksize",self.blocksize)
+        config.set_integer(group,"retries",self.retries)
         config.save()
 
-    def ftp_connect(self):
-        if self.__ftp is None:
-            if self.use_tls:
-                ftp = FTP_TLS(timeout=self.timeout)
-            else:
-                ftp = FTP(timeout=self.timeout)
-            try:
-                ftp.connect(self.host,self.port)
-                if self.use_tls:
-                    try:
-                        ftp.auth()
-                    except:
-                        pass
-
-                    try:
-                        ftp.prot_p()
-                    except:
-                        pass
-                ftp.login(self.user,self.__password)
-                self.__ftp = ftp
-                return True
-            except:
-                return False
-            
-        self.__ftp.close()
+    def _new_connection(self):
+        """! @brief Open a new authenticated FTP session.
+            @return An FTP or FTP_TLS instance.
+            @exception FtpConnectionError if connecting or logging in failed.
+        """
+        if self.use_tls:
+            ftp = FTP_TLS(timeout=self.timeout)
+        else:
+            ftp = FTP(timeout=self.timeout)
         try:
-            self.__ftp.connect(self.host,self.port)
+            ftp.connect(self.host,self.port)
             if self.use_tls:
                 try:
-                    self.__ftp.auth()
+                    ftp.auth()
                 except:
                     pass
+
                 try:
-                    self.__ftp.prot_p()
+                    ftp.prot_p()
                 except:
                     pass
-            self.__ftp.login(self.user,self.__password)
-            return True
-        except:
-            self.close()
-        return False
+            ftp.login(self.user,self.__password)
+        except Exception as err:
+            ftp.close()
+            raise FtpConnectionError("Unable to connect to host \"{host}\"! ({message})".format(host=self.host,message=err))
+        return ftp
+
+    def ftp_connect(self):
+        self.close()
+        try:
+            self.__ftp = self._new_connection()
+        except FtpConnectionError:
+            return False
+        return True
         
     def close(self):
         if self.__ftp is not None:
             self.__ftp.close()
             self.__ftp = None
 
-    def create_backupdir(self):
-        if self.backup_dir:
-            if self.backup_dir == ".":
-                return
-            
-        if self.backup_dir.startswith('/'):
-            isabs = True
-        else:
-            isabs = False
-
-        ftp_wd = self.__ftp.pwd()
-
-        if isabs:
-            pv = self.backupdir[1:].split('/')
-            self.__ftp.cwd('/')
+    def _remote_path(self,*parts):
+        """! @brief Get a path relative to the FTP backup directory.
+            @arg parts The path elements to append to the backup directory.
+            @return The remote path.
+        """
+        if self.backup_dir in ("","."):
+            return "/".join(parts)
+        return "/".join([self.backup_dir.rstrip("/")] + list(parts))
+
+    def _make_remote_dirs(self,ftp,path,known=None):
+        """! @brief Create a remote directory and its parents.
+            Directories that already exist are ignored.
+            @arg ftp The FTP session to use.
+            @arg path The remote directory.
+            @arg known A set of directories that are known to exist. Created
+            directories are added to this set.
+        """
+        if path.startswith("/"):
+            prefix = "/"
         else:
-            pv = self.backupdir.split('/')
-
-        for i in pv:
+            prefix = ""
+        parts = [i for i in path.split("/") if i and i != "."]
+        for i in range(len(parts)):
+            rdir = prefix + "/".join(parts[:i+1])
+            if known is not None and rdir in known:
+                continue
             try:
-                self.__ftp.cwd(i)
-            except:
-                try:
-                    self.__ftp.mkd(i)
-                    self.__ftp.cwd(i)
-                except Exception as err:
-                    self.cwd(ftp_wd)
-                    raise err
-        self.cwd(ftp_wd)
-
-    def create_subdirs(self,path_list:list):
-        wd = self.__ftp.pwd()
-        if len(path_list):
+                ftp.mkd(rdir)
+            except error_perm:
+                pass
+            if known is not None:
+                known.add(rdir)
+
+    def _list_remote_dir(self,ftp,path):
+        """! @brief List a remote directory.
+            MLSD is used if the server supports it, otherwise the LIST output
+            is parsed.
+            @arg ftp The FTP session to use.
+            @arg path The remote directory.
+            @return A dict mapping the entry names to (type,size,mtime) tuples or
+            None if the directory does not exist. type is "file" or "dir", size
+            and mtime are None if the server did not report them.
+        """
+        entries = {}
+        if self.__use_mlsd:
             try:
-                self.__ftp.cwd(path_list[0])
-            except:
-                try:
-                    self.__ftp.mkd(path_list[0])
-                    self.__ftp.cwd(path_list[0])
-                except Exception as err:
-                    self.__ftp.cwd(wd)
-                    raise err
-            if len(path_list) > 1:
-                try:
-                    self.create_subdirs(path_list)
-                except Exception as err:
-                    self.__ftp.cwd(wd)
-                    raise err
-                
-        self.__ftp.cwd(wd)
-
-    def synchronize(self):
-        def synchronize_subdir(backup_dir,subdir,ftp_subdir):
-            if not os.path.isdir(os.path.join(backup_dir,subdir)):
-                return
-            
-            ftp_wd = self.__ftp.pwd()
+                for name,facts in ftp.mlsd(path,facts=('type','size','modify')):
+                    ftype = facts.get('type','').lower()
+                    if ftype in ('cdir','pdir') or name in ('.','..'):
+                        continue
+                    size = facts.get('size')
+                    if size is not None and size.isdigit():
+                        size = int(size)
+                    else:
+                        size = None
+                    entries[name] = (ftype,size,_parse_ftp_time(facts.get('modify')))
+                return entries
+            except error_perm as err:
+                if not str(err)[:3] in ('500','501','502','504'):
+                    return None
+                self.__use_mlsd = False
+
+        lines = []
+        try:
+            ftp.retrlines("LIST {}".format(path),lines.append)
+        except error_perm:
+            return None
+        for line in lines:
+            entry = line.split(None,8)
+            if len(entry) != 9 or entry[8] in ('.','..'):
+                continue
+            if entry[0].startswith('d'):
+                ftype = 'dir'
+            elif entry[0].startswith('-'):
+                ftype = 'file'
+            else:
+                continue
+            try:
+                size = int(entry[4])
+            except ValueError:
+                size = None
+            entries[entry[8]] = (ftype,size,None)
+        return entries
+
+    def _is_uploaded(self,ftp,local_file,remote_file,entry):
+        """! @brief Check if a remote file is up to date.
+            A remote file is up to date if it has the size of the local file and
+            is not older than the local file. SIZE and MDTM are used for values
+            missing in the directory listing.
+            @arg ftp The FTP session to use.
+            @arg local_file The local file.
+            @arg remote_file The remote file.
+            @arg entry The (type,size,mtime) tuple from the remote listing or None.
+        """
+        if entry is None or entry[0] != 'file':
+            return False
+        try:
+            st = os.stat(local_file)
+        except OSError:
+            return False
+
+        ftype,size,mtime = entry
+        if size is None:
+            size = self._remote_size(ftp,remote_file)
+        if size != st.st_size:
+            return False
+
+        if mtime is None:
+            mtime = self._remote_mtime(ftp,remote_file)
+        if mtime is not None and int(st.st_mtime) > mtime:
+            return False
+        return True
+
+    def _remote_size(self,ftp,remote_file):
+        try:
+            ftp.voidcmd("TYPE I")
+            return ftp.size(remote_file)
+        except all_errors:
+            return None
 
+    def _remote_mtime(self,ftp,remote_file):
+        try:
+            return _parse_ftp_time(ftp.voidcmd("MDTM {}".format(remote_file)).split()[-1])
+        except all_errors:
+            return None
+
+    def _resume_offset(self,ftp,remote_file,st,entry=None):
+        """! @brief Get the offset to resume an upload from.
+            A remote file is considered a partial upload of the local file if
+            it is smaller than the local file and was written after the local
+            file was modified.
+            @arg ftp The FTP session to use.
+            @arg remote_file The remote file.
+            @arg st The os.stat() result of the local file.
+            @arg entry The (type,size,mtime) tuple from the remote listing or None.
+            @return The remote size or 0 if the upload has to start from the beginning.
+        """
+        if entry is not None:
+            if entry[0] != 'file':
+                return 0
+            ftype,size,mtime = entry
+        else:
+            size = None
+            mtime = None
+
+        if size is None:
+            size = self._remote_size(ftp,remote_file)
+        if not size or size >= st.st_size:
+            return 0
+        if mtime is None:
+            mtime = self._remote_mtime(ftp,remote_file)
+        if mtime is None or mtime < int(st.st_mtime):
+            return 0
+        return size
+
+    def _retry(self,pool,transfer):
+        """! @brief Run a transfer with a session from the pool.
+            Transfers that fail with anything but a permanent FTP error (5xx)
+            are retried `retries` times.
+            @arg pool The FtpConnectionPool to use.
+            @arg transfer callable(ftp,error). error is the exception of the
+            previous attempt or None.
+            @return The return value of transfer.
+        """
+        error = None
+        attempt = 0
+        while True:
             try:
-                self.__ftp.cwd(ftp_subdir)
-            except:
+                with pool.connection() as ftp:
+                    return transfer(ftp,error)
+            except error_perm:
+                raise
+            except (FtpConnectionError,FtpTransferError) + all_errors as err:
+                if attempt >= self.retries:
+                    raise
+                error = err
+            attempt += 1
+            if self.application.config.verbose:
+                print("[FTP] Retrying transfer ({attempt}/{retries}) ({message})".format(
+                    attempt=attempt,retries=self.retries,message=error),file=sys.stderr)
+            time.sleep(attempt)
+
+    def _store_file(self,ftp,local_file,remote_file,entry=None,resume=True):
+        """! @brief Upload a file over a session.
+            A partial upload is resumed with REST and STOR, or APPE if the
+            server does not support REST for STOR. The size of the remote file
+            is compared with the size of the local file afterwards.
+            @exception FtpTransferError if the sizes do not match.
+        """
+        st = os.stat(local_file)
+        offset = 0
+        if resume:
+            offset = self._resume_offset(ftp,remote_file,st,entry)
+
+        with open(local_file,'rb') as ifile:
+            if offset:
+                ifile.seek(offset)
                 try:
-                    self.__ftp.mkd(ftp_subdir)
-                    self.__ftp.cwd(ftp_subdir)
-                except Exception as error:
-                    print(error,file=sys.stderr)
-                    self.cwd(ftp_wd)
-                    return
-
-
-            for i in os.listdir(os.path.join(backup_dir,subdir)):
-                fname = os.path.join(backup_dir,subdir,i)
-                if os.path.isdir(fname):
-                    synchronize_subdir(backup_dir,os.path.join(subdir,i),i)
-                else:
-                    print("[FTP put] {} ...".format(fname),end=" ")
-                    with open(fname,'rb') as ifile:
-                        try:
-                            self.__ftp.storbinary("STOR {}".format(i),ifile,blocksize=2048)
-                            print("OK")
-                        except:
-                            print("FAILED")
+                    ftp.storbinary("STOR {}".format(remote_file),ifile,blocksize=self.blocksize,rest=offset)
+                except (error_perm,error_reply):
+                    ifile.seek(offset)
+                    ftp.storbinary("APPE {}".format(remote_file),ifile,blocksize=self.blocksize)
+            else:
+                ftp.storbinary("STOR {}".format(remote_file),ifile,blocksize=self.blocksize)
 
-            self.__ftp.cwd(ftp_wd)
-                            
-            
-        close_connection = False
-        if not self.__ftp:
-            if not self.ftp_connect():
-                raise FtpConnectionError("Unable to connect to host \"{host}\"!".format(host=self.host))
-            self.close_connection = True
+        size = self._remote_size(ftp,remote_file)
+        if size is not None and size != st.st_size:
+            raise FtpTransferError("Size of uploaded file \"{file}\" does not match! ({remote} != {local})".format(
+                file=remote_file,remote=size,local=st.st_size))
 
-        ftp_wd = self.__ftp.pwd()
+        # Keep the modification time of the local file, so the next delta
+        # synchronization does not depend on the server clock.
         try:
-            self.__ftp.cwd(self.backup_dir)
-        except:
-            try:
-                self.create_backupdir()
-                self.__ftp.cwd(self.backupdir)
+            ftp.voidcmd("MFMT {} {}".format(time.strftime("%Y%m%d%H%M%S",time.gmtime(st.st_mtime)),remote_file))
+        except (error_perm,error_reply):
+            pass
 
-            except Exception as err:
-                self.__ftp.cwd(ftp_wd)
-                if close_connection:
-                    self.close()
-                    raise err
+    def _upload_file(self,pool,local_file,remote_file,entry=None,resume=True):
+        """! @brief Upload a file with a session from the pool.
+            Interrupted uploads are resumed from the remote size. After a size
+            mismatch the file is uploaded again from the beginning.
+            @arg pool The FtpConnectionPool to use.
+            @arg local_file The local file.
+            @arg remote_file The remote file.
+            @arg entry The (type,size,mtime) tuple from the remote listing or None.
+            @arg resume Resume a partial upload of a previous run.
+        """
+        def transfer(ftp,error):
+            if error is None:
+                self._store_file(ftp,local_file,remote_file,entry,resume)
+            else:
+                self._store_file(ftp,local_file,remote_file,None,not isinstance(error,FtpTransferError))
+        self._retry(pool,transfer)
+
+    def _retrieve_file(self,ftp,remote_file,local_file,entry=None,resume=True):
+        """! @brief Download a file over a session.
+            The file is written to "local_file.part", which is renamed to
+            local_file when the download is complete. An existing ".part" file is
+            resumed with REST and RETR.
+            @exception FtpTransferError if the size of the download does not match
+            the remote size.
+        """
+        if entry is not None:
+            ftype,size,mtime = entry
+        else:
+            size = None
+            mtime = None
+        if size is None:
+            size = self._remote_size(ftp,remote_file)
+        if mtime is None:
+            mtime = self._remote_mtime(ftp,remote_file)
+
+        part_file = local_file + ".part"
+        offset = 0
+        if resume and os.path.isfile(part_file):
+            offset = os.path.getsize(part_file)
+            if size is not None and offset > size:
+                offset = 0
+
+        local_dir = os.path.dirname(local_file)
+        if local_dir and not os.path.isdir(local_dir):
+            os.makedirs(local_dir)
+
+        if offset:
+            try:
+                with open(part_file,'ab') as ofile:
+                    ftp.retrbinary("RETR {}".format(remote_file),ofile.write,blocksize=self.blocksize,rest=offset)
+            except (error_perm,error_reply):
+                offset = 0
+        if not offset:
+            with open(part_file,'wb') as ofile:
+                ftp.retrbinary("RETR {}".format(remote_file),ofile.write,blocksize=self.blocksize)
+
+        part_size = os.path.getsize(part_file)
+        if size is not None and part_size != size:
+            raise FtpTransferError("Size of downloaded file \"{file}\" does not match! ({local} != {remote})".format(
+                file=remote_file,local=part_size,remote=size))
+
+        os.replace(part_file,local_file)
+        if mtime is not None:
+            os.utime(local_file,(mtime,mtime))
+
+    def _download_file(self,pool,remote_file,local_file,entry=None):
+        """! @brief Download a file with a session from the pool.
+            Interrupted downloads are resumed. After a size mismatch the file
+            is downloaded again from the beginning.
+            @arg pool The FtpConnectionPool to use.
+            @arg remote_file The remote file.
+            @arg local_file The local file.
+            @arg entry The (type,size,mtime) tuple from the remote listing or None.
+        """
+        def transfer(ftp,error):
+            if error is None:
+                self._retrieve_file(ftp,remote_file,local_file,entry)
+            else:
+                self._retrieve_file(ftp,remote_file,local_file,entry,not isinstance(error,FtpTransferError))
+        self._retry(pool,transfer)
+
+    def _verify_download(self,local_file):
+        """! @brief Verify a downloaded backup with its checksum files.
+            The backup is only verified if the checksum plugin is enabled.
+            @return False if a checksum does not match.
+        """
+        try:
+            if not self.application.plugins.get('checksum').is_enabled:
+                return True
+        except LookupError:
+            return True
+        if not self.application.archivers.file_is_archive(local_file):
+            return True
 
-        ftp_bd = self.__ftp.pwd()
+        from sgbackup.plugins.checksum.checksum import verify_checksums
+        return all(verify_checksums(self.application,local_file).values())
 
+    def _list_sync_files(self):
+        dirs = []
+        files = []
         for game in self.application.games.games:
-            bd = game.backup_dir
             if not os.path.isdir(game.backup_dir):
                 continue
+            for root,dirnames,filenames in os.walk(game.backup_dir):
+                dirnames.sort()
+                rel = os.path.relpath(root,game.backup_dir)
+                if rel == os.curdir:
+                    rparts = [game.savegame_name]
+                else:
+                    rparts = [game.savegame_name] + rel.split(os.sep)
+                dirs.append(self._remote_path(*rparts))
+                for fn in sorted(filenames):
+                    if fn.endswith(".part"):
+                        continue
+                    files.append((os.path.join(root,fn),self._remote_path(*(rparts + [fn]))))
+        return (dirs,files)
+
+    def synchronize(self,full=False):
+        """! @brief Upload the backups of all games to the FTP server.
+            Each remote directory is listed once and only files that are missing
+            or changed are uploaded (see _is_uploaded()). The missing remote
+            directories are created over a single session, then the files are
+            uploaded concurrently by `workers` sessions. The results are printed
+            in the order of the local files.
+            @arg full Upload all files without comparing them with the remote
+            directory listings.
+            @return True if all files were uploaded.
+            @exception FtpConnectionError if no session can be opened.
+        """
+        dirs,files = self._list_sync_files()
+        pool = FtpConnectionPool(self,min(self.workers,max(1,len(files))))
+        uploaded = 0
+        skipped = 0
+        failed = 0
+        total_size = 0
+        start = time.monotonic()
+        try:
+            with pool.connection() as ftp:
+                known = set()
+                listings = {}
+                if not full:
+                    for rdir in dirs:
+                        listings[rdir] = self._list_remote_dir(ftp,rdir)
+                        if listings[rdir]:
+                            known.add(rdir)
+
+                if self.backup_dir not in ("","."):
+                    self._make_remote_dirs(ftp,self.backup_dir,known)
+                for rdir in dirs:
+                    self._make_remote_dirs(ftp,rdir,known)
+
+                uploads = []
+                for lfn,rfn in files:
+                    rdir,name = rfn.rpartition("/")[::2]
+                    listing = listings.get(rdir)
+                    if listing and self._is_uploaded(ftp,lfn,rfn,listing.get(name)):
+                        skipped += 1
+                        if self.application.config.verbose:
+                            print("[FTP skip] {}".format(lfn))
+                    elif listing is not None:
+                        uploads.append((lfn,rfn,listing.get(name)))
+                    else:
+                        uploads.append((lfn,rfn,None))
 
-            try:
-                self.__ftp.cwd(game.savegame_name)
-            except:
+            def upload(item):
                 try:
-                    self.__ftp.mkd(game.savegame_name)
-                    self.__ftp.cwd(game.savegame_name)
+                    self._upload_file(pool,*item,resume=not full)
                 except Exception as err:
-                    self.cwd(ftp_wd)
-                    if self.close_connection:
-                        self.close()
-                    raise err
-                
-            try:
-                bd_list = os.listdir(bd)
-            except:
-                self.__ftp.cwd(ftp_bd)
-                continue
-
-            
-            for lfn,rfn in ((os.path.join(bd,i),i) for i in bd_list):
-                if os.path.isdir(os.path.join()):
-                    synchronize_subdir(bd,rfn,rfn)                    
-                else:
-                    print("FTP put: {} ".format(rfn),end="... ")
-                    with open(lfn,'rb') as ifile:
+                    return err
+                return None
+
+            with ThreadPoolExecutor(max_workers=pool.size) as executor:
+                for (lfn,rfn,entry),error in zip(uploads,executor.map(upload,uploads)):
+                    print("[FTP put] {} ...".format(lfn),end=" ")
+                    if error is None:
+                        uploaded += 1
                         try:
-                            self.__ftp.storbinary("STOR {}".format(rfn),ifile)
-                            print("OK")
-                        except Exception as err:
-                            print("FAILED")
-                            self.cwd(ftp_wd)
-
-            self.__ftp.cwd(ftp_bd)
-        self.__ftp.cwd(ftp_wd)
-        if close_connection:
-            self.close()
+                            total_size += os.path.getsize(lfn)
+                        except OSError:
+                            pass
+                        print("OK")
+                    else:
+                        failed += 1
+                        print("FAILED")
+                        if self.application.config.verbose:
+                            print("Uploading file {file} failed! ({message})".format(file=lfn,message=error),file=sys.stderr)
+        finally:
+            pool.close()
+
+        elapsed = time.monotonic() - start
+        print("{uploaded} files uploaded, {skipped} up to date, {failed} failed, {size:.1f} MB in {time:.2f}s ({rate:.1f} MB/s)".format(
+            uploaded=uploaded,
+            skipped=skipped,
+            failed=failed,
+            size=total_size / 1000000,
+            time=elapsed,
+            rate=((total_size / 1000000) / elapsed) if elapsed > 0 else 0.0))
+        return (failed == 0)
 
     def destroy(self):
         self.emit('destroy')
 
     def do_destroy(self):
-        archivers = self.application.archviers
+        timeout = self.application.config.get_integer('ftp','queueTimeout')
+        if timeout < 0:
+            timeout = None
+        self.upload_queue.drain(timeout)
+
+        archivers = self.application.archivers
         if hasattr(archivers,self.__archivermanager_backup_slot):
             archivers.disconnect(getattr(archivers,self.__archivermanager_backup_slot))
             delattr(archivers,self.__archivermanager_backup_slot)
@@ -389,240 +813,181 @@ class FtpClient(GObject.GObject):
 
         self.__app = None
 
-    def _rcd_to_game_dir(self,gamedir):
-        wd = self.__ftp.pwd()
-
-        if gamedir.startswith('/'):
-            isabs = True
-        else:
-            isabs = False
-
-        if isabs:
-            self.__ftp.cwd("/")
-            pv = os.path.split(gamedir[1:])
-        else:
-            pv = os.path.split(gamedir)
-
-        for i in pv:
+    def _list_remote_files(self,ftp,remote_dir,local_dir):
+        """! @brief List the files of a remote directory tree.
+            @return A list of (remote_file,local_file,entry) tuples.
+        """
+        listing = self._list_remote_dir(ftp,remote_dir)
+        if not listing:
+            return []
+        files = []
+        for name in sorted(listing.keys()):
+            entry = listing[name]
+            if entry[0] == 'dir':
+                files += self._list_remote_files(ftp,"/".join((remote_dir,name)),os.path.join(local_dir,name))
+            elif entry[0] == 'file' and not name.endswith(".part"):
+                files.append(("/".join((remote_dir,name)),os.path.join(local_dir,name),entry))
+        return files
+
+    def _is_downloaded(self,local_file,entry):
+        if entry[1] is None:
+            return False
+        try:
+            return (os.path.getsize(local_file) == entry[1])
+        except OSError:
+            return False
+
+    def fetch_all(self,games=None):
+        """! @brief Download the backups of games from the FTP server.
+            The remote game directories are listed over a single session, then
+            the files are downloaded concurrently by `workers` sessions. Files
+            that exist locally with the remote size are skipped. The results are
+            printed in the order of the remote listings.
+
+            Downloaded backups are verified with their checksum files if the
+            checksum plugin is enabled. Backups that fail the verification are
+            removed, the others are added to the backup catalog.
+            @arg games The games to download the backups for. If None, the
+            backups of all games are downloaded.
+            @return True if all files were downloaded.
+        """
+        if games is None:
+            games = self.application.games.games
+
+        pool = FtpConnectionPool(self,self.workers)
+        downloaded = []
+        file_games = {}
+        skipped = 0
+        failed = 0
+        total_size = 0
+        start = time.monotonic()
+        try:
             try:
-                self.__ftp.cwd(i)
-            except:
-                try:
-                    self.__ftp.mkd(i)
-                    self.__ftp.cwd(i)
-                except Exception as err:
-                    self.__ftp.cwd(wd)
-                    raise err
-        return wd
+                downloads = []
+                with pool.connection() as ftp:
+                    for game in games:
+                        for rfn,lfn,entry in self._list_remote_files(ftp,self._remote_path(game.savegame_name),game.backup_dir):
+                            if self._is_downloaded(lfn,entry):
+                                skipped += 1
+                                if self.application.config.verbose:
+                                    print("[FTP skip] {}".format(lfn))
+                            else:
+                                downloads.append((rfn,lfn,entry))
+                                file_games[lfn] = game
+            except FtpConnectionError as err:
+                print(err,file=sys.stderr)
+                return False
 
-    def fetch_all_game(self,game):
-        def fetch_dir(game,ftp_game_dir,subdir=None):
-            def list_cb(entries,line):
-                entry = line.split(None,9)
-                if len(entry) == 9:
-                    entries.append(entry)
-
-            if subdir:
-                ftp_wd = self.__ftp.pwd()
+            def download(item):
                 try:
-                    self.__ftp.cwd(os.path.join(ftp_game_dir,subdir))
-                except:
-                    self.__ftp.cwd(os.path.join(ftp_wd))
-                    return
-
-                game_dir = os.path.join(game.backup_dir,subdir)
-            else:
-                ftp_wd = None
-                game_dir = game.backup_dir
-
-
-            if not os.path.exists(game_dir):
-                os.makedirs(game_dir)
-
-            dir_entries = []
-            self.__ftp.retrlines("LIST",lambda x: list_cb(dir_entries,x))
-
-            for i in dir_entries:
-                if i[0].startswith('d'):
-                    if subdir:
-                        fetch_dir(game,ftp_game_dir,'/'.join((subdir,i[8])))
+                    self._download_file(pool,*item)
+                except Exception as err:
+                    return err
+                return None
+
+            with ThreadPoolExecutor(max_workers=max(1,min(pool.size,len(downloads)))) as executor:
+                for (rfn,lfn,entry),error in zip(downloads,executor.map(download,downloads)):
+                    print("[FTP get] {} ...".format(lfn),end=" ")
+                    if error is None:
+                        downloaded.append(lfn)
+                        try:
+                            total_size += os.path.getsize(lfn)
+                        except OSError:
+                            pass
+                        print("OK")
                     else:
-                        fetch_dir(game,ftp_game_dir,i[8])
-
-                else:
-                    #TODO
-                    print("fetch file {}".format(i[8]))
-
-            if ftp_wd is not None:
-                self.__ftp.cwd(ftp_wd)
-                    
-
-        close_connection = False
-        if not self.__ftp:
-            if not self.ftp_connect():
-                print("Unable tp connect to host \"{host}\"!".format(host=self.host),file=sys.stderr)
-                return False
-            close_connection = True
-
-        gamedir = "/".join((self.backup_dir,game.savegame_name))
-        rwd = self.__ftp.pwd()
-
-        try:
-            self._rcd_to_game_dir(gamedir)
-        except:
-            try:
-                self.__ftp.cwd(rwd)
-            except:
-                pass
-            if self.close_connection:
-                self.close()
-            return
-        
-        fetch_dir(game,gamedir,None)
-
-        try:
-            self.__ftp.cwd(rwd)
-        except:
-            pass
-
-        if close_connection:
-            self.close()
-
+                        failed += 1
+                        print("FAILED")
+                        if self.application.config.verbose:
+                            print("Downloading file {file} failed! ({message})".format(file=rfn,message=error),file=sys.stderr)
+
+                # The checksum files may be downloaded after their backups, so
+                # the backups are verified when all downloads are finished.
+                # Rejected backups are deleted and no longer count as downloaded.
+                verified = []
+                for lfn,ok in zip(downloaded,executor.map(self._verify_download,downloaded)):
+                    if ok:
+                        verified.append(lfn)
+                        continue
+                    failed += 1
+                    print("[FTP verify] {} ... FAILED".format(lfn))
+                    try:
+                        total_size -= os.path.getsize(lfn)
+                    except OSError:
+                        pass
+                    os.unlink(lfn)
+                downloaded = verified
+
+            self._add_to_catalog([(lfn,file_games[lfn]) for lfn in downloaded])
+        finally:
+            pool.close()
+
+        elapsed = time.monotonic() - start
+        print("{downloaded} files downloaded, {skipped} up to date, {failed} failed, {size:.1f} MB in {time:.2f}s ({rate:.1f} MB/s)".format(
+            downloaded=len(downloaded),
+            skipped=skipped,
+            failed=failed,
+            size=total_size / 1000000,
+            time=elapsed,
+            rate=((total_size / 1000000) / elapsed) if elapsed > 0 else 0.0))
+        return (failed == 0)
+
+    def _add_to_catalog(self,files):
+        """! @brief Add downloaded backups to the backup catalog.
+            Files which are not backup archives (like checksum files) are ignored.
+            @arg files A list of (local_file,game) tuples.
+        """
+        archivers = self.application.archivers
+        with archivers.catalog.batch():
+            for lfn,game in files:
+                archiver = archivers.get_archiver_for_file(lfn)
+                if archiver is None or not archiver.file_is_archive(lfn):
+                    continue
+                if self.application.config.platform_win32:
+                    lfn = lfn.replace('/','\\')
+                archivers.catalog.add(game,lfn,archiver)
 
-    def fetch_all(self):
-        for game in self.application.games.games:
-            self.fetch_all_game(game)
+    def fetch_all_game(self,game):
+        """! @brief Download all backups of a game from the FTP server.
+            See fetch_all().
+            @arg game The game to download the backups for.
+            @return True if all files were downloaded.
+        """
+        return self.fetch_all([game])
+
+    def _remote_backup_path(self,game,file):
+        """! @brief Get the remote path of a file in the backup directory of a game."""
+        rel = os.path.relpath(file,game.backup_dir)
+        if rel.startswith(os.pardir):
+            return self._remote_path(game.savegame_name,os.path.basename(file))
+        return self._remote_path(game.savegame_name,*rel.split(os.sep))
+
+    def _upload_backup(self,pool,local_file,remote_file):
+        """! @brief Upload a file and create its remote directory.
+            Used by the UploadQueue.
+        """
+        with pool.connection() as ftp:
+            self._make_remote_dirs(ftp,remote_file.rpartition("/")[0])
+        self._upload_file(pool,local_file,remote_file)
 
     def __on_backup(self,archivermanager,archiver,game,file):
-        close_connection = False
-        if not self.__ftp:
-            if not self.ftp_connect():
-                print("Unable to connect to host \"{host}\"!".format(host=self.host),files=sys.stderr)
-                return
-            close_connection = True
-        
-        gamedir = "/".join((self.backup_dir,game.savegame_name))
-        rwd = self.__ftp.pwd()
-        try:
-            wd = self._rcd_to_game_dir(gamedir)
-        except Exception as err:
-            try:
-                self.__ftp.cwd(rwd)
-            except:
-                pass
-
-            print("Unable to create and rcd to Game directory! ({message})".format(message=err),file=sys.stderr)
-            if close_connection:
-                self.close()
-            return
-        
         if self.application.config.verbose:
-            print("[FTP:put] {file}".format(file=file))
-
-        subdirs = None
-        if self.application.config.platform_win32:
-            dirlist=[]
-            for i in file.split("/"):
-                for j in i.split("\\"):
-                    if j:
-                        dirlist.append(j)
-        else:
-            dirlist=file.split("/")
-
-        for i in range(len(dirlist)):
-            if dirlist[i] == game.savegame_name:
-                if len(dirlist) > i + 2:
-                    subdirs = dirlist[i+1:-1]
-                break
-        
-        try:
-            if subdirs is not None:
-                self.create_subdirs(subdirs)
-
-            with open(file,"rb") as ifile:
-                if subdirs is not None:
-                    self.__ftp.storbinary("STOR {}".format('/'.join(subdirs + [os.path.basename(file)])),ifile)
-                else:
-                    self.__ftp.storbinary("STOR {}".format(os.path.basename(file)),ifile)
-        except Exception as err:
-            print("Uploading file {file} failed! ({message})".format(file=os.path.basename(file),message=err),file=sys.stderr)
-        try:
-            self.__ftp.cwd(wd)
-        except:
-            pass
-
-        self.__ftp.cwd(rwd)
-        if close_connection:
-            self.close()
-
+            print("[FTP:queue] {file}".format(file=file))
+        self.upload_queue.put(file,self._remote_backup_path(game,file))
 
     def __on_backup_file(self,archivermanager,game,file):
-        close_connection = False
-        if self.__ftp is None:
-            if not self.ftp_connect():
-                print("Unable to connect to host \"{host}\"!".format(host=self.host))
-                return
-            close_connection  = True 
-        gamedir = "/".join((self.backup_dir,game.savegame_name))
-        rwd = self.__ftp.pwd()
-
-        try:
-            wd = self._rcd_to_game_dir(gamedir)
-        except Exception as err:
-            print("Unable to create and rcd to Game directory! ({message})".format(message=err),file=sys.stderr)
-            try:
-                self.__ftp.cwd(rwd)
-            except:
-                pass
-
-            if close_connection:
-                self.close()
-            return
-
-        subdirs = None
-        if self.application.config.platform_win32:
-            dirlist=[]
-            for i in file.split("/"):
-                for j in i.split("\\"):
-                    if j:
-                        dirlist.append(j)
-        else:
-            dirlist=file.split("/")
-
-        for i in range(len(dirlist)):
-            if dirlist[i] == game.savegame_name:
-                if len(dirlist) > i + 2:
-                    subdirs = dirlist[i+1:-1]
-                break
-
-        try:
-            if subdirs is not None:
-                self.create_subdirs(subdirs)
-
-            with open(file,"rb") as ifile:
-                if self.application.config.verbose:
-                    print("[FTP:put] {file}".format(file=file))
-                if subdirs is not None:
-                    self.__ftp.storbinary("STOR {}".format("/".join(subdirs + [os.path.basename(file)])),ifile)
-                else:
-                    self.__ftp.storbinary("STOR {}".format(os.path.basename(file)),ifile)
-        except Exception as err:
-            print("Uploading file {file} failed! ({message})".format(file=os.path.basename(file),message=err),file=sys.stderr)
-        try:
-            self.__ftp.cwd(rwd)
-        except:
-            pass
-        if close_connection:
-            self.close()
+        if self.application.config.verbose:
+            print("[FTP:queue] {file}".format(file=file))
+        self.upload_queue.put(file,self._remote_backup_path(game,file))
 
-class FtpManager(object):
+class FtpManager(GObject.GObject):
     __name__ = "sgbackup-plugin-ftp-FtpManager"
     __gsignals__ = {
         'destroy': (GObject.SIGNAL_RUN_LAST,None,())
     }
 
     def __init__(self,app):
-        object.__init__(self)
+        GObject.GObject.__init__(self)
         self.__app = app
         self.__clients={}
 
@@ -639,7 +1004,6 @@ class FtpManager(object):
             if self.__clients[ftpclient.id] == ftpclient:
                 return
             self.remove(ftpclient.id)
-            del self.__clients[ftpclient.id]
 
         self.__clients[ftpclient.id] = ftpclient
 
@@ -667,10 +1031,15 @@ class FtpManager(object):
 
                 ftpclient = FtpClient.new_from_config(self.application,ftpid,i)
                 self.add(ftpclient)
-                
+                ftpclient.upload_queue.start()
+
+    def disable(self):
+        for ftpid in list(self.__clients.keys()):
+            self.remove(ftpid)
+
+    def destroy(self):
+        self.emit('destroy')
                 
     def do_destroy(self):
-        for cli in self.__clients:
-            cli.destroy()
-        self.__clients = {}
+        self.disable()
         self.__app = None
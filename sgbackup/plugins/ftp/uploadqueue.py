@@ -0,0 +1,171 @@
+# -*- coding:utf-8 -*-
+# author: Christian Moser
+# file: sgbackup/plugins/ftp/uploadqueue.py
+# module: sgbackup.plugins.ftp.uploadqueue
+# license: GPL
+
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+class UploadQueue(object):
+    """! @brief A persistent background upload queue of a FtpClient.
+        Queued files are uploaded one after another by a worker thread. The
+        queue is written to the user data directory, so uploads that were not
+        finished because of a crash or a timeout are retried by start() on the
+        next run. Uploads that failed are retried on the next run too.
+        @arg client The FtpClient to upload the files with.
+    """
+    def __init__(self,client):
+        self.__client = client
+        self.__cond = threading.Condition()
+        self.__pending = []
+        self.__queue = collections.deque()
+        self.__thread = None
+        self.__loaded = False
+        self.__stop = False
+
+    @property
+    def filename(self):
+        return os.path.join(self.__client.application.config.user_data_dir,
+                            "ftp-upload-queue.{}.json".format(self.__client.id))
+
+    @property
+    def pending(self):
+        """! @brief The number of files that were not uploaded yet."""
+        with self.__cond:
+            return len(self.__pending)
+
+    def __load(self):
+        if self.__loaded:
+            return
+        self.__loaded = True
+        if not os.path.isfile(self.filename):
+            return
+        try:
+            with open(self.filename,'r',encoding='utf-8') as ifile:
+                entries = json.load(ifile)
+        except (OSError,ValueError) as err:
+            print("Unable to read FTP upload queue \"{file}\"! ({message})".format(file=self.filename,message=err),
+                  file=sys.stderr)
+            return
+        for entry in entries:
+            try:
+                entry = (entry['local'],entry['remote'])
+            except (KeyError,TypeError):
+                continue
+            if entry not in self.__pending:
+                self.__pending.append(entry)
+                self.__queue.append(entry)
+
+    def __save(self):
+        filename = self.filename
+        try:
+            if not self.__pending:
+                if os.path.isfile(filename):
+                    os.unlink(filename)
+                return
+            os.makedirs(os.path.dirname(filename),exist_ok=True)
+            tmp_file = filename + ".tmp"
+            with open(tmp_file,'w',encoding='utf-8') as ofile:
+                json.dump([{'local':local,'remote':remote} for local,remote in self.__pending],ofile,indent=1)
+            os.replace(tmp_file,filename)
+        except OSError as err:
+            print("Unable to write FTP upload queue \"{file}\"! ({message})".format(file=filename,message=err),
+                  file=sys.stderr)
+
+    def __start_thread(self):
+        if self.__thread is None and self.__queue:
+            self.__stop = False
+            self.__thread = threading.Thread(target=self.__run,daemon=True)
+            self.__thread.start()
+
+    def start(self):
+        """! @brief Load the uploads left over from the last run and start uploading them."""
+        with self.__cond:
+            self.__load()
+            self.__start_thread()
+
+    def put(self,local_file,remote_file):
+        """! @brief Queue a file for uploading.
+            @arg local_file The local file.
+            @arg remote_file The remote file.
+        """
+        entry = (local_file,remote_file)
+        with self.__cond:
+            self.__load()
+            if entry not in self.__pending:
+                self.__pending.append(entry)
+                self.__save()
+            if entry not in self.__queue:
+                self.__queue.append(entry)
+            self.__start_thread()
+
+    def __run(self):
+        from .ftp import FtpConnectionPool
+
+        client = self.__client
+        verbose = client.application.config.verbose
+        pool = FtpConnectionPool(client,1)
+        try:
+            while True:
+                with self.__cond:
+                    if self.__stop or not self.__queue:
+                        self.__thread = None
+                        self.__cond.notify_all()
+                        return
+                    local_file,remote_file = self.__queue.popleft()
+
+                done = True
+                if not os.path.isfile(local_file):
+                    if verbose:
+                        print("[FTP put] {} does not exist anymore, skipping.".format(local_file))
+                else:
+                    try:
+                        client._upload_backup(pool,local_file,remote_file)
+                        if verbose:
+                            print("[FTP put] {} ... OK".format(local_file))
+                    except Exception as err:
+                        done = False
+                        print("Uploading file {file} failed! ({message})".format(file=local_file,message=err),
+                              file=sys.stderr)
+
+                with self.__cond:
+                    if done and (local_file,remote_file) in self.__pending:
+                        self.__pending.remove((local_file,remote_file))
+                        self.__save()
+                    self.__cond.notify_all()
+        finally:
+            pool.close()
+
+    def drain(self,timeout=None):
+        """! @brief Wait until all queued files are processed.
+            If the timeout expires, the worker thread stops after the current
+            upload and the remaining files are uploaded on the next run.
+            @arg timeout The maximum number of seconds to wait or None to wait
+            until the queue is empty.
+            @return True if the queue was drained.
+        """
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        with self.__cond:
+            while self.__thread is not None:
+                if timeout is None:
+                    self.__cond.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.__stop = True
+                    break
+                self.__cond.wait(remaining)
+            drained = (self.__thread is None)
+            n_pending = len(self.__pending)
+            self.__queue.clear()
+
+        if not drained:
+            print("[FTP] {n} uploads are still pending. They are retried on the next run.".format(n=n_pending),
+                  file=sys.stderr)
+        return drained
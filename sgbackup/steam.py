@@ -7,56 +7,36 @@
 import os
 import sys
 import glob
+from concurrent.futures import ThreadPoolExecutor
 
 from gi.repository import GObject
+from .acfcache import AcfCache
+from . import vdf
+from .config import settings
 
 def steam_parse_acf(filename):
+    """
+    Parse a Steam appmanifest file.
+
+    The keys of the *AppState* section are returned as a `dict`. The key
+    *LibraryPath* is set to the Steam library the manifest belongs to.
+
+    :param filename: The *appmanifest_<appid>.acf* file.
+    :type filename: `str`
+    :returns: (`dict`) - The parsed manifest or `None` if *filename* is not an
+        appmanifest file.
+    :raises sgbackup.error.VdfError: If the manifest is malformed.
+    """
     if not os.path.isfile(filename) or not filename.endswith('.acf'):
         return None
-    
-    acf = {}
-    acf['LibraryPath'] = os.path.dirname(os.path.dirname(filename))
-
-    with open(filename,'r') as ifile:
-        line = ""
-        while not line:
-            line = str(ifile.readline()).strip()
-
-        if not line.startswith("\"AppState\""):
-            return None
-        if '{' not in line:
-            while '{' not in line:
-                line = ifile.readline().strip()
-                if line and not '{' in line:
-                    return None
-        
-        sections=[acf]
-
-        last_key = "AppState"
-
-        for line in (str(i).strip() for i in ifile.readlines()):
-            if not line:
-                continue
 
-            if line == "{":
-                sections[-1][last_key] = {}
-                sections.append(sections[-1][last_key])
-            elif line == "}":
-                del sections[-1]
-                if len(sections) == 0:
-                    break
-            else:
-                parse = line.split("\"")
-                if len(parse) == 3:
-                    last_key = parse[1]
-                    if '{' in line:
-                        sections[-1][last_key] = {}
-                        sections.append(sections[-1][last_key])
-                elif len(parse) == 5:
-                    key = parse[1]
-                    value = parse[3]
-                    sections[-1][key] = value
+    appstate = vdf.load_file(filename).get('AppState')
+    if not isinstance(appstate,dict):
+        return None
 
+    acf = {}
+    acf['LibraryPath'] = os.path.dirname(os.path.dirname(filename))
+    acf.update(appstate)
     return acf
 # steam_parse_acf()
 
@@ -68,7 +48,7 @@ class SteamAppidIgnore(GObject.GObject):
     def __init__(self,app):
         GObject.GObject.__init__(self)
         self.__app = None
-        self.__appids=[]
+        self.__appids={}
 
     def _real_initialize(self,app):
         self.__app = app
@@ -99,25 +79,22 @@ class SteamAppidIgnore(GObject.GObject):
     
     @GObject.Property
     def appids(self):
-        return self.__appids
+        """
+        A read-only, set-like view of the ignored appids.
+        """
+        return self.__appids.keys()
 
     def save(self):
         with open(self.ignore_file,'w') as ofile:
-            for i in self.appids:
+            for i in sorted(self.appids):
                 ofile.write("{}\n".format(i))
 
     def add(self,appid:int):
-        if not appid in self.__appids:
-            self.__appids.append(appid)
-        self.__appids.sort()
-
+        self.__appids[appid] = None
 
     def remove(self,appid:int):
         if appid in self.__appids:
-            for i in range(len(self.__appids)):
-                if self.__appids[i] == appid:
-                    del self.__appids[i]
-                    return
+            del self.__appids[appid]
 
     def destroy(self):
         self.emit('destroy')
@@ -160,35 +137,58 @@ class SteamLib(GObject.GObject):
     def path(self):
         return self.__path
 
-    @GObject.Property
-    def apps(self):
+    def scan_apps(self,executor=None):
+        """
+        Read the installed apps of the library. Unchanged appmanifest files are
+        served from the :class:`sgbackup.acfcache.AcfCache` of the
+        application, the cache is not saved.
+
+        :param executor: If given, changed appmanifest files are parsed in
+            this :class:`concurrent.futures.Executor`.
+        :returns: (`dict`) - A mapping of the appids to the parsed appmanifest
+            files.
+        """
+        acf_cache = None
+        if self.application is not None:
+            acf_cache = self.application.steam.acf_cache
+
+        steamapps_dir = os.path.join(self.path,"steamapps")
+        if acf_cache is not None:
+            manifests = acf_cache.read_dir(steamapps_dir,steam_parse_acf,executor)
+        else:
+            manifests = dict((fn,steam_parse_acf(fn)) for fn in
+                             glob.glob(os.path.join(steamapps_dir,"appmanifest_*.acf")))
+
         apps={}
-        for fn in glob.glob(os.path.join(self.path,"steamapps","appmanifest_*.acf")):
+        for fn,acf in manifests.items():
             basename = os.path.basename(fn)
             appid=int(basename[len('appmanifest_'):-4])
-            acf = steam_parse_acf(fn)
-            if 'appid' in acf and 'name' in acf and 'installdir' in acf:
+            if acf and 'appid' in acf and 'name' in acf and 'installdir' in acf:
                 apps[appid] = acf
         return apps
 
     @GObject.Property
-    def registered_apps(self):
-        apps = {}
-        for appid,acf in self.apps.items():
-            if appid in self.application.games.steam_ids:
-                apps[appid] = acf
-            
+    def apps(self):
+        """
+        The installed apps of the library as a `dict` mapping the appids to
+        the parsed appmanifest files.
+        """
+        apps = self.scan_apps()
+        if self.application is not None and self.application.steam.acf_cache is not None:
+            self.application.steam.acf_cache.save()
         return apps
 
     @GObject.Property
-    def unregistered_apps(self):
-        apps = self.apps
-        unregistered = {}
-        for appid,acf in apps.items():
-            if appid not in self.application.games.steam_ids and appid not in self.application.steam.ignore_appids:
-                unregistered[appid] = acf
+    def registered_apps(self):
+        steam_ids = self.application.games.steam_ids
+        return dict((appid,acf) for appid,acf in self.apps.items() if appid in steam_ids)
 
-        return unregistered
+    @GObject.Property
+    def unregistered_apps(self):
+        steam_ids = self.application.games.steam_ids
+        ignore_appids = self.application.steam.ignore_appids
+        return dict((appid,acf) for appid,acf in self.apps.items()
+                    if appid not in steam_ids and appid not in ignore_appids)
     
     @GObject.Property
     def appids(self):
@@ -214,15 +214,21 @@ class Steam(GObject.GObject):
         self.__app = None
         self.__libraries=[]
         self.__appid_ignore = SteamAppidIgnore(self.application)
+        self.__acf_cache = None
+        self.__discovered = set()
+        self.__libraryfolders_stat = None
 
     def _real_initialize(self,app):
         self.__app = app
+        self.__acf_cache = AcfCache(os.path.join(app.config.user_data_dir,'steam-acf-cache.json'))
 
         self.__appid_ignore._real_initialize(app)
 
         if self.application.config.has_option('steam','libraries'):
             for libpath in self.application.config.get_string_list('steam','libraries'):
                 self.add_library(libpath)
+        if self.application.config.get_boolean('steam','discoverLibraries',True):
+            self.discover_libraries()
         self.__save_slot = self.application.config.connect('save',self._on_save)
             
     @GObject.Property
@@ -237,22 +243,144 @@ class Steam(GObject.GObject):
     def appid_ignore(self):
         return self.__appid_ignore
     
+    @GObject.Property
+    def steam_root(self):
+        """
+        The Steam installation the libraries are discovered from. This is the
+        option *steam.steamRoot* or the default Steam installation of the
+        platform if the option is not set.
+        (`str` or `None`)
+        """
+        root = self.application.config.get_string('steam','steamRoot','')
+        if root:
+            return root
+        return settings.get_default_steam_root()
+
+    @GObject.Property
+    def acf_cache(self):
+        """
+        The appmanifest cache shared by the Steam libraries.
+        (:class:`sgbackup.acfcache.AcfCache`)
+        """
+        return self.__acf_cache
+
     @GObject.Property
     def ignore_appids(self):
         return self.__appid_ignore.appids
     
+    def scan_apps(self):
+        """
+        Read the installed apps of all libraries concurrently. Every library
+        is scanned in its own thread and changed appmanifest files are parsed
+        in a shared thread pool of *sgbackup.processMax* threads.
+
+        If an app is installed in more than one library, the library that
+        comes first in :attr:`Steam.libraries` wins.
+
+        :returns: (`dict`) - A mapping of the appids, sorted by appid, to
+            dicts with the keys *acf* (the parsed appmanifest file) and
+            *library* (the :class:`SteamLib`).
+        """
+        libraries = list(self.libraries)
+        if not libraries:
+            return {}
+
+        if len(libraries) == 1:
+            results = [libraries[0].scan_apps()]
+        else:
+            parse_workers = max(self.application.config.process_max,1)
+            with ThreadPoolExecutor(max_workers=parse_workers) as parse_executor:
+                with ThreadPoolExecutor(max_workers=len(libraries)) as lib_executor:
+                    results = list(lib_executor.map(lambda lib: lib.scan_apps(parse_executor),libraries))
+        self.acf_cache.save()
+
+        apps = {}
+        for lib,lib_apps in zip(libraries,results):
+            for appid,acf in lib_apps.items():
+                if appid not in apps:
+                    apps[appid] = {'acf':acf,'library':lib}
+        return dict(sorted(apps.items()))
+
     @GObject.Property
     def apps(self):
+        steam_index = self.application.games.steam_index
         steamapps={}
-        for l in self.libraries:
-            for k,v in l.apps.items():
-                value={'lib':l,'acf':v,'game':None}
-                if k in self.application.games.steam_items:
-                    value['game']=self.application.games.steam_items[k]
-                steamapps[k]=value
+        for k,spec in self.scan_apps().items():
+            value={'lib':spec['library'],'acf':spec['acf'],'game':None}
+            if k in steam_index:
+                try:
+                    value['game']=self.application.games.get(steam_index[k])
+                except LookupError as err:
+                    print(err,file=sys.stderr)
+            steamapps[k]=value
 
         return steamapps
     
+    def __parse_libraryfolders(self,filename):
+        data = vdf.load_file(filename)
+        folders = None
+        for key,value in data.items():
+            if key.lower() == 'libraryfolders' and isinstance(value,dict):
+                folders = value
+                break
+        if folders is None:
+            return None
+
+        paths = []
+        for key,value in folders.items():
+            if not key.isdigit():
+                continue
+            if isinstance(value,dict):
+                value = value.get('path')
+            if value:
+                paths.append(value)
+        return paths
+
+    def discover_libraries(self):
+        """
+        Add the Steam libraries listed in *steamapps/libraryfolders.vdf* of
+        :attr:`Steam.steam_root`. Discovered libraries are not written to the
+        *steam.libraries* option and are removed again when they are no longer
+        listed. The file is only read again if it changed.
+
+        :returns: (`list`) - The paths of the discovered libraries.
+        """
+        root = self.steam_root
+        if not root:
+            return []
+
+        filename = os.path.join(root,'steamapps','libraryfolders.vdf')
+        try:
+            st = os.stat(filename)
+            file_stat = (filename,st.st_mtime_ns,st.st_size)
+        except OSError:
+            file_stat = None
+        if file_stat is not None and file_stat == self.__libraryfolders_stat:
+            return sorted(self.__discovered)
+        self.__libraryfolders_stat = file_stat
+
+        paths = [root]
+        if file_stat is not None:
+            paths += self.acf_cache.read_file(filename,self.__parse_libraryfolders) or []
+            self.acf_cache.save()
+
+        discovered = set()
+        for path in paths:
+            sl = SteamLib(self.application,os.path.realpath(path))
+            if not sl.is_valid:
+                continue
+            known = [lib for lib in self.__libraries if os.path.realpath(lib.path) == sl.path]
+            if not known:
+                self.__libraries.append(sl)
+                self.__discovered.add(sl.path)
+            if sl.path in self.__discovered:
+                discovered.add(sl.path)
+
+        for path in self.__discovered - discovered:
+            self.remove_library(path)
+        self.__discovered = discovered
+        return sorted(discovered)
+
     def add_library(self,lib):
         if isinstance(lib,str):
             sl = SteamLib(self.application,lib)
@@ -262,6 +390,7 @@ class Steam(GObject.GObject):
             raise TypeError("lib is not a \"SteamLib\"-instance or a valid library path!")
         
         if sl.is_valid:
+            self.__discovered.discard(sl.path)
             for path in (i.path for i in self.__libraries):
                 if path == sl.path:
                     return
@@ -284,37 +413,39 @@ class Steam(GObject.GObject):
 
 
     def update_games(self,update_name=False):
+        steam_index = self.application.games.steam_index
         games = {}
-        for lib in self.libraries:
-            for appid,acf in lib.registered_apps.items():
+        for appid,spec in self.scan_apps().items():
+            if appid in steam_index:
                 try:
-                    g = self.application.steam_games[appid]
-                    games[g.game_id] = {'appid':appid,'game':g,'acf':acf,'library':lib}
-                except:
-                    pass
+                    g = self.application.games.get(steam_index[appid])
+                except LookupError as err:
+                    print(err,file=sys.stderr)
+                    continue
+                games[g.game_id] = {'appid':appid,'game':g,'acf':spec['acf'],'library':spec['library']}
         
         for gid,spec in games.items():
             game = spec['game']
             acf = spec['acf']
             appid = spec['appid']
-            library = spec['lib']
+            library = spec['library']
 
-            if acf['appid'] != appid:
+            if str(acf['appid']) != str(appid):
                 print("WARNING: Steam appid of game \"{game}\" does not match!".format(game=acf['name']),file=sys.stderr)
 
             if update_name:
                 game.game_name = acf['name']
 
             game.installdir = os.path.join(library.path,'steamapps','common',acf['installdir'])
-            game.save()
+
+        self.application.games.save_games([spec['game'] for spec in games.values()])
 
     @GObject.Property
     def unregistered_apps(self):
-        apps = {}
-        for lib in self.libraries:
-            for appid,acf in lib.unregistered_apps.items():
-                apps[appid] = {'acf':acf,'library':lib}
-        return dict(sorted(apps.items()))
+        steam_ids = self.application.games.steam_ids
+        ignore_appids = self.ignore_appids
+        return dict((appid,spec) for appid,spec in self.scan_apps().items()
+                    if appid not in steam_ids and appid not in ignore_appids)
     
     def destroy(self):
         self.emit('destroy')
@@ -329,6 +460,6 @@ class Steam(GObject.GObject):
         self.__app = None
 
     def _on_save(self,config):
-        libs = [sl.path for sl in self.libraries]
+        libs = [sl.path for sl in self.libraries if sl.path not in self.__discovered]
         libs.sort()
         config.keyfile.set_string_list("steam","libraries",libs)
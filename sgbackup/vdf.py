@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# Author: Christian Moser
+# License: GPL
+# File: sgbackup/vdf.py
+# Module: sgbackup.vdf
+
+import re
+
+from .error import VdfError
+
+# One alternative per token type. finditer() skips whitespace between tokens,
+# stray characters are caught by the last alternative.
+_TOKEN_RE = re.compile(r'"([^"\\]*(?:\\.[^"\\]*)*)"'   # 1: quoted string
+                       r'|([{}])'                      # 2: brace
+                       r'|//[^\n]*'                    #    comment
+                       r'|\[[^\]\n]*\]'                #    conditional
+                       r'|([^\s"{}\[\]]+)'             # 3: unquoted string
+                       r'|(\S)',                       # 4: error
+                       re.DOTALL)
+
+_ESCAPE_RE = re.compile(r'\\(.)',re.DOTALL)
+_ESCAPES = {'n': '\n','t': '\t','\\': '\\','"': '"'}
+
+def _unescape(match):
+    c = match.group(1)
+    return _ESCAPES.get(c,'\\' + c)
+
+class _Fallback(Exception):
+    pass
+
+def _open_section(section,key,stack):
+    child = section.get(key)
+    if not isinstance(child,dict):
+        child = {}
+        section[key] = child
+    stack.append(section)
+    return child
+
+def _loads_split(text,escaped):
+    # Fast path for documents without comments, conditionals, unquoted strings
+    # and escaped quotes (which is what Steam writes): splitting the document at
+    # the quotes yields the whitespace/braces between the strings and the
+    # strings themselves in alternating order.
+    if escaped and '\\"' in text:
+        raise _Fallback()
+    unescape = escaped and '\\' in text
+    parts = text.split('"')
+    if not len(parts) & 1:
+        raise _Fallback()
+
+    root = {}
+    section = root
+    stack = []
+    key = None
+
+    values = parts[1::2]
+    values.append(None)
+    for between,value in zip(parts[0::2],values):
+        if between and not between.isspace():
+            for c in between:
+                if c == '{':
+                    if key is None:
+                        raise _Fallback()
+                    section = _open_section(section,key,stack)
+                    key = None
+                elif c == '}':
+                    if key is not None or not stack:
+                        raise _Fallback()
+                    section = stack.pop()
+                elif not c.isspace():
+                    raise _Fallback()
+
+        if value is None:
+            break
+        if unescape and '\\' in value:
+            value = _ESCAPE_RE.sub(_unescape,value)
+        if key is None:
+            key = value
+        else:
+            section[key] = value
+            key = None
+
+    if key is not None or stack:
+        raise _Fallback()
+    return root
+
+def _loads_tokens(text,escaped):
+    root = {}
+    section = root
+    stack = []
+    key = None
+
+    for match in _TOKEN_RE.finditer(text):
+        group = match.lastindex
+        if group is None:
+            continue
+
+        if group == 1 or group == 3:
+            value = match.group(group)
+            if group == 1 and escaped and '\\' in value:
+                value = _ESCAPE_RE.sub(_unescape,value)
+            if key is None:
+                key = value
+            else:
+                section[key] = value
+                key = None
+        elif group == 2:
+            if match.group(2) == '{':
+                if key is None:
+                    raise VdfError("Section without a key at offset {}!".format(match.start()))
+                section = _open_section(section,key,stack)
+                key = None
+            else:
+                if key is not None:
+                    raise VdfError("Key \"{key}\" without a value at offset {offset}!".format(
+                        key=key,offset=match.start()))
+                if not stack:
+                    raise VdfError("Unbalanced \"}}\" at offset {}!".format(match.start()))
+                section = stack.pop()
+        else:
+            raise VdfError("Unexpected character {char} at offset {offset}!".format(
+                char=repr(match.group(4)),offset=match.start()))
+
+    if key is not None:
+        raise VdfError("Key \"{}\" without a value at end of document!".format(key))
+    if stack:
+        raise VdfError("Unexpected end of document, {} sections are not closed!".format(len(stack)))
+    return root
+
+def loads(text:str,escaped:bool=True):
+    """
+    Parse a Valve KeyValues (VDF/ACF) document in a single pass.
+
+    Sections are returned as nested `dict` instances and values as `str`.
+    Comments and conditionals (like *[$WIN32]*) are ignored. If a key is
+    given twice, the sections are merged and for values the last one wins.
+
+    Documents as written by Steam are split at the quotes, everything else
+    is parsed by a regular expression based tokenizer.
+
+    :param text: The document to parse.
+    :type text: `str`
+    :param escaped: Resolve the escape sequences *\\\\n*, *\\\\t*, *\\\\\\\\*
+        and *\\\\"* in quoted strings.
+    :type escaped: `bool`
+    :returns: (`dict`) - The parsed document.
+    :raises sgbackup.error.VdfError: If the document is malformed.
+    """
+    try:
+        return _loads_split(text,escaped)
+    except _Fallback:
+        return _loads_tokens(text,escaped)
+
+def load(fileobj,escaped:bool=True):
+    """
+    Parse a Valve KeyValues (VDF/ACF) document from a text file object.
+
+    See :func:`loads`.
+    """
+    return loads(fileobj.read(),escaped)
+
+def load_file(filename:str,escaped:bool=True):
+    """
+    Parse a Valve KeyValues (VDF/ACF) file.
+
+    See :func:`loads`.
+
+    :param filename: The file to parse.
+    :type filename: `str`
+    """
+    with open(filename,'r',encoding='utf-8',errors='replace') as ifile:
+        return load(ifile,escaped)
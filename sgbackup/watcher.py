@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+# Author: Christian Moser
+# License: GPL
+# File: sgbackup/watcher.py
+# Module: sgbackup.watcher
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+# inotify(7) constants
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+
+_IN_WATCH_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+                  | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR)
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int,ctypes.c_char_p,ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int,ctypes.c_int]
+    except (OSError,AttributeError):
+        return None
+    return libc
+
+class PollingWatcher(object):
+    """
+    Watch directory trees by comparing the paths, sizes and modification times
+    of their files every *interval* seconds.
+
+    :param interval: The number of seconds between two scans.
+    :type interval: `float`
+    """
+    def __init__(self,interval=60.0):
+        self.__interval = interval
+        self.__paths = {}
+        self.__snapshots = {}
+        self.__next_scan = time.monotonic() + interval
+
+    @property
+    def keys(self):
+        """
+        The keys of the watched directories.
+
+        :type: `list`
+        """
+        return list(self.__paths.keys())
+
+    def __snapshot(self,path):
+        snapshot = {}
+        for dirpath,dirnames,filenames in os.walk(path):
+            for filename in filenames:
+                filename = os.path.join(dirpath,filename)
+                try:
+                    st = os.stat(filename)
+                except OSError:
+                    continue
+                snapshot[filename] = (st.st_size,st.st_mtime_ns)
+        return snapshot
+
+    def add(self,key,path):
+        """
+        Watch a directory tree. The directory does not need to exist.
+
+        :param key: The key reported for changes in this directory.
+        :param path: The directory to watch.
+        :type path: `str`
+        """
+        self.__paths[key] = path
+        self.__snapshots[key] = self.__snapshot(path)
+
+    def remove(self,key):
+        """
+        Stop watching the directory of *key*.
+        """
+        self.__paths.pop(key,None)
+        self.__snapshots.pop(key,None)
+
+    def read_changes(self,timeout=None):
+        """
+        Wait for changes.
+
+        :param timeout: The maximum number of seconds to wait or `None` to
+            wait until the next scan.
+        :type timeout: `float`
+        :returns: (`set`) - The keys of the changed directories.
+        """
+        now = time.monotonic()
+        wait = self.__next_scan - now
+        if timeout is not None and timeout < wait:
+            time.sleep(max(timeout,0))
+            return set()
+        if wait > 0:
+            time.sleep(wait)
+        self.__next_scan = time.monotonic() + self.__interval
+
+        changed = set()
+        for key,path in list(self.__paths.items()):
+            snapshot = self.__snapshot(path)
+            if snapshot != self.__snapshots.get(key):
+                self.__snapshots[key] = snapshot
+                changed.add(key)
+        return changed
+
+    def close(self):
+        """
+        Stop watching all directories.
+        """
+        self.__paths = {}
+        self.__snapshots = {}
+
+class InotifyWatcher(object):
+    """
+    Watch directory trees with the Linux inotify API.
+
+    Subdirectories are watched recursively. Directories that do not exist
+    (yet) are retried every *retry_interval* seconds and reported as changed
+    when they appear.
+
+    :param retry_interval: The number of seconds between two attempts to
+        watch missing directories.
+    :type retry_interval: `float`
+    :raises OSError: If inotify is not available.
+    """
+    def __init__(self,retry_interval=60.0):
+        self.__libc = _load_libc()
+        if self.__libc is None:
+            raise OSError(errno.ENOSYS,"inotify is not available on this platform")
+        self.__fd = self.__libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.__fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err,os.strerror(err))
+
+        self.__retry_interval = retry_interval
+        self.__next_retry = time.monotonic() + retry_interval
+        self.__paths = {}
+        self.__watches = {}
+        self.__roots = {}
+        self.__missing = set()
+
+    @staticmethod
+    def is_available():
+        """
+        Check if inotify can be used on this system.
+
+        :returns: (`bool`)
+        """
+        return _load_libc() is not None
+
+    @property
+    def keys(self):
+        """
+        The keys of the watched directories.
+
+        :type: `list`
+        """
+        return list(self.__paths.keys())
+
+    def __add_watch(self,key,path):
+        wd = self.__libc.inotify_add_watch(self.__fd,os.fsencode(path),_IN_WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err,os.strerror(err),path)
+        self.__watches[wd] = (key,path)
+        return wd
+
+    def __add_tree(self,key,path):
+        for dirpath,dirnames,filenames in os.walk(path):
+            try:
+                self.__add_watch(key,dirpath)
+            except OSError as err:
+                if err.errno == errno.ENOENT:
+                    continue
+                raise
+
+    def __watch_root(self,key):
+        path = self.__paths[key]
+        if not os.path.isdir(path):
+            self.__missing.add(key)
+            return False
+        try:
+            self.__roots[key] = self.__add_watch(key,path)
+            self.__add_tree(key,path)
+        except OSError as err:
+            print("Unable to watch \"{path}\"! ({message})".format(path=path,message=err.strerror),
+                  file=sys.stderr)
+            self.__remove_watches(key)
+            self.__missing.add(key)
+            return False
+        self.__missing.discard(key)
+        return True
+
+    def __remove_watches(self,key):
+        for wd in [wd for wd,(k,path) in self.__watches.items() if k == key]:
+            self.__libc.inotify_rm_watch(self.__fd,wd)
+            del self.__watches[wd]
+        self.__roots.pop(key,None)
+
+    def add(self,key,path):
+        """
+        Watch a directory tree. The directory does not need to exist.
+
+        :param key: The key reported for changes in this directory.
+        :param path: The directory to watch.
+        :type path: `str`
+        """
+        if key in self.__paths:
+            self.remove(key)
+        self.__paths[key] = path
+        self.__watch_root(key)
+
+    def remove(self,key):
+        """
+        Stop watching the directory of *key*.
+        """
+        self.__remove_watches(key)
+        self.__paths.pop(key,None)
+        self.__missing.discard(key)
+
+    def __retry_missing(self):
+        changed = set()
+        if self.__missing and time.monotonic() >= self.__next_retry:
+            for key in list(self.__missing):
+                if self.__watch_root(key):
+                    changed.add(key)
+            self.__next_retry = time.monotonic() + self.__retry_interval
+        return changed
+
+    def read_changes(self,timeout=None):
+        """
+        Wait for changes.
+
+        :param timeout: The maximum number of seconds to wait or `None` to
+            wait until something changes.
+        :type timeout: `float`
+        :returns: (`set`) - The keys of the changed directories.
+        """
+        changed = self.__retry_missing()
+        if changed:
+            return changed
+
+        if self.__missing:
+            retry = max(self.__next_retry - time.monotonic(),0)
+            if timeout is None or retry < timeout:
+                timeout = retry
+
+        try:
+            readable,_,_ = select.select([self.__fd],[],[],timeout)
+        except InterruptedError:
+            return changed
+        if not readable:
+            return self.__retry_missing()
+
+        try:
+            data = os.read(self.__fd,65536)
+        except BlockingIOError:
+            return changed
+
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd,mask,cookie,length = _EVENT_HEADER.unpack_from(data,offset)
+            name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += _EVENT_HEADER.size + length
+
+            if mask & _IN_Q_OVERFLOW:
+                changed.update(self.__paths.keys())
+                continue
+
+            if wd not in self.__watches:
+                continue
+            key,path = self.__watches[wd]
+            changed.add(key)
+
+            if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                try:
+                    self.__add_tree(key,os.path.join(path,os.fsdecode(name)))
+                except OSError as err:
+                    print("Unable to watch \"{path}\"! ({message})".format(
+                            path=os.path.join(path,os.fsdecode(name)),message=err.strerror),
+                          file=sys.stderr)
+            if mask & _IN_IGNORED:
+                del self.__watches[wd]
+                if self.__roots.get(key) == wd:
+                    # The watched directory itself was removed or moved away.
+                    self.__remove_watches(key)
+                    self.__missing.add(key)
+        return changed
+
+    def close(self):
+        """
+        Stop watching all directories and close the inotify instance.
+        """
+        if self.__fd >= 0:
+            os.close(self.__fd)
+            self.__fd = -1
+        self.__paths = {}
+        self.__watches = {}
+        self.__roots = {}
+        self.__missing = set()
+
+def create_watcher(poll_interval=60.0,polling=False):
+    """
+    Create a watcher for directory trees. An :class:`InotifyWatcher` is
+    returned if inotify is available, a :class:`PollingWatcher` otherwise.
+
+    :param poll_interval: The scan interval of the :class:`PollingWatcher` and
+        the retry interval for missing directories of the
+        :class:`InotifyWatcher` in seconds.
+    :type poll_interval: `float`
+    :param polling: Always create a :class:`PollingWatcher`.
+    :type polling: `bool`
+    """
+    if not polling and InotifyWatcher.is_available():
+        try:
+            return InotifyWatcher(poll_interval)
+        except OSError as err:
+            print("Unable to initialize inotify, falling back to polling! ({message})".format(
+                    message=err.strerror),
+                  file=sys.stderr)
+    return PollingWatcher(poll_interval)
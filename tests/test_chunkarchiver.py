@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author: Christian Moser
+# License: GPL
+# File: tests/test_chunkarchiver.py
+#
+# Tests of the chunkstore archiver. The archivers run against a stand-in
+# application, so no configuration, gameconf or backup files of the user are
+# touched.
+#
+# Usage: python -m unittest discover tests
+
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+import types
+import unittest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HAVE_GI = importlib.util.find_spec('gi') is not None
+
+if HAVE_GI:
+    from sgbackup.archiver._archivermanager import ArchiverManager
+    from sgbackup.game import Game
+
+class TestConfig(object):
+    def __init__(self,directory):
+        self.user_data_dir = os.path.join(directory,'data')
+        self.backup_dir = os.path.join(directory,'backups')
+        self.archiver_dir = os.path.join(directory,'archivers')
+        os.makedirs(self.archiver_dir)
+
+        self.verbose = False
+        self.skip_unchanged = False
+        self.fingerprint_content = False
+        self.process_max = 4
+        self.platform_win32 = False
+        self.is_win32 = False
+        self.backup_versions = 1
+        self.keep_hourly = 0
+        self.keep_daily = 0
+        self.keep_weekly = 0
+        self.keep_monthly = 0
+        self.variables_serial = 0
+
+    @property
+    def variables(self):
+        return {}
+
+    def connect(self,signal,callback):
+        return 0
+
+    def get_string(self,section,key,default=None):
+        if (section,key) == ('sgbackup','archiver'):
+            return 'chunkstore'
+        return default
+
+def new_game(app,directory,game_id):
+    game = Game(app,
+                game_id,
+                name=game_id,
+                savegame_name=game_id,
+                savegame_root=os.path.join(directory,'saves',game_id),
+                savegame_dir='SaveGames',
+                steam_appid=0)
+    os.makedirs(os.path.join(game.savegame_root,game.savegame_dir))
+    app.games.games.append(game)
+    return game
+
+def write_savegame(game,content:bytes):
+    with open(os.path.join(game.savegame_root,game.savegame_dir,'save.dat'),'wb') as ofile:
+        ofile.write(content)
+
+def new_application(directory):
+    app = types.SimpleNamespace(config=TestConfig(directory),
+                                games=types.SimpleNamespace(games=[]))
+    app.archivers = ArchiverManager()
+    app.archivers._real_initialize(app)
+    return app
+
+@unittest.skipUnless(HAVE_GI,"PyGObject is not installed")
+class ChunkArchiverTest(unittest.TestCase):
+    N_GAMES = 6
+    N_ROUNDS = 3
+    SAVEGAME_SIZE = 512 * 1024
+
+    def setUp(self):
+        self.__tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.__tmpdir.name
+        self.app = new_application(self.directory)
+
+    def tearDown(self):
+        self.app.archivers.destroy()
+        self.__tmpdir.cleanup()
+
+    def assert_chunks_exist(self,games):
+        archiver = self.app.archivers.standard_archiver
+        for game in games:
+            backups = self.app.archivers.catalog.get_backups(game)
+            self.assertEqual(len(backups),1)
+            manifest = archiver.read_manifest(backups[0])
+            for entry in manifest['entries']:
+                if entry['type'] != 'file':
+                    continue
+                for chunk_id in entry['chunks']:
+                    self.assertTrue(os.path.isfile(archiver.get_chunk_filename(chunk_id)),
+                                    "Chunk {chunk} of \"{backup}\" is missing!".format(
+                                        chunk=chunk_id,backup=backups[0]))
+
+    def test_concurrent_backups_with_rotation(self):
+        # Every round a game gets the SaveGames its neighbour had in the round
+        # before, so its backup reuses chunks which are only referenced by the
+        # backup the neighbour rotates away at the same time.
+        games = [new_game(self.app,self.directory,"game{}".format(i)) for i in range(self.N_GAMES)]
+        contents = [os.urandom(self.SAVEGAME_SIZE) for i in range(self.N_GAMES + self.N_ROUNDS)]
+
+        for n in range(self.N_ROUNDS):
+            if n:
+                # backup names have a resolution of one second
+                time.sleep(1.1)
+            for i,game in enumerate(games):
+                write_savegame(game,contents[i + n])
+
+            failed = self.app.archivers.backup_games(games,jobs=self.N_GAMES)
+            self.assertEqual(failed,[])
+            self.assert_chunks_exist(games)
+
+if __name__ == '__main__':
+    unittest.main()